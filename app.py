@@ -8,190 +8,45 @@ and Michael Aspinwall's philosophy on LLM-powered property management.
 "I read every word you wrote, I live the exact 2 a.m. chaos,
 I can ship fast, and I'm showing up with something concrete —
 the way you did in Sacramento."
+
+This file is the Streamlit UI; the pipeline it drives lives in core.py.
 """
 
 import streamlit as st
-import google.generativeai as genai
-import json
-import base64
 import time
-import random
-import os
 from io import BytesIO
-from PIL import Image
-from dotenv import load_dotenv
-
-# ---------------------------------------------------------------------------
-# Load environment variables
-# ---------------------------------------------------------------------------
-load_dotenv()
-
-# ---------------------------------------------------------------------------
-# THE SYSTEM PROMPT — The Secret Sauce
-# ---------------------------------------------------------------------------
-# This is the heart of MiniMason. It's a ~2500-word manifesto that defines
-# exactly how the AI should behave as a maintenance coordinator. Every word
-# is intentional.
-
-SYSTEM_PROMPT = """You are MiniMason — the suave and gentle AI maintenance coordinator for property managers at Mason.
-
-You turn messy, emotional, late-night tenant messages (and blurry photos) into calm, professional, immediately actionable work.
-
-=== NON-NEGOTIABLE RULES ===
-
-1. Unit of Work Principle (Michael's most important architectural primitive)
-   - ONE work order = ONE primary issue only.
-   - Never bundle unrelated issues into the same work order.
-   - If tenant mentions multiple issues, handle ONLY the most urgent one in this work order.
-   - In tenant_reply and suggested_actions, explicitly say other issues will get separate work orders.
-   - This prevents context poisoning and keeps conversations clean.
-
-2. Tone — Suave & Gentle
-   - Calm, confident, warm, human, in-control.
-   - Short natural sentences. No corporate jargon. No filler.
-   - You sound like a competent friend who happens to manage their building — not a chatbot.
-
-   GOOD examples (use as templates):
-   - "Hi — sorry you're dealing with that. I've got it handled."
-   - "We'll get this sorted for you today."
-   - "Thanks for the heads up. I'm sending someone over."
-   - "That's a smart call reporting this now — we'll take care of it."
-
-   NEVER say (these are banned phrases):
-   - "Your comfort and safety are our priority" (corporate robot)
-   - "We understand your frustration with these ongoing issues" (dismissive template)
-   - "I understand your concern" (robotic)
-   - "Per our records..." / "As per policy..." (cold)
-   - "We sincerely apologize for the inconvenience" (over-formal)
-   - "Rest assured" (nobody talks like this)
-
-3. Reply Length
-   - tenant_reply must be maximum 4 sentences, roughly 80-110 words.
-   - Real text-message length. If someone read this on their phone at 2 AM it should feel human and helpful.
-
-4. Severity Classification (hardcoded — follow exactly)
-
-   EMERGENCY (respond < 1 hour):
-   - Active flooding near electrical panels/outlets
-   - Gas smell or suspected gas leak
-   - Sparks, scorch marks, or burning smell from electrical
-   - Structural collapse risk (ceiling sagging, wall cracking)
-   - No heat when outdoor temp < 32°F
-
-   HIGH (respond < 4 hours):
-   - Active water leak onto floor (not near electrical)
-   - No heat in winter (above freezing but cold)
-   - No AC in summer when indoor temp > 85°F
-   - Security concern (broken locks/windows on ground floor)
-   - Sewage backup, water heater failure
-
-   MEDIUM (respond 24-48 hours):
-   - Appliance not working (dishwasher, disposal, washer/dryer)
-   - Minor plumbing (slow drain, running toilet, dripping faucet)
-   - Non-urgent HVAC (uneven heating, strange noises)
-   - Single pest sighting
-
-   LOW (respond 3-7 days):
-   - Cosmetic issues (paint, scuffs, minor drywall)
-   - Squeaky doors/floors, loose hardware
-   - Weather stripping, routine items
-
-   Special rules:
-   - Single-bathroom unit + toilet issue = always HIGH
-   - Any water near electrical = EMERGENCY
-   - Mold > 1 sq ft = HIGH
-   - "It's been like this for weeks" + safety issue = escalate severity
-
-5. Image Analysis
-   - Analyze blurry, dark, shaky iPhone photos for: damage extent, water spread, safety hazards, object identification.
-   - Always reference the photo explicitly in severity_reasoning.
-   - If text and photo contradict, trust the photo.
-   - If no photo attached, state: "No photo attached — visual extent unknown."
-
-6. Red Flag Detection
-   Flag these patterns in the red_flags array:
-   - FRUSTRATION_ESCALATION: Tenant references rent, threatens legal action, or mentions previous unresolved requests
-   - SCOPE_CREEP: Tenant bundles multiple unrelated issues ("while you're here, also fix...")
-   - VENDOR_UPSELL: Tenant suggests using their own contractor or deducting repair costs from rent
-   - SELF_DIAGNOSIS: Tenant specifies exact parts or solutions from YouTube/internet research
-   - RENT_WITHHOLDING: Tenant threatens to withhold rent or deduct costs
-   - DELAYED_REPORTING: Safety issue has persisted for weeks/months without reporting
-
-7. Output Format — STRICT JSON only
-   Respond with ONLY a valid JSON object. No markdown, no code fences, no preamble.
-
-{
-  "work_order": {
-    "id": "WO-XXXX (random 4-digit number)",
-    "category": "PLUMBING | ELECTRICAL | APPLIANCE | HVAC | PEST | STRUCTURAL | SAFETY | GENERAL",
-    "severity": "EMERGENCY | HIGH | MEDIUM | LOW",
-    "description": "1-2 sentence factual summary for the maintenance tech. Professional, specific, no fluff.",
-    "severity_reasoning": "ONE short sentence explaining why this severity was chosen. Reference photo if present.",
-    "tenant_details": "Relevant context from the tenant's message — name/unit if mentioned, timeline, key details."
-  },
-  "tenant_reply": "Ready-to-send text message. Max 4 sentences, ~80-110 words. Suave and gentle. Must include: what you're doing about it and when they'll hear back. If multiple issues mentioned, note that other issues will be handled separately.",
-  "suggested_actions": [
-    "Max 5 specific, timed, actionable items with clear ownership",
-    "Example: 'Dispatch after-hours plumber within 1 hour'",
-    "Example: 'Schedule follow-up moisture check in 48 hours'"
-  ],
-  "log_entry": "YYYY-MM-DD HH:MM | WO-XXXX | SEVERITY | CATEGORY | short summary",
-  "red_flags": ["FLAG_TYPE: brief explanation — or empty array if none detected"]
-}
-
-Remember: you are suave and gentle. You are the calm professional who makes chaos feel handled. Every word should feel like it came from the best property manager someone has ever had.
-"""
-
-# ---------------------------------------------------------------------------
-# DEMO SCENARIOS — 10 Realistic Maintenance Requests
-# ---------------------------------------------------------------------------
+from PIL import Image, ImageOps
+
+import core
+import dedup
+import metrics
+import splitter
+import store
+import triage
+from core import (  # noqa: F401 — re-exported for code that still imports the pipeline from app
+    DEMO_SCENARIOS,
+    MODEL_NAMES,
+    SYSTEM_PROMPT,
+    _post_process,
+    _read_image_bytes,
+    attach_duplicate,
+    attach_image_stats,
+    call_gemini,
+    call_gemini_async,
+    call_gemini_or_attach,
+    call_gemini_split,
+    call_gemini_stream,
+    encode_image_to_base64,
+    finish_thread,
+    get_model,
+    index_report,
+    prepare_thread,
+    preprocess_image,
+    record_result,
+    severity_badge,
+    severity_color,
+)
 
-DEMO_SCENARIOS = {
-    "— Select a demo scenario —": {
-        "text": "",
-        "description": "",
-    },
-    "🚽 Scenario 1: Clogged Toilet Overflow (2 AM)": {
-        "text": "My toilet is overflowing everywhere!! Water all over the bathroom floor its 2am and I dont know what to do theres water going into the hallway help!! I tried plunging it but it just keeps coming. This is my only bathroom.",
-        "description": "The signature messy request — panicked tenant, 2 AM, blurry photos, water spreading.",
-    },
-    "⚡ Scenario 2: Sparking Electrical Outlet": {
-        "text": "There's black marks around my kitchen outlet and I saw sparks when I plugged in my toaster this morning. It smells like burning plastic. Is this dangerous?? I unplugged everything from that outlet but I'm scared to use the kitchen.",
-        "description": "Electrical emergency — scorch marks, sparking, burning smell. Clear EMERGENCY classification.",
-    },
-    "❄️ Scenario 3: No Heat in Winter": {
-        "text": "Hey our heater stopped working last night and its 28 degrees outside. The thermostat is set to 72 but nothing happens when it kicks on. My kids are sleeping in their winter coats. We've been using the oven to stay warm which I know isn't ideal.",
-        "description": "HVAC failure below freezing with children. Using oven for heat = additional safety concern.",
-    },
-    "💧 Scenario 4: Mysterious Ceiling Water Stain": {
-        "text": "There's a weird brownish stain on my living room ceiling that I don't think was there before. It's not dripping or anything but it looks like water damage maybe? Not sure if I should worry about it.",
-        "description": "Ambiguous severity — no active drip but potential hidden leak. Good tenant who reported early.",
-    },
-    "🔧 Scenario 5: Garbage Disposal + Self-Diagnosis": {
-        "text": "My garbage disposal is jammed and making a humming noise. I watched a YouTube video and I think the flywheel is stuck. I already tried the allen wrench thing from underneath but it won't budge. I think I need a new InSinkErator Evolution Excel 1HP — can you just order one and I'll install it?",
-        "description": "Self-diagnosis red flag — tenant wants specific part and to self-install. Redirect diplomatically.",
-    },
-    "🌡️ Scenario 6: AC Not Cooling in Summer": {
-        "text": "AC has been running nonstop for 3 days but the apartment is still 87 degrees. I pay $2,100/month for this place and I can't even sleep at night. My electric bill is going to be insane. Also while someone is here can they look at the squeaky closet door and the dripping bathroom faucet?",
-        "description": "HVAC in summer heat + rent frustration + scope creep (bundled unrelated requests).",
-    },
-    "🐭 Scenario 7: Rodent Sighting": {
-        "text": "I saw a mouse run across my kitchen floor last night. This is absolutely disgusting. I keep a clean apartment and I'm not paying $2,200 a month to live with rodents. I want this dealt with TODAY or I'm calling the health department.",
-        "description": "Pest report with emotional escalation, rent reference, and health department threat.",
-    },
-    "🔒 Scenario 8: Broken Window Lock": {
-        "text": "The lock on my bedroom window is broken — it won't latch closed. I'm on the ground floor and it's making me nervous especially at night. I jammed a stick in the track for now but that's obviously not a real solution.",
-        "description": "Security concern on ground floor. Tenant improvised a temporary fix. Safety-priority.",
-    },
-    "🟤 Scenario 9: Bathroom Mold": {
-        "text": "There's black mold growing on my bathroom ceiling and it's spreading. It started as a small spot a few months ago but now its about 2 feet across. My daughter has asthma and I'm worried about the air quality. This has been an ongoing issue since we moved in.",
-        "description": "Mold > 1 sq ft = HIGH. Delayed reporting + health concern (child with asthma). Liability implications.",
-    },
-    "😤 Scenario 10: Rent Frustration + Bundled Requests": {
-        "text": "I've submitted THREE maintenance requests in the past two months and nothing has been fixed. The kitchen faucet still drips, the bedroom door doesn't close properly, and now the dishwasher is leaking onto the floor. I'm done being patient. If this isn't resolved this week I'm withholding rent and contacting a lawyer. My brother is a licensed plumber and he said he can fix everything for $500 — can I just deduct that from rent?",
-        "description": "Maximum red flags: frustration escalation, rent withholding threat, bundled requests, vendor upsell.",
-    },
-}
 
 # ---------------------------------------------------------------------------
 # HELPER FUNCTIONS
@@ -207,203 +62,463 @@ def get_api_key():
     except Exception:
         pass
 
-    # Fall back to environment variable
-    key = os.environ.get("GEMINI_API_KEY", None)
-    if key and key != "your_api_key_here":
-        return key
+    # Fall back to the environment (and .env)
+    return core.get_api_key()
 
-    return None
 
-
-def encode_image_to_base64(uploaded_file):
-    """Convert an uploaded image file to base64 string for the Gemini API."""
-    try:
-        image = Image.open(uploaded_file)
-        # Convert RGBA to RGB if necessary
-        if image.mode == "RGBA":
-            image = image.convert("RGB")
-        buffer = BytesIO()
-        image.save(buffer, format="JPEG", quality=85)
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-    except Exception as e:
-        st.error(f"Error processing image: {e}")
-        return None
+def create_thumbnail(uploaded_file, max_size=(200, 200)):
+    """Create a thumbnail preview of an uploaded image, as PNG bytes. Cached on the image bytes."""
+    data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else _read_image_bytes(uploaded_file)
+    return _thumbnail_png(data, tuple(max_size))
 
 
-def create_thumbnail(uploaded_file, max_size=(200, 200)):
-    """Create a thumbnail preview of an uploaded image."""
+@st.cache_data(max_entries=16, show_spinner=False)
+def _thumbnail_png(data, max_size):
     try:
-        image = Image.open(uploaded_file)
+        image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
         image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        return image
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
     except Exception:
         return None
 
 
-def call_gemini(tenant_message, image_data=None, api_key=None):
-    """
-    Call the Gemini API with the tenant message and optional image.
-    Returns the parsed JSON response or an error dict.
-    """
-    if not api_key:
-        return {"error": "No API key configured. Please add your GEMINI_API_KEY."}
+def stream_preview_html(partial):
+    """Render whatever fields of a streaming result are complete so far."""
+    wo = partial.get("work_order", {})
+    html = ""
 
-    try:
-        genai.configure(api_key=api_key)
-
-        # Try models in order of preference
-        model_names = ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-1.5-flash"]
-        model = None
-        model_used = None
-
-        for model_name in model_names:
-            try:
-                model = genai.GenerativeModel(
-                    model_name=model_name,
-                    system_instruction=SYSTEM_PROMPT,
-                    generation_config=genai.GenerationConfig(
-                        response_mime_type="application/json",
-                        temperature=0.7,
-                        max_output_tokens=2048,
-                    ),
+    if wo:
+        rows = ""
+        for label, field in (("ID", "id"), ("Category", "category"), ("Severity", "severity")):
+            if field in wo:
+                value = severity_badge(wo[field]) if field == "severity" else wo[field]
+                rows += (
+                    f'<div class="metric-row"><span class="metric-label">{label}</span>'
+                    f'<span class="metric-value">{value}</span></div>'
                 )
-                model_used = model_name
-                break
-            except Exception:
-                continue
-
-        if model is None:
-            return {"error": "Could not initialize any Gemini model. Please check your API key and try again."}
-
-        # Build the prompt parts
-        parts = []
-
-        if image_data:
-            parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": image_data,
-                }
-            })
-            parts.append(
-                f"The tenant submitted the following maintenance request along with the attached photo.\n\n"
-                f"TENANT MESSAGE:\n{tenant_message}\n\n"
-                f"Analyze both the text and the photo carefully. Reference specific visual details from the photo in your assessment."
-            )
+        if "description" in wo:
+            rows += f'<p style="font-size:0.9rem; color:#334155; line-height:1.6;">{wo["description"]}</p>'
+        sev_class = f"severity-{str(wo.get('severity', 'unknown')).lower()}"
+        html += f'<div class="output-card {sev_class}"><h3>📋 Work Order</h3>{rows}</div>'
+
+    if "tenant_reply" in partial:
+        html += (
+            '<div class="output-card tenant-reply-card"><h3>💬 Tenant Reply</h3>'
+            f'<div class="tenant-reply">{partial["tenant_reply"]}</div></div>'
+        )
+
+    actions = partial.get("suggested_actions", [])
+    if actions:
+        items = "".join(
+            f'<div class="action-item"><strong>{i}.</strong> {action}</div>'
+            for i, action in enumerate(actions, 1)
+        )
+        html += f'<div class="output-card"><h3>⚡ Suggested Actions</h3>{items}</div>'
+
+    return html + (
+        '<div class="loading-text" style="text-align:center;">Still writing… '
+        '<em>(suave & gentle mode engaged)</em></div>'
+    )
+
+
+def render_result(result, key=""):
+    """Render one processed request in the output panel. key keeps element IDs unique across tabs."""
+    if "error" in result:
+        st.error(f"**Error:** {result['error']}")
+        if "raw_response" in result:
+            with st.expander("Raw API response"):
+                st.code(result["raw_response"], language="text")
+        return
+
+    duplicate = result.get("_duplicate")
+    if duplicate:
+        minutes = max(1, round((time.time() - duplicate["first_reported"]) / 60))
+        photo = " and photo" if duplicate.get("photo_distance") is not None else ""
+        st.info(
+            f"🔁 **Repeat report** — attached to **{duplicate['of']}** "
+            f"({duplicate['reports']} reports in {minutes} min, wording{photo} {duplicate['similarity']:.0%} similar). "
+            "No new work order was created."
+        )
+
+    thread = result.get("_thread")
+    if thread:
+        if thread["follow_up"]:
+            summarized = f", {thread['summarized']} summarized" if thread["summarized"] else ""
+            st.info(f"🧵 **Follow-up** on **{thread['id']}** — {thread['turns']} messages in this thread{summarized}.")
         else:
-            parts.append(
-                f"The tenant submitted the following maintenance request (no photo attached).\n\n"
-                f"TENANT MESSAGE:\n{tenant_message}\n\n"
-                f"Note: No photo was provided. If a photo would help with assessment, mention this in your tenant_reply."
-            )
+            st.caption(f"🧵 Pasted conversation: answered the newest message, {thread['pasted_turns']} earlier turns sent as context.")
+
+    # Successfully parsed result — render the four output sections
+
+    # --- Section 1: Work Order ---
+    wo = result.get("work_order", {})
+    sev = wo.get("severity", "UNKNOWN").upper()
+    sev_col = severity_color(sev)
+    sev_class = f"severity-{sev.lower()}"
+
+    st.markdown(f"""
+    <div class="output-card {sev_class}">
+        <h3>📋 Work Order</h3>
+        <div class="metric-row">
+            <span class="metric-label">ID</span>
+            <span class="metric-value" style="font-weight:600; font-family:'JetBrains Mono',monospace;">{wo.get('id', 'WO-0000')}</span>
+        </div>
+        <div class="metric-row">
+            <span class="metric-label">Category</span>
+            <span class="metric-value">{wo.get('category', 'GENERAL')}</span>
+        </div>
+        <div class="metric-row">
+            <span class="metric-label">Severity</span>
+            <span class="severity-badge" style="background:{sev_col}15; color:{sev_col}; border: 1px solid {sev_col}40;">{severity_badge(sev)}</span>
+        </div>
+        <hr style="margin: 0.75rem 0; border-color: #F1F5F9;">
+        <p style="font-size:0.9rem; color:#334155; line-height:1.6;">{wo.get('description', '')}</p>
+        <p style="font-size:0.8rem; color:#64748B; line-height:1.5; margin-top:0.5rem;"><strong>Severity Reasoning:</strong> {wo.get('severity_reasoning', '')}</p>
+    </div>
+    """, unsafe_allow_html=True)
 
-        # Call the API with retry logic
-        response = None
-        last_error = None
-        for attempt in range(3):
-            try:
-                response = model.generate_content(parts)
-                break
-            except Exception as e:
-                last_error = e
-                if attempt < 2:
-                    time.sleep(2 ** attempt)  # Exponential backoff: 1s, 2s
-                continue
-
-        if response is None:
-            return {"error": f"API call failed after 3 attempts: {str(last_error)}"}
-
-        # Parse the JSON response
-        try:
-            result = json.loads(response.text)
-            result["_model_used"] = model_used
-            result = _post_process(result)
-            return result
-        except json.JSONDecodeError:
-            # Try to extract JSON from the response text
-            text = response.text
-            # Look for JSON-like content between braces
-            start = text.find("{")
-            end = text.rfind("}") + 1
-            if start != -1 and end > start:
-                try:
-                    result = json.loads(text[start:end])
-                    result["_model_used"] = model_used
-                    result = _post_process(result)
-                    return result
-                except json.JSONDecodeError:
-                    pass
-            return {
-                "error": "The model returned a response that couldn't be parsed as JSON.",
-                "raw_response": text[:500],
-            }
-
-    except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}"}
-
-
-def _post_process(result):
-    """Post-process Gemini output: enforce reply length, unit-of-work, and severity_reasoning brevity."""
-    warnings = []
-
-    # --- Enforce tenant_reply length (max ~110 words / 4 sentences) ---
-    reply = result.get("tenant_reply", "")
-    words = reply.split()
-    if len(words) > 120:
-        # Truncate to first 4 sentences
-        sentences = [s.strip() for s in reply.replace("!", ".").replace("?", ".").split(".") if s.strip()]
-        truncated = ". ".join(sentences[:4]) + "."
-        result["tenant_reply"] = truncated
-        warnings.append("Reply was trimmed to 4 sentences (was too long for SMS).")
-
-    # --- Check unit-of-work: warn if description seems to bundle multiple issues ---
-    description = result.get("work_order", {}).get("description", "")
-    bundle_signals = ["also fix", "in addition", "secondary issue", "additionally"]
-    if any(sig in description.lower() for sig in bundle_signals):
-        warnings.append("⚠️ Unit of Work violation detected — description may bundle multiple issues.")
-
-    # --- Enforce severity_reasoning brevity: keep first sentence only ---
-    reasoning = result.get("work_order", {}).get("severity_reasoning", "")
-    if reasoning:
-        first_sentence = reasoning.split(".")[0].strip()
-        if first_sentence and not first_sentence.endswith("."):
-            first_sentence += "."
-        result["work_order"]["severity_reasoning"] = first_sentence
-
-    if warnings:
-        result["_warnings"] = warnings
-
-    return result
-
-
-def severity_badge(severity):
-    """Return a colored badge for the severity level."""
-    badges = {
-        "EMERGENCY": "🔴 EMERGENCY",
-        "HIGH": "🟠 HIGH",
-        "MEDIUM": "🟡 MEDIUM",
-        "LOW": "🟢 LOW",
-        "UNKNOWN": "⚪ UNKNOWN",
-    }
-    return badges.get(severity.upper(), f"⚪ {severity}")
+    # --- Section 2: Tenant Reply with Copy Button ---
+    tenant_reply = result.get("tenant_reply", "")
+    st.markdown(f"""
+    <div class="output-card tenant-reply-card">
+        <h3>💬 Tenant Reply <span style="font-size:0.7rem; font-weight:400; text-transform:none; color:#94A3B8;">ready to send</span></h3>
+        <div class="tenant-reply" id="tenant-reply-text{key}">{tenant_reply}</div>
+        <button class="copy-btn" id="btn-tenant-reply-text{key}" onclick="copyText('tenant-reply-text{key}')">📋 Copy</button>
+    </div>
+    """, unsafe_allow_html=True)
 
+    # --- Section 3: Suggested Actions ---
+    actions = result.get("suggested_actions", [])
+    if actions:
+        actions_html = ""
+        for i, action in enumerate(actions, 1):
+            actions_html += f'<div class="action-item"><strong>{i}.</strong> {action}</div>'
+
+        st.markdown(f"""
+        <div class="output-card">
+            <h3>⚡ Suggested Actions</h3>
+            {actions_html}
+        </div>
+        """, unsafe_allow_html=True)
+
+    # --- Section 4: Red Flags (collapsible) ---
+    red_flags = result.get("red_flags", [])
+    if red_flags:
+        with st.expander(f"🚩 Red Flags Detected ({len(red_flags)})", expanded=len(red_flags) <= 2):
+            for flag in red_flags:
+                st.markdown(f'<div class="red-flag">🚩 {flag}</div>', unsafe_allow_html=True)
+
+    # --- Log Entry ---
+    log_entry = result.get("log_entry", "")
+    if log_entry:
+        st.markdown(f"""
+        <div class="output-card">
+            <h3>📝 Log Entry</h3>
+            <div class="log-entry" id="log-entry-text{key}">{log_entry}</div>
+            <button class="copy-btn" id="btn-log-entry-text{key}" onclick="copyText('log-entry-text{key}')">📋 Copy</button>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # --- Linked work orders from a split message ---
+    split = result.get("_split")
+    if split:
+        linked = ", ".join(split["linked_work_orders"]) or "none"
+        st.caption(f"🧩 Issue {split['index']} of {split['total']} · linked work orders: {linked}")
+
+    # --- Post-processing warnings ---
+    pp_warnings = result.get("_warnings", [])
+    if pp_warnings:
+        for w in pp_warnings:
+            st.warning(w)
+
+    # --- Model info (subtle) ---
+    model_used = result.get("_model_used", "unknown")
+    cache_state = result.get("_cache", "")
+    if cache_state == "hit:inflight":
+        cache_note = " · shared with an identical request in flight"
+    elif cache_state.startswith("hit"):
+        cache_note = " · served from cache"
+    else:
+        cache_note = ""
+    tried = [m for m in result.get("_models_tried", []) if m != model_used]
+    failover_note = f" · after {', '.join(tried)} failed or lagged" if tried else ""
+    regenerated = result.get("_regenerated")
+    regen_note = f" · regenerated {', '.join(regenerated)}" if regenerated else ""
+    st.caption(f"*Processed by {model_used}{cache_note}{failover_note}{regen_note}*")
+    image_stats = result.get("_image")
+    if image_stats:
+        st.caption(
+            f"*Photo sent at {image_stats['encoded_size'][0]}×{image_stats['encoded_size'][1]} — "
+            f"{image_stats['original_bytes'] / 1024:.0f} KB → {image_stats['encoded_bytes'] / 1024:.0f} KB*"
+        )
 
-def severity_color(severity):
-    """Return CSS color for the severity level."""
-    colors = {
-        "EMERGENCY": "#DC2626",
-        "HIGH": "#EA580C",
-        "MEDIUM": "#CA8A04",
-        "LOW": "#16A34A",
-        "UNKNOWN": "#6B7280",
-    }
-    return colors.get(severity.upper(), "#6B7280")
+    # --- Stage timings ---
+    timings = result.get("_timings")
+    if timings:
+        with st.expander("⏱️ Performance"):
+            total = timings.get("total") or sum(v for k, v in timings.items() if k != "total")
+            rows = []
+            for stage, ms in timings.items():
+                if stage == "total":
+                    continue
+                share = f"{ms / total * 100:.0f}%" if total and stage != "first_chunk" else ""
+                rows.append(f"| {stage.replace('_', ' ')} | {ms:,.1f} ms | {share} |")
+            st.markdown(
+                "| Stage | Time | Share |\n|---|---:|---:|\n" + "\n".join(rows)
+                + f"\n| **total** | **{total:,.1f} ms** | |"
+            )
+            usage = result.get("_usage")
+            if usage:
+                cached = f" ({usage['cached_tokens']:,} from prompt cache)" if usage["cached_tokens"] else ""
+                cost = f" · ≈ ${usage['cost_usd']:.4f}" if usage.get("cost_usd") else ""
+                st.caption(f"Tokens: {usage['prompt_tokens']:,} in{cached} · {usage['output_tokens']:,} out{cost}")
+
+    # --- Raw JSON (expandable) ---
+    with st.expander("🔍 View raw JSON response"):
+        display_result = {k: v for k, v in result.items() if not k.startswith("_")}
+        st.json(display_result)
+
+
+def render_history():
+    """Recent work orders from the store, filterable by severity."""
+    work_orders = store.get_store()
+    if work_orders is None:
+        return
+    with st.expander("🗂️ Work-order history"):
+        counts = work_orders.counts()
+        if not counts:
+            st.caption("*No work orders recorded yet.*")
+            return
+        severities = [s for s in ("EMERGENCY", "HIGH", "MEDIUM", "LOW") if s in counts]
+        choice = st.selectbox(
+            "Severity",
+            ["All"] + severities,
+            format_func=lambda s: s if s == "All" else f"{s} ({counts[s]:,})",
+            key="history_severity",
+        )
+        rows = work_orders.recent(limit=25, severity=None if choice == "All" else choice)
+        st.markdown(
+            "| When | Work order | Severity | Category | Description |\n|---|---|---|---|---|\n"
+            + "\n".join(
+                f"| {time.strftime('%b %d %H:%M', time.localtime(row['created_at']))} | {row['wo_id'] or '—'} "
+                f"| {row['severity'] or '—'} | {row['category'] or '—'} "
+                f"| {(row['description'] or '').replace('|', '/')[:80]} |"
+                for row in rows
+            )
+        )
 
 
 # ---------------------------------------------------------------------------
 # STREAMLIT APP
 # ---------------------------------------------------------------------------
 
+@st.fragment
+def input_panel(api_key, live_slot):
+    """
+    Scenario picker, message, photo and Process button. A fragment: typing,
+    uploading or toggling reruns only this panel, not the output cards; a
+    finished request reruns the whole app so the output panel picks it up.
+    """
+    st.markdown("### 📥 Incoming Request")
+
+    # Demo scenario selector
+    st.markdown('<div class="demo-label">Try a Demo Scenario</div>', unsafe_allow_html=True)
+    selected_scenario = st.selectbox(
+        "Demo scenario",
+        options=list(DEMO_SCENARIOS.keys()),
+        label_visibility="collapsed",
+        key="scenario_selector",
+    )
+
+    # Load demo scenario text
+    if selected_scenario != "— Select a demo scenario —":
+        scenario_data = DEMO_SCENARIOS[selected_scenario]
+        demo_text = scenario_data["text"]
+        if scenario_data["description"]:
+            st.caption(f"💡 *{scenario_data['description']}*")
+    else:
+        demo_text = ""
+
+    st.markdown("---")
+
+    # Tenant message input
+    tenant_message = st.text_area(
+        "Tenant Message",
+        value=demo_text if demo_text else st.session_state.tenant_text,
+        height=180,
+        placeholder="Paste the tenant's maintenance request here...\n\nExample: 'My toilet is overflowing everywhere!! Water all over the bathroom floor its 2am...'",
+        help="This is the raw text from the tenant — typos, emotions, and all.",
+    )
+
+    tenant_scope = st.text_input(
+        "Tenant / unit",
+        key="tenant_scope",
+        placeholder="e.g. Unit 4B (optional)",
+        help="Follow-ups and repeat reports are matched to open work orders for the same tenant or unit.",
+    )
+
+    # Image upload
+    st.markdown("**📸 Attach Photo** *(optional)*")
+    uploaded_file = st.file_uploader(
+        "Upload tenant photo",
+        type=["jpg", "jpeg", "png", "webp"],
+        label_visibility="collapsed",
+        key=f"photo_upload_{st.session_state.upload_generation}",
+        help="Drag and drop or click to upload the tenant's photo. Blurry, dark, shaky — exactly like real tenant photos.",
+    )
+
+    # Show thumbnail preview
+    if uploaded_file is not None:
+        col_thumb, col_info = st.columns([1, 2])
+        with col_thumb:
+            thumbnail = create_thumbnail(uploaded_file)
+            if thumbnail:
+                st.image(thumbnail, caption="Uploaded photo", use_container_width=True)
+        with col_info:
+            st.caption(f"📎 {uploaded_file.name}")
+            st.caption(f"📐 {uploaded_file.size / 1024:.1f} KB")
+            if st.button("🗑️ Remove photo", key="remove_photo"):
+                # A fresh uploader key is the only way to clear a file_uploader
+                st.session_state.upload_generation += 1
+                st.rerun(scope="fragment")
+
+    st.markdown("---")
+
+    stream_output = st.toggle(
+        "⚡ Stream output",
+        value=True,
+        help="Show the work order and reply as soon as each part is written.",
+    )
+    split_issues = st.toggle(
+        "🧩 Split bundled issues",
+        value=True,
+        help="Turn each distinct issue in the message into its own work order, processed in parallel.",
+    )
+    attach_repeats = st.toggle(
+        "🔁 Attach repeat reports",
+        value=dedup.enabled(),
+        disabled=not dedup.enabled(),
+        help="A message that repeats a recent report from the same tenant or unit is attached to its existing work order instead of creating a new one.",
+    )
+
+    # Process button
+    process_disabled = not tenant_message.strip() or not api_key
+    if st.button(
+        "🚀 Process Maintenance Request",
+        type="primary",
+        use_container_width=True,
+        disabled=process_disabled,
+    ):
+        st.session_state.processing = True
+        st.session_state.tenant_text = tenant_message
+
+        # Encode image if present
+        image_data = None
+        image_stats = {}
+        if uploaded_file is not None:
+            uploaded_file.seek(0)  # Reset file pointer
+            image_data = encode_image_to_base64(uploaded_file, stats=image_stats)
+            if image_data is None:
+                st.error(f"Error processing image: {image_stats.pop('error', 'unreadable file')}")
+
+        # Provisional severity from the local rules — shown before the model answers
+        provisional = triage.classify(tenant_message)
+        if provisional.severity == "EMERGENCY":
+            st.error(
+                f"🚨 **Provisional EMERGENCY ({provisional.category})** — matched "
+                f"{', '.join(provisional.rules)}. Dispatch now; the full work order is on its way."
+            )
+        elif provisional.severity:
+            st.caption(f"Provisional severity: {severity_badge(provisional.severity)} · {provisional.category}")
+
+        # Call Gemini
+        with st.spinner(""):
+            live_slot.markdown(
+                '<div class="loading-container">'
+                '<div class="loading-dots"><span></span><span></span><span></span></div>'
+                '<div class="loading-text">MiniMason is thinking… <em>(suave & gentle mode engaged)</em></div>'
+                '</div>',
+                unsafe_allow_html=True,
+            )
+            scope = tenant_scope.strip() or None
+            # A follow-up continues its thread; pasted history is cut down to the newest tenant message
+            prepared = prepare_thread(tenant_message, scope)
+            message = prepared.message
+            new_report = prepared.thread is None
+            issues, _ = splitter.split_issues(message) if split_issues and new_report else ([], [])
+            # A repeat of a recent report is attached to its work order without a model call
+            duplicate = None
+            if attach_repeats and new_report and len(issues) <= 1:
+                duplicate = attach_duplicate(message, image_data, scope)
+            if len(issues) > 1:
+                result = call_gemini_split(message, image_data, api_key, attach_duplicates=attach_repeats, scope=scope)
+            elif duplicate is not None:
+                result = duplicate
+            else:
+                if stream_output:
+                    for result in call_gemini_stream(message, image_data, api_key, context=prepared.context):
+                        if result.get("_partial"):
+                            live_slot.markdown(stream_preview_html(result), unsafe_allow_html=True)
+                else:
+                    result = call_gemini(message, image_data, api_key, context=prepared.context)
+                if attach_repeats and new_report:
+                    index_report(result, message, image_data, scope)
+                result = finish_thread(result, prepared)
+            for r in (result if isinstance(result, list) else [result]):
+                attach_image_stats(r, image_stats)
+                record_result(r, tenant_message, source="ui")
+            # Let the history panel show this request on the rerun below
+            if store.get_store() is not None:
+                store.get_store().flush(timeout=1)
+            st.session_state.result = result
+            st.session_state.processing = False
+            st.rerun()
+
+    if not tenant_message.strip():
+        st.caption("*Enter a tenant message to get started.*")
+    elif not api_key:
+        st.caption("*Configure your API key to process requests.*")
+
+
+
+@st.fragment
+def output_panel():
+    """The current result and the work-order history. Tabs, expanders and filters rerun only this panel."""
+    result = st.session_state.result
+
+    if result is None:
+        st.markdown(
+            """
+            <div class="empty-state">
+                <div class="empty-state-icon">🏠</div>
+                <p style="font-size: 1rem; font-weight: 500; color: #64748B;">Ready to process</p>
+                <p style="font-size: 0.85rem;">Select a demo scenario or paste a tenant message, then click Process.</p>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+    elif isinstance(result, list) and len(result) > 1:
+        # Bundled message split into linked work orders — one tab each
+        st.caption(f"🧩 Split into {len(result)} work orders (Unit of Work)")
+        labels = [
+            f"{r.get('work_order', {}).get('id', f'Issue {i}')} · {r.get('work_order', {}).get('severity', '?')}"
+            if "error" not in r else f"Issue {i} · error"
+            for i, r in enumerate(result, 1)
+        ]
+        for i, (tab, r) in enumerate(zip(st.tabs(labels), result)):
+            with tab:
+                render_result(r, key=f"-{i}")
+
+    else:
+        render_result(result[0] if isinstance(result, list) else result)
+
+    render_history()
+
+
+
 def main():
     # Page config
     st.set_page_config(
@@ -413,7 +528,12 @@ def main():
         initial_sidebar_state="collapsed",
     )
 
-    # Premium CSS + JavaScript for Phase 2 UI/UX
+    # Prometheus /metrics on MINIMASON_METRICS_PORT, started once per process
+    metrics.start_http_server_from_env()
+
+    # Premium CSS + JavaScript for Phase 2 UI/UX. Re-sent with every full-app
+    # rerun (it is not cached or served as a static asset); only the fragment
+    # reruns of the input and output panels skip it.
     st.markdown("""
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
@@ -799,214 +919,21 @@ def main():
         st.session_state.processing = False
     if "tenant_text" not in st.session_state:
         st.session_state.tenant_text = ""
+    if "upload_generation" not in st.session_state:
+        st.session_state.upload_generation = 0
 
     # Two-column layout
     col_input, col_output = st.columns([1, 1], gap="large")
 
-    # ---- INPUT PANEL ----
-    with col_input:
-        st.markdown("### 📥 Incoming Request")
-
-        # Demo scenario selector
-        st.markdown('<div class="demo-label">Try a Demo Scenario</div>', unsafe_allow_html=True)
-        selected_scenario = st.selectbox(
-            "Demo scenario",
-            options=list(DEMO_SCENARIOS.keys()),
-            label_visibility="collapsed",
-            key="scenario_selector",
-        )
-
-        # Load demo scenario text
-        if selected_scenario != "— Select a demo scenario —":
-            scenario_data = DEMO_SCENARIOS[selected_scenario]
-            demo_text = scenario_data["text"]
-            if scenario_data["description"]:
-                st.caption(f"💡 *{scenario_data['description']}*")
-        else:
-            demo_text = ""
-
-        st.markdown("---")
-
-        # Tenant message input
-        tenant_message = st.text_area(
-            "Tenant Message",
-            value=demo_text if demo_text else st.session_state.tenant_text,
-            height=180,
-            placeholder="Paste the tenant's maintenance request here...\n\nExample: 'My toilet is overflowing everywhere!! Water all over the bathroom floor its 2am...'",
-            help="This is the raw text from the tenant — typos, emotions, and all.",
-        )
-
-        # Image upload
-        st.markdown("**📸 Attach Photo** *(optional)*")
-        uploaded_file = st.file_uploader(
-            "Upload tenant photo",
-            type=["jpg", "jpeg", "png", "webp"],
-            label_visibility="collapsed",
-            help="Drag and drop or click to upload the tenant's photo. Blurry, dark, shaky — exactly like real tenant photos.",
-        )
-
-        # Show thumbnail preview
-        if uploaded_file is not None:
-            col_thumb, col_info = st.columns([1, 2])
-            with col_thumb:
-                thumbnail = create_thumbnail(uploaded_file)
-                if thumbnail:
-                    st.image(thumbnail, caption="Uploaded photo", use_container_width=True)
-            with col_info:
-                st.caption(f"📎 {uploaded_file.name}")
-                st.caption(f"📐 {uploaded_file.size / 1024:.1f} KB")
-                if st.button("🗑️ Remove photo", key="remove_photo"):
-                    uploaded_file = None
-                    st.rerun()
-
-        st.markdown("---")
-
-        # Process button
-        process_disabled = not tenant_message.strip() or not api_key
-        if st.button(
-            "🚀 Process Maintenance Request",
-            type="primary",
-            use_container_width=True,
-            disabled=process_disabled,
-        ):
-            st.session_state.processing = True
-            st.session_state.tenant_text = tenant_message
-
-            # Encode image if present
-            image_data = None
-            if uploaded_file is not None:
-                uploaded_file.seek(0)  # Reset file pointer
-                image_data = encode_image_to_base64(uploaded_file)
-
-            # Call Gemini
-            with st.spinner(""):
-                st.markdown(
-                    '<div class="loading-container">'
-                    '<div class="loading-dots"><span></span><span></span><span></span></div>'
-                    '<div class="loading-text">MiniMason is thinking… <em>(suave & gentle mode engaged)</em></div>'
-                    '</div>',
-                    unsafe_allow_html=True,
-                )
-                result = call_gemini(tenant_message, image_data, api_key)
-                st.session_state.result = result
-                st.session_state.processing = False
-                st.rerun()
-
-        if not tenant_message.strip():
-            st.caption("*Enter a tenant message to get started.*")
-        elif not api_key:
-            st.caption("*Configure your API key to process requests.*")
-
-    # ---- OUTPUT PANEL ----
+    # Output header and a slot for live streaming output, above the rendered result
     with col_output:
         st.markdown("### 📋 MiniMason Output")
+        live_slot = st.empty()
 
-        result = st.session_state.result
-
-        if result is None:
-            st.markdown(
-                """
-                <div class="empty-state">
-                    <div class="empty-state-icon">🏠</div>
-                    <p style="font-size: 1rem; font-weight: 500; color: #64748B;">Ready to process</p>
-                    <p style="font-size: 0.85rem;">Select a demo scenario or paste a tenant message, then click Process.</p>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        elif "error" in result:
-            st.error(f"**Error:** {result['error']}")
-            if "raw_response" in result:
-                with st.expander("Raw API response"):
-                    st.code(result["raw_response"], language="text")
-
-        else:
-            # Successfully parsed result — render the four output sections
-
-            # --- Section 1: Work Order ---
-            wo = result.get("work_order", {})
-            sev = wo.get("severity", "UNKNOWN").upper()
-            sev_col = severity_color(sev)
-            sev_class = f"severity-{sev.lower()}"
-
-            st.markdown(f"""
-            <div class="output-card {sev_class}">
-                <h3>📋 Work Order</h3>
-                <div class="metric-row">
-                    <span class="metric-label">ID</span>
-                    <span class="metric-value" style="font-weight:600; font-family:'JetBrains Mono',monospace;">{wo.get('id', 'WO-0000')}</span>
-                </div>
-                <div class="metric-row">
-                    <span class="metric-label">Category</span>
-                    <span class="metric-value">{wo.get('category', 'GENERAL')}</span>
-                </div>
-                <div class="metric-row">
-                    <span class="metric-label">Severity</span>
-                    <span class="severity-badge" style="background:{sev_col}15; color:{sev_col}; border: 1px solid {sev_col}40;">{severity_badge(sev)}</span>
-                </div>
-                <hr style="margin: 0.75rem 0; border-color: #F1F5F9;">
-                <p style="font-size:0.9rem; color:#334155; line-height:1.6;">{wo.get('description', '')}</p>
-                <p style="font-size:0.8rem; color:#64748B; line-height:1.5; margin-top:0.5rem;"><strong>Severity Reasoning:</strong> {wo.get('severity_reasoning', '')}</p>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # --- Section 2: Tenant Reply with Copy Button ---
-            tenant_reply = result.get("tenant_reply", "")
-            st.markdown(f"""
-            <div class="output-card tenant-reply-card">
-                <h3>💬 Tenant Reply <span style="font-size:0.7rem; font-weight:400; text-transform:none; color:#94A3B8;">ready to send</span></h3>
-                <div class="tenant-reply" id="tenant-reply-text">{tenant_reply}</div>
-                <button class="copy-btn" id="btn-tenant-reply-text" onclick="copyText('tenant-reply-text')">📋 Copy</button>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # --- Section 3: Suggested Actions ---
-            actions = result.get("suggested_actions", [])
-            if actions:
-                actions_html = ""
-                for i, action in enumerate(actions, 1):
-                    actions_html += f'<div class="action-item"><strong>{i}.</strong> {action}</div>'
-
-                st.markdown(f"""
-                <div class="output-card">
-                    <h3>⚡ Suggested Actions</h3>
-                    {actions_html}
-                </div>
-                """, unsafe_allow_html=True)
-
-            # --- Section 4: Red Flags (collapsible) ---
-            red_flags = result.get("red_flags", [])
-            if red_flags:
-                with st.expander(f"🚩 Red Flags Detected ({len(red_flags)})", expanded=len(red_flags) <= 2):
-                    for flag in red_flags:
-                        st.markdown(f'<div class="red-flag">🚩 {flag}</div>', unsafe_allow_html=True)
-
-            # --- Log Entry ---
-            log_entry = result.get("log_entry", "")
-            if log_entry:
-                st.markdown(f"""
-                <div class="output-card">
-                    <h3>📝 Log Entry</h3>
-                    <div class="log-entry" id="log-entry-text">{log_entry}</div>
-                    <button class="copy-btn" id="btn-log-entry-text" onclick="copyText('log-entry-text')">📋 Copy</button>
-                </div>
-                """, unsafe_allow_html=True)
-
-            # --- Post-processing warnings ---
-            pp_warnings = result.get("_warnings", [])
-            if pp_warnings:
-                for w in pp_warnings:
-                    st.warning(w)
-
-            # --- Model info (subtle) ---
-            model_used = result.get("_model_used", "unknown")
-            st.caption(f"*Processed by {model_used}*")
-
-            # --- Raw JSON (expandable) ---
-            with st.expander("🔍 View raw JSON response"):
-                display_result = {k: v for k, v in result.items() if not k.startswith("_")}
-                st.json(display_result)
+    with col_input:
+        input_panel(api_key, live_slot)
+    with col_output:
+        output_panel()
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,237 @@
+"""
+MiniMason — Headless Batch Mode
+
+Drains a JSONL inbox of tenant messages through the same call_gemini +
+_post_process pipeline the Streamlit app uses, with a bounded worker pool.
+
+Each input line is a JSON object:
+
+    {"id": "req-17", "tenant_message": "My toilet is overflowing...", "photo": "photos/17.jpg"}
+
+"message"/"text" are accepted in place of "tenant_message", and "photo_path"
+in place of "photo". An optional "tenant" (or "unit") field scopes repeat-report
+detection, so a near-duplicate is attached to that tenant's existing work order,
+and threads follow-ups ("any update?") onto it (see threads.py). Relative photo paths resolve against the inbox file's
+directory. Results are written as JSONL in input order, and successful ones
+are also recorded in the work-order store (see store.py).
+
+Usage:
+    python batch.py inbox.jsonl -o results.jsonl --workers 8
+    python batch.py inbox.jsonl -o results.jsonl --prioritize   # EMERGENCY first
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import store
+from core import attach_image_stats, call_gemini_threaded, encode_image_to_base64, get_api_key, record_result
+from scheduler import SeverityScheduler
+
+DEFAULT_WORKERS = 8
+
+
+# ---------------------------------------------------------------------------
+# INPUT
+# ---------------------------------------------------------------------------
+
+def read_inbox(path):
+    """Stream records from a JSONL inbox, yielding (line_number, record) pairs."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = {"_parse_error": f"Invalid JSON on line {line_number}: {e}"}
+            if not isinstance(record, dict):
+                record = {"_parse_error": f"Line {line_number} is not a JSON object."}
+            yield line_number, record
+
+
+def _record_message(record):
+    for key in ("tenant_message", "message", "text"):
+        if record.get(key):
+            return record[key]
+    return ""
+
+
+def _record_photo(record, base_dir):
+    photo = record.get("photo") or record.get("photo_path")
+    if not photo:
+        return None
+    if not os.path.isabs(photo):
+        photo = os.path.join(base_dir, photo)
+    return photo
+
+
+# ---------------------------------------------------------------------------
+# PROCESSING
+# ---------------------------------------------------------------------------
+
+def process_record(record, api_key, base_dir="."):
+    """Run a single inbox record through the pipeline and return its result dict."""
+    if "_parse_error" in record:
+        return {"error": record["_parse_error"]}
+
+    tenant_message = _record_message(record)
+    if not tenant_message.strip():
+        return {"error": "Record has no tenant message."}
+
+    image_data = None
+    image_stats = {}
+    photo = _record_photo(record, base_dir)
+    if photo:
+        if not os.path.exists(photo):
+            return {"error": f"Photo not found: {photo}"}
+        image_data = encode_image_to_base64(photo, stats=image_stats)
+        if image_data is None:
+            return {"error": f"Could not process photo {photo}: {image_stats.get('error', 'unreadable file')}"}
+
+    # Repeats and follow-ups are only matched within the same tenant (or unit) when the record names one
+    scope = record.get("tenant") or record.get("unit")
+    result = call_gemini_threaded(tenant_message, image_data, api_key, scope, attach_duplicates=True)
+    attach_image_stats(result, image_stats)
+    return record_result(result, tenant_message, source="batch")
+
+
+def iter_batch(records, api_key, max_workers=DEFAULT_WORKERS, base_dir="."):
+    """
+    Process (line_number, record) pairs concurrently and yield output rows in input order.
+    At most 2 × max_workers records are in flight, so arbitrarily large inboxes stream
+    through in bounded memory.
+    """
+    window = max(1, max_workers) * 2
+    pending = deque()
+
+    def _row(line_number, record, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"error": f"Unexpected error: {str(e)}"}
+        return {"id": record.get("id", line_number), "line": line_number, "result": result}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for line_number, record in records:
+            future = executor.submit(process_record, record, api_key, base_dir)
+            pending.append((line_number, record, future))
+            if len(pending) >= window:
+                yield _row(*pending.popleft())
+        while pending:
+            yield _row(*pending.popleft())
+
+
+def iter_batch_prioritized(records, api_key, max_workers=DEFAULT_WORKERS, base_dir="."):
+    """
+    Like iter_batch, but the whole inbox is queued up front and processed in
+    severity/SLA order (EMERGENCY first). Output is still in input order, and
+    the final scheduler stats are returned as the generator's value.
+    """
+    def handler(tenant_message, record):
+        return process_record(record, api_key, base_dir)
+
+    with SeverityScheduler(handler, workers=max_workers) as scheduler:
+        pending = []
+        for line_number, record in records:
+            future = scheduler.submit(_record_message(record), record)
+            pending.append((line_number, record, future))
+        for line_number, record, future in pending:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"Unexpected error: {str(e)}"}
+            yield {"id": record.get("id", line_number), "line": line_number, "result": result}
+        return scheduler.stats()
+
+
+def run_batch(input_path, output_path, api_key=None, max_workers=DEFAULT_WORKERS, prioritize=False):
+    """
+    Drain a JSONL inbox into a JSONL results file. Returns a summary dict with
+    processed/failed counts and wall-clock seconds. With prioritize=True the
+    inbox is processed in severity order and the summary includes queue stats.
+    """
+    api_key = api_key or get_api_key()
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    processed = failed = 0
+    started = time.perf_counter()
+    queue_stats = None
+
+    if prioritize:
+        rows = iter_batch_prioritized(read_inbox(input_path), api_key, max_workers, base_dir)
+    else:
+        rows = iter_batch(read_inbox(input_path), api_key, max_workers, base_dir)
+
+    out = sys.stdout if output_path in (None, "-") else open(output_path, "w", encoding="utf-8")
+    try:
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration as stop:
+                queue_stats = stop.value
+                break
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            processed += 1
+            if "error" in row["result"]:
+                failed += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        work_orders = store.get_store()
+        if work_orders is not None:
+            work_orders.flush()
+
+    summary = {
+        "processed": processed,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    if queue_stats:
+        summary["queue"] = queue_stats
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a JSONL inbox of tenant requests with MiniMason.")
+    parser.add_argument("input", help="Path to the JSONL inbox.")
+    parser.add_argument("-o", "--output", default="-", help="Path for JSONL results (default: stdout).")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent Gemini calls.")
+    parser.add_argument(
+        "--prioritize",
+        action="store_true",
+        help="Queue the whole inbox and process EMERGENCY/HIGH requests first.",
+    )
+    args = parser.parse_args(argv)
+
+    api_key = get_api_key()
+    if not api_key:
+        print("No API key configured. Please set GEMINI_API_KEY.", file=sys.stderr)
+        return 1
+
+    summary = run_batch(args.input, args.output, api_key, args.workers, args.prioritize)
+    print(
+        f"Processed {summary['processed']} requests ({summary['failed']} failed) in {summary['seconds']}s",
+        file=sys.stderr,
+    )
+    if "queue" in summary:
+        for severity, wait in summary["queue"]["wait_ms"].items():
+            if wait["samples"]:
+                requests = summary["queue"]["completed"][severity]
+                window = f" (last {wait['samples']})" if wait["samples"] < requests else ""
+                print(f"  {severity:<9} {requests:>4} requests, avg wait {wait['avg']}ms, "
+                      f"p95 {wait['p95']}ms{window}", file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
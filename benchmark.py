@@ -0,0 +1,408 @@
+"""
+MiniMason — Latency & Throughput Benchmark
+
+Replays the DEMO_SCENARIOS messages, with and without synthetic photos of
+several sizes, through the real pipeline and reports:
+
+  - p50/p95/p99 latency per stage (triage, image encode, call_gemini, end-to-end)
+  - requests/sec at several concurrency levels
+  - peak RSS
+
+Results are saved as JSON; pass --compare to diff against an earlier run and
+exit non-zero when any stage's p95 regressed beyond --tolerance.
+
+--imports instead measures cold-start import time of core, batch, server and
+app in fresh interpreters, and which heavy dependencies each one loads.
+
+Backends:
+  live   real Gemini calls (needs GEMINI_API_KEY)
+  stub   in-process fake model with --stub-latency-ms, for measuring local overhead
+  fake   the real SDK over HTTP against fake_gemini.py: a server started in-process
+         with --stub-latency-ms, or an already running one given by --endpoint
+
+Usage:
+    python benchmark.py --backend stub --requests 50 --concurrency 1 4 16 -o bench.json
+    python benchmark.py --backend live --requests 20 --compare bench.json
+    python benchmark.py --backend fake --endpoint http://127.0.0.1:8765
+    python benchmark.py --imports --runs 7
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+
+from PIL import Image, ImageFilter
+
+import core
+import fake_gemini
+import triage
+
+PHOTO_SIZES = {"small": (640, 480), "medium": (1920, 1440), "large": (4032, 3024)}
+DEFAULT_CONCURRENCY = [1, 4, 16]
+
+IMPORT_TARGETS = ["core", "batch", "server", "app"]
+# Dependencies that dominate cold start when imported eagerly
+HEAVY_MODULES = ["google.generativeai", "streamlit", "PIL.Image", "dotenv", "http.server"]
+
+
+# ---------------------------------------------------------------------------
+# WORKLOAD
+# ---------------------------------------------------------------------------
+
+def scenario_messages():
+    """The demo scenario texts, skipping the placeholder entry."""
+    return [s["text"] for s in core.DEMO_SCENARIOS.values() if s["text"]]
+
+
+def synthetic_photo(size, seed=0):
+    """A noisy, blurred JPEG that compresses roughly like a real phone photo."""
+    rng = random.Random(seed)
+    small = Image.new("RGB", (size[0] // 8, size[1] // 8))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+                   for _ in range(small.width * small.height)])
+    image = small.resize(size, Image.Resampling.BILINEAR).filter(ImageFilter.GaussianBlur(2))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def build_workload(count, photo_mix=("none", "small", "medium", "large")):
+    """count (message, photo_label, photo_bytes) items cycling through scenarios and photo sizes."""
+    messages = scenario_messages()
+    photos = {label: synthetic_photo(size, seed=i) for i, (label, size) in enumerate(PHOTO_SIZES.items())}
+    workload = []
+    for i in range(count):
+        label = photo_mix[i % len(photo_mix)]
+        workload.append((messages[i % len(messages)], label, photos.get(label)))
+    return workload
+
+
+# ---------------------------------------------------------------------------
+# BACKENDS
+# ---------------------------------------------------------------------------
+
+_STUB_RESPONSE = {
+    "work_order": {
+        "id": "WO-0000",
+        "category": "PLUMBING",
+        "severity": "HIGH",
+        "description": "Benchmark stub response.",
+        "severity_reasoning": "Stub backend — no photo analysed.",
+        "tenant_details": "n/a",
+    },
+    "tenant_reply": "Hi — sorry you're dealing with that. I've got it handled and someone will be in touch shortly.",
+    "suggested_actions": ["Dispatch plumber within 4 hours"],
+    "log_entry": "2025-01-01 00:00 | WO-0000 | HIGH | PLUMBING | benchmark stub",
+    "red_flags": [],
+}
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubModel:
+    """Stands in for GenerativeModel: sleeps for a jittered latency, returns a canned work order."""
+
+    def __init__(self, latency_ms=800, jitter=0.25):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+
+    def generate_content(self, parts, stream=False, generation_config=None, request_options=None):
+        delay = self.latency_ms / 1000 * random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(delay)
+        return _StubResponse(json.dumps(_STUB_RESPONSE))
+
+
+@contextmanager
+def stub_backend(latency_ms):
+    """Route call_gemini to a StubModel for the duration of the block."""
+    original = core._model_for
+    model = StubModel(latency_ms)
+    core._model_for = lambda api_key, model_name: model
+    try:
+        yield
+    finally:
+        core._model_for = original
+
+
+@contextmanager
+def fake_backend(latency_ms, endpoint=None):
+    """Point call_gemini at a fake_gemini server: the one at endpoint, or a fresh in-process one."""
+    server = None
+    if endpoint is None:
+        profile = fake_gemini.FaultProfile(latency_ms=latency_ms, latency_dist="uniform", jitter=0.25)
+        server, endpoint = fake_gemini.start(fake_gemini.FakeGemini(profile=profile))
+    previous = os.environ.get("GEMINI_API_ENDPOINT")
+    os.environ["GEMINI_API_ENDPOINT"] = endpoint
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("GEMINI_API_ENDPOINT", None)
+        else:
+            os.environ["GEMINI_API_ENDPOINT"] = previous
+        if server is not None:
+            server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# MEASUREMENT
+# ---------------------------------------------------------------------------
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    ms = [s * 1000 for s in samples]
+    if not ms:
+        return {"count": 0}
+    return {
+        "count": len(ms),
+        "p50": round(percentile(ms, 50), 2),
+        "p95": round(percentile(ms, 95), 2),
+        "p99": round(percentile(ms, 99), 2),
+        "max": round(max(ms), 2),
+    }
+
+
+def run_one(message, photo_bytes, api_key, use_cache):
+    """Process one item, returning (stage timings in seconds, ok)."""
+    timings = {}
+    started = time.perf_counter()
+
+    t = time.perf_counter()
+    triage.classify(message)
+    timings["triage"] = time.perf_counter() - t
+
+    image_data = None
+    if photo_bytes is not None:
+        t = time.perf_counter()
+        image_data = core.encode_image_to_base64(BytesIO(photo_bytes))
+        timings["image_encode"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    result = core.call_gemini(message, image_data, api_key, use_cache=use_cache)
+    timings["call_gemini"] = time.perf_counter() - t
+
+    timings["end_to_end"] = time.perf_counter() - started
+    return timings, "error" not in result
+
+
+def run_level(workload, concurrency, api_key, use_cache):
+    """Run the workload at one concurrency level. Returns (per-stage samples, throughput row)."""
+    samples = {}
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_one, m, photo, api_key, use_cache) for m, _, photo in workload]
+        for future in futures:
+            timings, ok = future.result()
+            errors += 0 if ok else 1
+            for stage, seconds in timings.items():
+                samples.setdefault(stage, []).append(seconds)
+    elapsed = time.perf_counter() - started
+    return samples, {
+        "concurrency": concurrency,
+        "requests": len(workload),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(workload) / elapsed, 2) if elapsed else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_benchmark(requests=40, concurrency_levels=DEFAULT_CONCURRENCY, api_key=None, use_cache=False):
+    """Run every concurrency level over the same workload and return the report dict."""
+    workload = build_workload(requests)
+
+    # Photo encoding on its own, per size, so image cost is visible independently of the model
+    image_samples = {}
+    for label, size in PHOTO_SIZES.items():
+        photo = synthetic_photo(size)
+        runs = []
+        for _ in range(5):
+            t = time.perf_counter()
+            core.encode_image_to_base64(BytesIO(photo))
+            runs.append(time.perf_counter() - t)
+        image_samples[label] = dict(summarize(runs), bytes=len(photo))
+
+    stages = {}
+    throughput = []
+    for level in concurrency_levels:
+        samples, row = run_level(workload, level, api_key, use_cache)
+        throughput.append(row)
+        for stage, values in samples.items():
+            stages.setdefault(stage, []).extend(values)
+
+    return {
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+        "image_encode_by_size": image_samples,
+        "throughput": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def import_times(targets=IMPORT_TARGETS, runs=5):
+    """
+    Cold import time of each target module, measured in fresh interpreters
+    (median and best of runs, in ms), plus which HEAVY_MODULES it pulled in.
+    """
+    probe = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import {module}\n"
+        "elapsed = time.perf_counter() - started\n"
+        "print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Keep the probes from opening the work-order database
+    env = {**os.environ, "MINIMASON_DB_PATH": ""}
+    report = {}
+    for module in targets:
+        samples, loaded = [], []
+        for _ in range(runs):
+            completed = subprocess.run(
+                [sys.executable, "-c", probe.format(module=module, heavy=HEAVY_MODULES)],
+                cwd=here, env=env, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(f"import {module} failed:\n{completed.stderr}")
+            elapsed, loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+            samples.append(elapsed * 1000)
+        report[module] = {
+            "median_ms": round(statistics.median(samples), 1),
+            "min_ms": round(min(samples), 1),
+            "loaded": loaded,
+        }
+    return report
+
+
+def compare(current, baseline, tolerance):
+    """Return a list of human-readable p95 regressions beyond tolerance (a fraction, e.g. 0.2)."""
+    regressions = []
+    for stage, summary in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage, {}).get("p95")
+        after = summary.get("p95")
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {before}ms → {after}ms (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _print_report(report):
+    print(f"{'stage':<14}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, s in report["stages"].items():
+        if s["count"]:
+            print(f"{stage:<14}{s['count']:>7}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}")
+    print()
+    for label, s in report["image_encode_by_size"].items():
+        print(f"image {label:<8} {s['bytes'] / 1024:>8.0f} KB in, p50 {s['p50']}ms")
+    print()
+    for row in report["throughput"]:
+        print(f"concurrency {row['concurrency']:>3}: {row['requests_per_sec']:>7} req/s "
+              f"({row['requests']} requests, {row['errors']} errors, {row['seconds']}s)")
+    print(f"\npeak RSS: {report['peak_rss_mb']} MB")
+
+
+def _print_imports(report):
+    print(f"{'module':<10}{'median':>10}{'best':>10}  heavy dependencies loaded")
+    for module, s in report.items():
+        print(f"{module:<10}{s['median_ms']:>8}ms{s['min_ms']:>8}ms  {', '.join(s['loaded']) or '—'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MiniMason pipeline.")
+    parser.add_argument("--backend", choices=["live", "stub", "fake"], default="stub")
+    parser.add_argument("--stub-latency-ms", type=float, default=800, help="Mean model latency for the stub/fake backends.")
+    parser.add_argument("--endpoint", help="URL of a running fake_gemini.py server (fake backend).")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per concurrency level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache on (off by default).")
+    parser.add_argument("-o", "--output", help="Write the JSON report here.")
+    parser.add_argument("--compare", help="Baseline JSON report to check for p95 regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown vs baseline (0.2 = 20%%).")
+    parser.add_argument("--imports", action="store_true", help="Measure cold-start import times instead.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module for --imports.")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        report = {"imports": import_times(runs=args.runs), "python": platform.python_version()}
+        _print_imports(report["imports"])
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    api_key = core.get_api_key()
+    if args.backend == "live" and not api_key:
+        print("No API key configured. Please set GEMINI_API_KEY.", file=sys.stderr)
+        return 1
+
+    if args.backend == "stub":
+        backend = stub_backend(args.stub_latency_ms)
+    elif args.backend == "fake":
+        backend = fake_backend(args.stub_latency_ms, args.endpoint)
+    else:
+        backend = nullcontext()
+    with backend:
+        report = run_benchmark(args.requests, args.concurrency, api_key or args.backend, args.cache)
+
+    report["meta"] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": args.backend,
+        "stub_latency_ms": args.stub_latency_ms if args.backend != "live" and not args.endpoint else None,
+        "endpoint": args.endpoint,
+        "models": core.MODEL_NAMES,
+        "cache": args.cache,
+        "python": platform.python_version(),
+    }
+
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions vs baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 2
+        print("\nNo p95 regressions vs baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1272 @@
+"""
+MiniMason — Core Pipeline
+
+Everything except the Streamlit UI: the system prompt, photo preprocessing,
+the Gemini call paths (sync, async, streaming, split) with caching, failover
+and repeat-report detection, and post-processing. app.py, batch.py,
+benchmark.py and server.py all build on it.
+
+Importing this module is cheap. google.generativeai and Pillow are imported
+on first use, and python-dotenv only when a .env file exists, so a worker
+that just needs _post_process or the severity helpers starts in
+milliseconds. benchmark.py --imports measures it.
+"""
+
+import base64
+import copy
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+from io import BytesIO
+
+
+def _load_dotenv():
+    """Load .env from the working directory or next to this file, importing python-dotenv only if one exists."""
+    for directory in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+
+# Before the local imports, so their MINIMASON_* settings see .env too
+_load_dotenv()
+
+import dedup  # noqa: E402
+import failover  # noqa: E402
+import metrics  # noqa: E402
+import partial_json  # noqa: E402
+import prompt_cache  # noqa: E402
+import regenerate  # noqa: E402
+import response_cache  # noqa: E402
+import singleflight  # noqa: E402
+import splitter  # noqa: E402
+import store  # noqa: E402
+import threads  # noqa: E402
+import triage  # noqa: E402
+import usage  # noqa: E402
+import validator  # noqa: E402
+
+# ---------------------------------------------------------------------------
+# THE SYSTEM PROMPT — The Secret Sauce
+# ---------------------------------------------------------------------------
+# This is the heart of MiniMason. It's a ~2500-word manifesto that defines
+# exactly how the AI should behave as a maintenance coordinator. Every word
+# is intentional.
+
+SYSTEM_PROMPT = """You are MiniMason — the suave and gentle AI maintenance coordinator for property managers at Mason.
+
+You turn messy, emotional, late-night tenant messages (and blurry photos) into calm, professional, immediately actionable work.
+
+=== NON-NEGOTIABLE RULES ===
+
+1. Unit of Work Principle (Michael's most important architectural primitive)
+   - ONE work order = ONE primary issue only.
+   - Never bundle unrelated issues into the same work order.
+   - If tenant mentions multiple issues, handle ONLY the most urgent one in this work order.
+   - In tenant_reply and suggested_actions, explicitly say other issues will get separate work orders.
+   - This prevents context poisoning and keeps conversations clean.
+
+2. Tone — Suave & Gentle
+   - Calm, confident, warm, human, in-control.
+   - Short natural sentences. No corporate jargon. No filler.
+   - You sound like a competent friend who happens to manage their building — not a chatbot.
+
+   GOOD examples (use as templates):
+   - "Hi — sorry you're dealing with that. I've got it handled."
+   - "We'll get this sorted for you today."
+   - "Thanks for the heads up. I'm sending someone over."
+   - "That's a smart call reporting this now — we'll take care of it."
+
+   NEVER say (these are banned phrases):
+   - "Your comfort and safety are our priority" (corporate robot)
+   - "We understand your frustration with these ongoing issues" (dismissive template)
+   - "I understand your concern" (robotic)
+   - "Per our records..." / "As per policy..." (cold)
+   - "We sincerely apologize for the inconvenience" (over-formal)
+   - "Rest assured" (nobody talks like this)
+
+3. Reply Length
+   - tenant_reply must be maximum 4 sentences, roughly 80-110 words.
+   - Real text-message length. If someone read this on their phone at 2 AM it should feel human and helpful.
+
+4. Severity Classification (hardcoded — follow exactly)
+
+   EMERGENCY (respond < 1 hour):
+   - Active flooding near electrical panels/outlets
+   - Gas smell or suspected gas leak
+   - Sparks, scorch marks, or burning smell from electrical
+   - Structural collapse risk (ceiling sagging, wall cracking)
+   - No heat when outdoor temp < 32°F
+
+   HIGH (respond < 4 hours):
+   - Active water leak onto floor (not near electrical)
+   - No heat in winter (above freezing but cold)
+   - No AC in summer when indoor temp > 85°F
+   - Security concern (broken locks/windows on ground floor)
+   - Sewage backup, water heater failure
+
+   MEDIUM (respond 24-48 hours):
+   - Appliance not working (dishwasher, disposal, washer/dryer)
+   - Minor plumbing (slow drain, running toilet, dripping faucet)
+   - Non-urgent HVAC (uneven heating, strange noises)
+   - Single pest sighting
+
+   LOW (respond 3-7 days):
+   - Cosmetic issues (paint, scuffs, minor drywall)
+   - Squeaky doors/floors, loose hardware
+   - Weather stripping, routine items
+
+   Special rules:
+   - Single-bathroom unit + toilet issue = always HIGH
+   - Any water near electrical = EMERGENCY
+   - Mold > 1 sq ft = HIGH
+   - "It's been like this for weeks" + safety issue = escalate severity
+
+5. Image Analysis
+   - Analyze blurry, dark, shaky iPhone photos for: damage extent, water spread, safety hazards, object identification.
+   - Always reference the photo explicitly in severity_reasoning.
+   - If text and photo contradict, trust the photo.
+   - If no photo attached, state: "No photo attached — visual extent unknown."
+
+6. Red Flag Detection
+   Flag these patterns in the red_flags array:
+   - FRUSTRATION_ESCALATION: Tenant references rent, threatens legal action, or mentions previous unresolved requests
+   - SCOPE_CREEP: Tenant bundles multiple unrelated issues ("while you're here, also fix...")
+   - VENDOR_UPSELL: Tenant suggests using their own contractor or deducting repair costs from rent
+   - SELF_DIAGNOSIS: Tenant specifies exact parts or solutions from YouTube/internet research
+   - RENT_WITHHOLDING: Tenant threatens to withhold rent or deduct costs
+   - DELAYED_REPORTING: Safety issue has persisted for weeks/months without reporting
+
+7. Output Format — STRICT JSON only
+   Respond with ONLY a valid JSON object. No markdown, no code fences, no preamble.
+
+{
+  "work_order": {
+    "id": "WO-XXXX (random 4-digit number)",
+    "category": "PLUMBING | ELECTRICAL | APPLIANCE | HVAC | PEST | STRUCTURAL | SAFETY | GENERAL",
+    "severity": "EMERGENCY | HIGH | MEDIUM | LOW",
+    "description": "1-2 sentence factual summary for the maintenance tech. Professional, specific, no fluff.",
+    "severity_reasoning": "ONE short sentence explaining why this severity was chosen. Reference photo if present.",
+    "tenant_details": "Relevant context from the tenant's message — name/unit if mentioned, timeline, key details."
+  },
+  "tenant_reply": "Ready-to-send text message. Max 4 sentences, ~80-110 words. Suave and gentle. Must include: what you're doing about it and when they'll hear back. If multiple issues mentioned, note that other issues will be handled separately.",
+  "suggested_actions": [
+    "Max 5 specific, timed, actionable items with clear ownership",
+    "Example: 'Dispatch after-hours plumber within 1 hour'",
+    "Example: 'Schedule follow-up moisture check in 48 hours'"
+  ],
+  "log_entry": "YYYY-MM-DD HH:MM | WO-XXXX | SEVERITY | CATEGORY | short summary",
+  "red_flags": ["FLAG_TYPE: brief explanation — or empty array if none detected"]
+}
+
+Remember: you are suave and gentle. You are the calm professional who makes chaos feel handled. Every word should feel like it came from the best property manager someone has ever had.
+"""
+
+# ---------------------------------------------------------------------------
+# DEMO SCENARIOS — 10 Realistic Maintenance Requests
+# ---------------------------------------------------------------------------
+
+DEMO_SCENARIOS = {
+    "— Select a demo scenario —": {
+        "text": "",
+        "description": "",
+    },
+    "🚽 Scenario 1: Clogged Toilet Overflow (2 AM)": {
+        "text": "My toilet is overflowing everywhere!! Water all over the bathroom floor its 2am and I dont know what to do theres water going into the hallway help!! I tried plunging it but it just keeps coming. This is my only bathroom.",
+        "description": "The signature messy request — panicked tenant, 2 AM, blurry photos, water spreading.",
+    },
+    "⚡ Scenario 2: Sparking Electrical Outlet": {
+        "text": "There's black marks around my kitchen outlet and I saw sparks when I plugged in my toaster this morning. It smells like burning plastic. Is this dangerous?? I unplugged everything from that outlet but I'm scared to use the kitchen.",
+        "description": "Electrical emergency — scorch marks, sparking, burning smell. Clear EMERGENCY classification.",
+    },
+    "❄️ Scenario 3: No Heat in Winter": {
+        "text": "Hey our heater stopped working last night and its 28 degrees outside. The thermostat is set to 72 but nothing happens when it kicks on. My kids are sleeping in their winter coats. We've been using the oven to stay warm which I know isn't ideal.",
+        "description": "HVAC failure below freezing with children. Using oven for heat = additional safety concern.",
+    },
+    "💧 Scenario 4: Mysterious Ceiling Water Stain": {
+        "text": "There's a weird brownish stain on my living room ceiling that I don't think was there before. It's not dripping or anything but it looks like water damage maybe? Not sure if I should worry about it.",
+        "description": "Ambiguous severity — no active drip but potential hidden leak. Good tenant who reported early.",
+    },
+    "🔧 Scenario 5: Garbage Disposal + Self-Diagnosis": {
+        "text": "My garbage disposal is jammed and making a humming noise. I watched a YouTube video and I think the flywheel is stuck. I already tried the allen wrench thing from underneath but it won't budge. I think I need a new InSinkErator Evolution Excel 1HP — can you just order one and I'll install it?",
+        "description": "Self-diagnosis red flag — tenant wants specific part and to self-install. Redirect diplomatically.",
+    },
+    "🌡️ Scenario 6: AC Not Cooling in Summer": {
+        "text": "AC has been running nonstop for 3 days but the apartment is still 87 degrees. I pay $2,100/month for this place and I can't even sleep at night. My electric bill is going to be insane. Also while someone is here can they look at the squeaky closet door and the dripping bathroom faucet?",
+        "description": "HVAC in summer heat + rent frustration + scope creep (bundled unrelated requests).",
+    },
+    "🐭 Scenario 7: Rodent Sighting": {
+        "text": "I saw a mouse run across my kitchen floor last night. This is absolutely disgusting. I keep a clean apartment and I'm not paying $2,200 a month to live with rodents. I want this dealt with TODAY or I'm calling the health department.",
+        "description": "Pest report with emotional escalation, rent reference, and health department threat.",
+    },
+    "🔒 Scenario 8: Broken Window Lock": {
+        "text": "The lock on my bedroom window is broken — it won't latch closed. I'm on the ground floor and it's making me nervous especially at night. I jammed a stick in the track for now but that's obviously not a real solution.",
+        "description": "Security concern on ground floor. Tenant improvised a temporary fix. Safety-priority.",
+    },
+    "🟤 Scenario 9: Bathroom Mold": {
+        "text": "There's black mold growing on my bathroom ceiling and it's spreading. It started as a small spot a few months ago but now its about 2 feet across. My daughter has asthma and I'm worried about the air quality. This has been an ongoing issue since we moved in.",
+        "description": "Mold > 1 sq ft = HIGH. Delayed reporting + health concern (child with asthma). Liability implications.",
+    },
+    "😤 Scenario 10: Rent Frustration + Bundled Requests": {
+        "text": "I've submitted THREE maintenance requests in the past two months and nothing has been fixed. The kitchen faucet still drips, the bedroom door doesn't close properly, and now the dishwasher is leaking onto the floor. I'm done being patient. If this isn't resolved this week I'm withholding rent and contacting a lawyer. My brother is a licensed plumber and he said he can fix everything for $500 — can I just deduct that from rent?",
+        "description": "Maximum red flags: frustration escalation, rent withholding threat, bundled requests, vendor upsell.",
+    },
+}
+
+# ---------------------------------------------------------------------------
+# HELPER FUNCTIONS
+# ---------------------------------------------------------------------------
+
+def get_api_key():
+    """Retrieve the Gemini API key from the environment (app.py also checks Streamlit secrets)."""
+    key = os.environ.get("GEMINI_API_KEY", None)
+    if key and key != "your_api_key_here":
+        return key
+
+    return None
+
+
+# Longest edge sent to the model. Gemini tiles images at ~768px, so anything much
+# larger only adds upload time. Override with MINIMASON_IMAGE_MAX_EDGE.
+IMAGE_MAX_EDGE = int(os.environ.get("MINIMASON_IMAGE_MAX_EDGE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("MINIMASON_IMAGE_QUALITY", "85"))
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def _read_image_bytes(uploaded_file):
+    """Read raw bytes from an upload, file-like object, or filesystem path."""
+    if hasattr(uploaded_file, "read"):
+        return uploaded_file.read()
+    with open(uploaded_file, "rb") as f:
+        return f.read()
+
+
+def _to_rgb(image):
+    """Convert any Pillow mode to RGB, flattening transparency onto white."""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    if image.mode in ("I", "F") or image.mode.startswith("I;16"):
+        # High bit-depth grayscale: stretch to 8 bits instead of clipping to white
+        image = image.convert("F")
+        lo, hi = image.getextrema()
+        scale = 255.0 / (hi - lo) if hi > lo else 1.0
+        image = image.point(lambda v: (v - lo) * scale).convert("L")
+    if image.mode in ("RGBA", "LA", "RGBa", "La", "PA"):
+        from PIL import Image
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    try:
+        return image.convert("RGB")
+    except ValueError:
+        # Modes without a direct RGB conversion (e.g. LAB) go via RGBA
+        return image.convert("RGBA").convert("RGB")
+
+
+def preprocess_image(uploaded_file, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    """
+    Prepare an upload for the model: apply the EXIF orientation, downscale so the
+    longest edge is at most max_edge, convert to RGB and encode as JPEG.
+    Returns (jpeg_bytes, stats) where stats records sizes before and after.
+    """
+    from PIL import Image, ImageOps
+
+    raw = _read_image_bytes(uploaded_file)
+    image = Image.open(BytesIO(raw))
+    original_size = image.size
+    orientation = image.getexif().get(_EXIF_ORIENTATION, 1)
+
+    # Small, upright JPEGs are already in the right shape — send them as-is
+    if (
+        image.format == "JPEG"
+        and max(image.size) <= max_edge
+        and orientation == 1
+        and image.mode in ("RGB", "L")
+    ):
+        data = raw
+        encoded_size = image.size
+    else:
+        if image.format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full resolution
+            image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image = _to_rgb(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        data = buffer.getvalue()
+        encoded_size = image.size
+
+    stats = {
+        "original_bytes": len(raw),
+        "encoded_bytes": len(data),
+        "original_size": list(original_size),
+        "encoded_size": list(encoded_size),
+    }
+    return data, stats
+
+
+def encode_image_to_base64(uploaded_file, stats=None):
+    """
+    Convert an uploaded image file to base64 string for the Gemini API.
+    If a stats dict is passed, it is filled with the before/after sizes and
+    the encode time, or with "error" when the image can't be read. Returns
+    None on failure; callers decide how to report it.
+    """
+    try:
+        started = time.perf_counter()
+        data, image_stats = preprocess_image(uploaded_file)
+        encoded = base64.b64encode(data).decode("utf-8")
+        elapsed = time.perf_counter() - started
+        metrics.STAGE_LATENCY.observe(elapsed, stage="image_encode")
+        if stats is not None:
+            stats.update(image_stats, encode_ms=round(elapsed * 1000, 2))
+        return encoded
+    except Exception as e:
+        if stats is not None:
+            stats["error"] = str(e)
+        return None
+
+
+# Models to try, in order of preference
+# Failover order: a failed or circuit-broken model hands the request to the next one
+MODEL_NAMES = ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-1.5-flash"]
+
+# Model calls per request, across failovers and retries
+MAX_ATTEMPTS = 3
+
+# Per-call deadline in seconds. The SDK's built-in retry (up to 10 minutes on
+# 503s) is switched off so a failing model reaches the failover logic at once.
+MODEL_TIMEOUT = float(os.environ.get("MINIMASON_MODEL_TIMEOUT", "60"))
+_REQUEST_OPTIONS = {"retry": None, "timeout": MODEL_TIMEOUT}
+
+# Expected response fields; object fields list their required sub-keys
+RESULT_SCHEMA = {
+    "work_order": ["id", "category", "severity", "description", "severity_reasoning", "tenant_details"],
+    "tenant_reply": None,
+    "suggested_actions": None,
+    "log_entry": None,
+    "red_flags": None,
+}
+
+# Cap on concurrent in-flight calls made through call_gemini_async
+ASYNC_CONCURRENCY = int(os.environ.get("MINIMASON_ASYNC_CONCURRENCY", "16"))
+
+_async_limiters = weakref.WeakKeyDictionary()
+_async_models = weakref.WeakKeyDictionary()
+
+
+# Generation settings shared by every request; part of the model registry key.
+# MAX_OUTPUT_TOKENS is the ceiling; each request asks for usage.output_cap().
+TEMPERATURE = float(os.environ.get("MINIMASON_TEMPERATURE", "0.7"))
+MAX_OUTPUT_TOKENS = usage.MAX_OUTPUT_TOKENS
+
+# Changes whenever the prompt or generation settings do, invalidating cached responses
+PROMPT_VERSION = response_cache.prompt_fingerprint(SYSTEM_PROMPT, TEMPERATURE, MAX_OUTPUT_TOKENS)
+
+_configure_lock = threading.Lock()
+_configured = None
+
+
+def api_endpoint():
+    """
+    Alternate API base URL from GEMINI_API_ENDPOINT (e.g. the local stand-in in
+    fake_gemini.py), or None for the real service.
+    """
+    return os.environ.get("GEMINI_API_ENDPOINT") or None
+
+
+def _configure(api_key):
+    """Point the SDK's default clients at api_key, skipping the reset if it's already set."""
+    global _configured
+    endpoint = api_endpoint()
+    with _configure_lock:
+        if _configured != (api_key, endpoint):
+            import google.generativeai as genai
+            if endpoint:
+                # Plain-HTTP endpoints only work over REST; gRPC needs TLS
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            _configured = (api_key, endpoint)
+
+
+def _generation_config(temperature, max_output_tokens):
+    import google.generativeai as genai
+    return genai.GenerationConfig(
+        response_mime_type="application/json",
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+    )
+
+
+def _new_model(model_name, temperature, max_output_tokens, system_instruction=SYSTEM_PROMPT):
+    import google.generativeai as genai
+    return genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction,
+        generation_config=_generation_config(temperature, max_output_tokens),
+    )
+
+
+def _cached_prompt_model(api_key, model_name):
+    """
+    A model that references SYSTEM_PROMPT as cached content instead of sending
+    it, or None when prompt caching is off or unavailable for this model.
+    """
+    if not prompt_cache.enabled():
+        return None
+    cache = prompt_cache.shared(SYSTEM_PROMPT).get((api_key, model_name, api_endpoint()), model_name)
+    if cache is None:
+        return None
+    import google.generativeai as genai
+    return genai.GenerativeModel.from_cached_content(
+        cache, generation_config=_generation_config(TEMPERATURE, MAX_OUTPUT_TOKENS)
+    )
+
+
+def _report_model_error(api_key, model_name, error):
+    """Let the prompt cache fall back to the plain model if a call failed because of it."""
+    if prompt_cache.enabled():
+        prompt_cache.shared(SYSTEM_PROMPT).report_error((api_key, model_name, api_endpoint()), error)
+
+
+@functools.lru_cache(maxsize=None)
+def get_model(api_key, model_name, temperature=TEMPERATURE, max_output_tokens=MAX_OUTPUT_TOKENS, endpoint=None):
+    """
+    Process-wide registry of configured GenerativeModel instances, keyed by
+    (api key, model name, generation config, endpoint). Built once and shared
+    across Streamlit sessions and non-UI callers, so the client connection stays warm.
+    """
+    _configure(api_key)
+    return _new_model(model_name, temperature, max_output_tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def _regeneration_model(api_key, model_name, endpoint=None):
+    """The model for field regeneration: regenerate.SYSTEM_PROMPT and a small output cap."""
+    _configure(api_key)
+    return _new_model(model_name, TEMPERATURE, regenerate.MAX_OUTPUT_TOKENS, regenerate.SYSTEM_PROMPT)
+
+
+def _model_for(api_key, model_name):
+    """The model for model_name, configured for api_key: prompt-cached if enabled, else the registered one."""
+    _configure(api_key)
+    return _cached_prompt_model(api_key, model_name) or get_model(api_key, model_name, endpoint=api_endpoint())
+
+
+async def _async_model_for(api_key, model_name):
+    """
+    Like _model_for, but cached per event loop: the SDK's async client is bound
+    to the loop it was first used on, so async models can't be shared across loops.
+    """
+    # asyncio is imported only by the async paths; a running loop means it is already loaded
+    import asyncio
+
+    _configure(api_key)
+    if prompt_cache.enabled() and not prompt_cache.shared(SYSTEM_PROMPT).ready((api_key, model_name, api_endpoint())):
+        # Creating or refreshing the cached content is a blocking round trip; keep it off the loop
+        cached = await asyncio.to_thread(_cached_prompt_model, api_key, model_name)
+    else:
+        cached = _cached_prompt_model(api_key, model_name)
+    if cached is not None:
+        # Cheap to build; its async client binds to this loop on first use
+        return cached
+    models = _async_models.setdefault(asyncio.get_running_loop(), {})
+    key = (api_key, model_name, TEMPERATURE, MAX_OUTPUT_TOKENS, api_endpoint())
+    if key not in models:
+        models[key] = _new_model(model_name, TEMPERATURE, MAX_OUTPUT_TOKENS)
+    return models[key]
+
+
+def _next_attempt(pool, tried, attempt):
+    """
+    Choose the model for this attempt: the next healthy model in MODEL_NAMES
+    that hasn't been tried. Returns (model_name, seconds to back off first);
+    backoff only applies when there is nothing left to fail over to.
+    """
+    model_name = pool.pick(MODEL_NAMES, tried)
+    if model_name in tried:
+        metrics.RETRIES.inc(model=model_name)
+        return model_name, 2 ** (attempt - 1)  # Exponential backoff: 1s, 2s
+    if tried:
+        metrics.FAILOVERS.inc(model=tried[-1])
+    return model_name, 0
+
+
+def _record_usage(result, usage_metadata, model_name, latency=None, kind="request",
+                  max_output_tokens=None, truncated=False):
+    """
+    Record one model call with usage.record() and add its tokens, latency and
+    cost to "_usage". Counts accumulate, so a request's field regenerations are
+    billed to it too. Full requests also feed the adaptive output budget.
+    Calls whose output failed to parse are still counted; they were billed.
+    """
+    if not usage_metadata:
+        return result
+    tokens = usage.counts(usage_metadata)
+    call = usage.record(model_name, tokens, latency, kind, max_output_tokens)
+    if kind == "request":
+        usage.get_budget().observe(tokens["output_tokens"], truncated)
+    if "error" not in result:
+        previous = result.get("_usage") or {}
+        result["_usage"] = {k: round(previous.get(k, 0) + v, 8) for k, v in call.items()}
+    return result
+
+
+def _truncated(response):
+    """Whether a response (or final stream chunk) stopped at max_output_tokens."""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return False
+    return getattr(reason, "name", reason) == "MAX_TOKENS"
+
+
+def _note_attempts(result, tried):
+    """Record the models a request went through when it needed more than one."""
+    if len(tried) > 1 and "error" not in result:
+        result["_models_tried"] = list(tried)
+    return result
+
+
+def _build_parts(tenant_message, image_data=None, context=None):
+    """
+    Build the prompt parts for a tenant message and optional base64 JPEG.
+    context (an earlier conversation, see threads.py) goes before the message.
+    """
+    parts = []
+
+    if image_data:
+        parts.append({
+            "inline_data": {
+                "mime_type": "image/jpeg",
+                "data": image_data,
+            }
+        })
+        parts.append(
+            f"The tenant submitted the following maintenance request along with the attached photo.\n\n"
+            f"TENANT MESSAGE:\n{tenant_message}\n\n"
+            f"Analyze both the text and the photo carefully. Reference specific visual details from the photo in your assessment."
+        )
+    else:
+        parts.append(
+            f"The tenant submitted the following maintenance request (no photo attached).\n\n"
+            f"TENANT MESSAGE:\n{tenant_message}\n\n"
+            f"Note: No photo was provided. If a photo would help with assessment, mention this in your tenant_reply."
+        )
+    if context:
+        parts[-1] = f"{context}\n\n{parts[-1]}"
+
+    return parts
+
+
+def _parse_response(text, model_used, timings=None, regenerate_fields=None):
+    """
+    Parse the model's JSON text into a post-processed result or an error dict.
+    Damaged output (truncated at max_output_tokens, fenced, trailing garbage) is
+    repaired field by field; anything unrecoverable is listed in "_lost_fields".
+    The validator's local fixes (enum case, banned phrases, reply trimming)
+    run first; regenerate_fields(result), when given, then re-asks only for
+    the fields that are still lost or invalid.
+    """
+    timings = timings or metrics.Timings()
+    with timings.stage("parse"):
+        try:
+            result = json.loads(text)
+            lost = partial_json.lost_fields(result, RESULT_SCHEMA)
+        except json.JSONDecodeError:
+            result, lost = partial_json.repair(text, RESULT_SCHEMA)
+            if result:
+                result["_repaired"] = True
+
+    if not result:
+        metrics.ERRORS.inc(kind="parse")
+        return {
+            "error": "The model returned a response that couldn't be parsed as JSON.",
+            "raw_response": text[:500],
+        }
+
+    if lost:
+        result["_lost_fields"] = lost
+
+    result["_model_used"] = model_used
+    notes = []
+    if regenerate_fields is not None:
+        # Fix what can be fixed for free before paying for a model call
+        with timings.stage("post_process"):
+            result, findings = validator.enforce(result)
+            remaining = set(validator.check(result))
+            notes = [f for f in findings if f not in remaining]
+        result = regenerate_fields(result)
+        lost = result.get("_lost_fields", [])
+    with timings.stage("post_process"):
+        result = _post_process(result, notes)
+    if lost:
+        result.setdefault("_warnings", []).append(
+            f"⚠️ Response was incomplete — missing {', '.join(lost)}. Re-run to regenerate those fields."
+        )
+    return result
+
+
+def _cache_key(tenant_message, image_data, context=None):
+    text = f"{context}\n\n{tenant_message}" if context else tenant_message
+    return response_cache.make_key(text, image_data, MODEL_NAMES, PROMPT_VERSION)
+
+
+def _cache_lookup(key):
+    """Return a cached result tagged with its tier in "_cache", or None."""
+    cached, tier = response_cache.get_cache().get(key)
+    if cached is not None:
+        cached["_cache"] = f"hit:{tier}"
+        metrics.CACHE_HITS.inc(tier=tier)
+    else:
+        metrics.CACHE_MISSES.inc()
+    return cached
+
+
+def _cache_store(key, result):
+    """Cache successful results and tag them as a miss; errors and incomplete results are never cached."""
+    if "error" not in result and "_lost_fields" not in result:
+        response_cache.get_cache().set(key, result)
+        result["_cache"] = "miss"
+    return result
+
+
+def _joined(result, timings, started):
+    """Tag a result received from another caller's identical in-flight request."""
+    timings.add("inflight_wait", time.perf_counter() - started)
+    result["_cache"] = "hit:inflight"
+    metrics.CACHE_HITS.inc(tier="inflight")
+    return result
+
+
+def _generate_shared(key, tenant_message, image_data, api_key, timings, context=None):
+    """
+    _generate plus cache store on a cache miss, coalesced with any identical
+    request already in flight in this process (from any session), so
+    simultaneous submissions of the same message make one model call.
+    """
+    def generate():
+        result = _generate(tenant_message, image_data, api_key, timings, context)
+        with timings.stage("cache_store"):
+            return _cache_store(key, result)
+
+    started = time.perf_counter()
+    result, shared = singleflight.get_group().do(key, generate)
+    return _joined(result, timings, started) if shared else result
+
+
+async def _generate_shared_async(key, tenant_message, image_data, api_key, timings, context=None):
+    """Async _generate_shared; waiting on another caller's request never blocks the event loop."""
+    async def generate():
+        result = await _generate_async(tenant_message, image_data, api_key, timings, context)
+        with timings.stage("cache_store"):
+            return _cache_store(key, result)
+
+    started = time.perf_counter()
+    result, shared = await singleflight.get_group().do_async(key, generate)
+    return _joined(result, timings, started) if shared else result
+
+
+def call_gemini(tenant_message, image_data=None, api_key=None, use_cache=True, context=None):
+    """
+    Call the Gemini API with the tenant message and optional image.
+    Returns the parsed JSON response or an error dict.
+    Identical submissions are served from the response cache unless use_cache is False.
+    context is earlier conversation to send with the message (see call_gemini_threaded).
+    """
+    if not api_key:
+        metrics.ERRORS.inc(kind="no_api_key")
+        return {"error": "No API key configured. Please add your GEMINI_API_KEY."}
+
+    timings = metrics.Timings()
+
+    # Rules run first so emergency alerts don't wait on the model
+    with timings.stage("triage"):
+        provisional = triage.classify(tenant_message)
+        triage.fire_alerts(tenant_message, provisional)
+
+    if not use_cache:
+        result = _generate(tenant_message, image_data, api_key, timings, context)
+    else:
+        key = _cache_key(tenant_message, image_data, context)
+        with timings.stage("cache_lookup"):
+            result = _cache_lookup(key)
+        if result is None:
+            result = _generate_shared(key, tenant_message, image_data, api_key, timings, context)
+
+    return _finish("sync", triage.cross_check(result, provisional), timings)
+
+
+def _finish(path, result, timings):
+    """Attach the request's stage timings as "_timings" and count the request."""
+    result["_timings"] = timings.to_dict()
+    if "error" in result:
+        outcome = "error"
+    elif result.get("_cache", "").startswith("hit"):
+        outcome = "cached"
+    elif result.get("_duplicate"):
+        outcome = "duplicate"
+    else:
+        outcome = "ok"
+    metrics.REQUESTS.inc(path=path, outcome=outcome)
+    return result
+
+
+def attach_image_stats(result, image_stats):
+    """Record photo preprocessing stats on a result, with the encode time as its first timing stage."""
+    if image_stats:
+        result["_image"] = image_stats
+        if "encode_ms" in image_stats:
+            timings = {"image_encode": image_stats["encode_ms"], **result.get("_timings", {})}
+            if "total" in timings:
+                timings["total"] = round(timings["total"] + image_stats["encode_ms"], 2)
+            result["_timings"] = timings
+    return result
+
+
+def attach_duplicate(tenant_message, image_data=None, scope=None):
+    """
+    The existing work order, tagged with "_duplicate", when tenant_message
+    repeats a recent report from the same scope (e.g. tenant or unit); None
+    when it is a new report or detection is off. Runs before any model call.
+    """
+    index = dedup.get_index()
+    if index is None:
+        return None
+    timings = metrics.Timings()
+    with timings.stage("dedup"):
+        match = index.find(tenant_message, image_data, scope)
+    if match is None:
+        return None
+    result = {k: v for k, v in match.result.items() if k not in ("_cache", "_timings", "_models_tried", "_usage")}
+    result["_duplicate"] = {
+        "of": result.get("work_order", {}).get("id"),
+        "similarity": round(match.similarity, 2),
+        "photo_distance": match.photo_distance,
+        "reports": match.reports,
+        "first_reported": match.first_seen,
+    }
+    return _finish("dedup", result, timings)
+
+
+def index_report(result, tenant_message, image_data=None, scope=None):
+    """Make a new work order available for attach_duplicate to match later reports against."""
+    index = dedup.get_index()
+    if index is not None:
+        index.add(tenant_message, image_data, result, scope)
+    return result
+
+
+def call_gemini_or_attach(tenant_message, image_data=None, api_key=None, scope=None):
+    """call_gemini, unless the message repeats a recent report in scope — then the existing work order."""
+    duplicate = attach_duplicate(tenant_message, image_data, scope)
+    if duplicate is not None:
+        return duplicate
+    return index_report(call_gemini(tenant_message, image_data, api_key), tenant_message, image_data, scope)
+
+
+def prepare_thread(tenant_message, scope=None):
+    """
+    Split off any pasted conversation history and find the open thread in
+    scope that the newest message continues (see threads.py). Pass the
+    returned message and context to a call_gemini variant, then the result
+    to finish_thread().
+    """
+    index = threads.get_index()
+    if index is None:
+        return threads.Prepared(tenant_message, scope=scope)
+    return index.prepare(tenant_message, scope)
+
+
+def finish_thread(result, prepared):
+    """
+    Record the exchange in its thread. A follow-up keeps the thread's
+    work-order ID and is tagged with "_thread"; a new work order in a scope
+    opens a thread for later follow-ups.
+    """
+    if "error" in result or result.get("_partial"):
+        return result
+    thread = prepared.thread
+    work_order = result.get("work_order")
+    if thread is not None and thread.wo_id and isinstance(work_order, dict):
+        model_id = work_order.get("id")
+        if model_id and model_id != thread.wo_id and isinstance(result.get("log_entry"), str):
+            result["log_entry"] = result["log_entry"].replace(model_id, thread.wo_id)
+        work_order["id"] = thread.wo_id
+    index = threads.get_index()
+    if index is not None:
+        index.record(prepared, result)
+    if thread is not None or prepared.earlier:
+        info = thread.info() if thread is not None else {"id": (work_order or {}).get("id")}
+        result["_thread"] = {**info, "follow_up": thread is not None, "pasted_turns": len(prepared.earlier)}
+    return result
+
+
+def call_gemini_threaded(tenant_message, image_data=None, api_key=None, scope=None, attach_duplicates=False):
+    """
+    call_gemini with conversation threads: a follow-up from scope is answered
+    with its thread as compact context and keeps the thread's work order, and
+    a pasted transcript is cut down to its newest tenant message. With
+    attach_duplicates, a message outside any thread that repeats a recent
+    report is attached to that work order, as in call_gemini_or_attach.
+    """
+    prepared = prepare_thread(tenant_message, scope)
+    if prepared.thread is None and attach_duplicates:
+        duplicate = attach_duplicate(prepared.message, image_data, scope)
+        if duplicate is not None:
+            return duplicate
+    result = call_gemini(prepared.message, image_data, api_key, context=prepared.context)
+    if prepared.thread is None and attach_duplicates:
+        index_report(result, prepared.message, image_data, scope)
+    return finish_thread(result, prepared)
+
+
+def record_result(result, tenant_message, source="ui"):
+    """Queue a finished result for the work-order store (no-op when MINIMASON_DB_PATH is empty)."""
+    work_orders = store.get_store()
+    if work_orders is not None:
+        work_orders.add(result, tenant_message, source=source)
+    return result
+
+
+def _generate(tenant_message, image_data, api_key, timings=None, context=None):
+    """
+    One uncached Gemini round trip. A failed attempt fails over to the next
+    healthy model, and a slow one is hedged when MINIMASON_HEDGE_PERCENTILE is set.
+    """
+    timings = timings or metrics.Timings()
+    pool = failover.get_pool()
+    try:
+        parts = _build_parts(tenant_message, image_data, context)
+        cap = usage.output_cap()
+
+        def call(model_name):
+            try:
+                return _model_for(api_key, model_name).generate_content(
+                    parts, generation_config={"max_output_tokens": cap}, request_options=_REQUEST_OPTIONS
+                )
+            except Exception as e:
+                _report_model_error(api_key, model_name, e)
+                raise
+
+        response = None
+        last_error = None
+        tried = []
+        for attempt in range(MAX_ATTEMPTS):
+            model_name, backoff = _next_attempt(pool, tried, attempt)
+            if backoff:
+                with timings.stage("backoff"):
+                    time.sleep(backoff)
+            started = time.perf_counter()
+            try:
+                delay = pool.hedge_delay(model_name)
+                if delay is None:
+                    tried.append(model_name)
+                    latency, response = failover.timed(pool, model_name, lambda: call(model_name))
+                    model_used = model_name
+                else:
+                    model_used, latency, response = failover.hedged(
+                        pool, model_name, delay, call,
+                        lambda: pool.hedge_partner(MODEL_NAMES, model_name, tried), started=tried,
+                    )
+                timings.add("model_call", latency)
+                metrics.MODEL_LATENCY.observe(latency, model=model_used)
+                break
+            except Exception as e:
+                timings.add("model_call", time.perf_counter() - started)
+                last_error = e
+                continue
+
+        if response is None:
+            metrics.ERRORS.inc(kind="api")
+            return {"error": f"API call failed after {MAX_ATTEMPTS} attempts: {str(last_error)}"}
+
+        result = _parse_response(
+            response.text, model_used, timings,
+            lambda r: _regenerate_fields(r, tenant_message, image_data, api_key, model_used, timings),
+        )
+        _record_usage(result, response.usage_metadata, model_used, latency, "request", cap, _truncated(response))
+        return _note_attempts(result, tried)
+
+    except Exception as e:
+        metrics.ERRORS.inc(kind="unexpected")
+        return {"error": f"Unexpected error: {str(e)}"}
+
+
+def _regenerate_fields(result, tenant_message, image_data, api_key, model_name, timings):
+    """
+    Re-ask model_name for just the fields of result that are lost or invalid
+    (see regenerate.py) and merge the answers in, for up to regenerate.ROUNDS
+    passes. Replaced fields are listed in "_regenerated"; a failed call leaves
+    the result as it was, to be trimmed or flagged by post-processing.
+    """
+    if not regenerate.enabled():
+        return result
+    replaced = []
+    for _ in range(regenerate.ROUNDS):
+        fields = regenerate.targets(result)
+        if not fields:
+            break
+        parts = [regenerate.build_prompt(tenant_message, result, fields)]
+        if image_data and any(f.startswith("work_order.") for f in fields):
+            parts.insert(0, {"inline_data": {"mime_type": "image/jpeg", "data": image_data}})
+        started = time.perf_counter()
+        try:
+            with timings.stage("regenerate"):
+                model = _regeneration_model(api_key, model_name, api_endpoint())
+                response = model.generate_content(parts, request_options=_REQUEST_OPTIONS)
+            patch, _ = partial_json.repair(response.text)
+        except Exception:
+            for field in fields:
+                metrics.REGENERATIONS.inc(field=field, outcome="error")
+            break
+        _record_usage(result, response.usage_metadata, model_name, time.perf_counter() - started,
+                      "regenerate", regenerate.MAX_OUTPUT_TOKENS)
+        merged = regenerate.merge(result, patch, fields)
+        for field in fields:
+            metrics.REGENERATIONS.inc(field=field, outcome="ok" if field in merged else "rejected")
+        replaced.extend(f for f in merged if f not in replaced)
+        if not merged:
+            break
+    if replaced:
+        result["_regenerated"] = replaced
+    return result
+
+
+def _async_limiter():
+    """Return the concurrency semaphore shared by all async calls on the running event loop."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    limiter = _async_limiters.get(loop)
+    if limiter is None:
+        limiter = asyncio.Semaphore(ASYNC_CONCURRENCY)
+        _async_limiters[loop] = limiter
+    return limiter
+
+
+def set_async_concurrency(limit):
+    """Change the in-flight cap for call_gemini_async. Applies to event loops started afterwards."""
+    global ASYNC_CONCURRENCY
+    ASYNC_CONCURRENCY = max(1, int(limit))
+    _async_limiters.clear()
+
+
+async def call_gemini_async(tenant_message, image_data=None, api_key=None, use_cache=True, context=None):
+    """
+    Async variant of call_gemini using the SDK's generate_content_async.
+    At most ASYNC_CONCURRENCY calls per event loop are in flight at once;
+    retry backoff awaits instead of blocking the thread.
+    """
+    if not api_key:
+        metrics.ERRORS.inc(kind="no_api_key")
+        return {"error": "No API key configured. Please add your GEMINI_API_KEY."}
+
+    timings = metrics.Timings()
+
+    with timings.stage("triage"):
+        provisional = triage.classify(tenant_message)
+        triage.fire_alerts(tenant_message, provisional)
+
+    if not use_cache:
+        result = await _generate_async(tenant_message, image_data, api_key, timings, context)
+    else:
+        key = _cache_key(tenant_message, image_data, context)
+        with timings.stage("cache_lookup"):
+            result = _cache_lookup(key)
+        if result is None:
+            result = await _generate_shared_async(key, tenant_message, image_data, api_key, timings, context)
+
+    return _finish("async", triage.cross_check(result, provisional), timings)
+
+
+async def _generate_async(tenant_message, image_data, api_key, timings=None, context=None):
+    """One uncached async Gemini round trip with the same failover and hedging as _generate."""
+    import asyncio
+
+    timings = timings or metrics.Timings()
+    pool = failover.get_pool()
+    try:
+        parts = _build_parts(tenant_message, image_data, context)
+        config = {"max_output_tokens": usage.output_cap()}
+
+        async def call(model_name):
+            model = await _async_model_for(api_key, model_name)
+            try:
+                if api_endpoint():
+                    # The SDK's async client has no REST transport; run the blocking call off the loop
+                    return await asyncio.to_thread(
+                        model.generate_content, parts, generation_config=config, request_options=_REQUEST_OPTIONS
+                    )
+                return await model.generate_content_async(
+                    parts, generation_config=config, request_options=_REQUEST_OPTIONS
+                )
+            except Exception as e:
+                _report_model_error(api_key, model_name, e)
+                raise
+
+        response = None
+        last_error = None
+        tried = []
+        for attempt in range(MAX_ATTEMPTS):
+            model_name, backoff = _next_attempt(pool, tried, attempt)
+            in_flight = False
+            started = time.perf_counter()
+            try:
+                if backoff:
+                    with timings.stage("backoff"):
+                        await asyncio.sleep(backoff)
+                # Hold a slot only while the request is in flight, not while backing off
+                async with _async_limiter():
+                    started = time.perf_counter()
+                    delay = pool.hedge_delay(model_name)
+                    # From here the failover helpers own the probe slot _next_attempt may have claimed
+                    in_flight = True
+                    if delay is None:
+                        tried.append(model_name)
+                        latency, response = await failover.timed_async(pool, model_name, call(model_name))
+                        model_used = model_name
+                    else:
+                        model_used, latency, response = await failover.hedged_async(
+                            pool, model_name, delay, call,
+                            lambda: pool.hedge_partner(MODEL_NAMES, model_name, tried), started=tried,
+                        )
+                timings.add("model_call", latency)
+                metrics.MODEL_LATENCY.observe(latency, model=model_used)
+                break
+            except asyncio.CancelledError:
+                # Cancelled while backing off or queued for a slot: give back a half-open probe
+                if not in_flight:
+                    pool.breaker(model_name).release()
+                raise
+            except Exception as e:
+                timings.add("model_call", time.perf_counter() - started)
+                last_error = e
+                continue
+
+        if response is None:
+            metrics.ERRORS.inc(kind="api")
+            return {"error": f"API call failed after {MAX_ATTEMPTS} attempts: {str(last_error)}"}
+
+        # Regeneration makes blocking calls, so parse off the loop when it may run
+        if regenerate.enabled():
+            result = await asyncio.to_thread(
+                _parse_response, response.text, model_used, timings,
+                lambda r: _regenerate_fields(r, tenant_message, image_data, api_key, model_used, timings),
+            )
+        else:
+            result = _parse_response(response.text, model_used, timings)
+        _record_usage(result, response.usage_metadata, model_used, latency, "request",
+                      config["max_output_tokens"], _truncated(response))
+        return _note_attempts(result, tried)
+
+    except Exception as e:
+        metrics.ERRORS.inc(kind="unexpected")
+        return {"error": f"Unexpected error: {str(e)}"}
+
+
+def call_gemini_split(tenant_message, image_data=None, api_key=None, attach_duplicates=False, scope=None):
+    """
+    Unit of Work fan-out: split a bundled message into one sub-request per
+    distinct issue and run them in parallel. Returns a list of linked results,
+    most severe first (a single-issue message gives a one-item list). With
+    attach_duplicates, an issue that repeats a recent report reuses its work order.
+    """
+    call = call_gemini_or_attach if attach_duplicates else lambda m, i, k, scope: call_gemini(m, i, k)
+    return splitter.process_split(tenant_message, lambda message: call(message, image_data, api_key, scope=scope))
+
+
+def _chunk_text(chunk):
+    """Text of a streamed chunk; metadata-only chunks (e.g. the final one) have none."""
+    try:
+        return chunk.text
+    except (ValueError, AttributeError):
+        return ""
+
+
+def call_gemini_stream(tenant_message, image_data=None, api_key=None, use_cache=True, context=None):
+    """
+    Streaming variant of call_gemini. Yields partial result dicts (marked with
+    "_partial": True) each time another field of the JSON response completes,
+    then yields the final post-processed result exactly like call_gemini.
+    """
+    if not api_key:
+        metrics.ERRORS.inc(kind="no_api_key")
+        yield {"error": "No API key configured. Please add your GEMINI_API_KEY."}
+        return
+
+    timings = metrics.Timings()
+
+    with timings.stage("triage"):
+        provisional = triage.classify(tenant_message)
+        triage.fire_alerts(tenant_message, provisional)
+
+    key = None
+    if use_cache:
+        key = _cache_key(tenant_message, image_data, context)
+        with timings.stage("cache_lookup"):
+            cached = _cache_lookup(key)
+        if cached is not None:
+            yield _finish("stream", triage.cross_check(cached, provisional), timings)
+            return
+
+    # An identical request already in flight (any session, any path) is awaited instead of
+    # repeated; its result arrives whole, without partials
+    group = singleflight.get_group()
+    flight, leader = group.claim(key) if key is not None else (None, False)
+    if flight is not None and not leader:
+        started = time.perf_counter()
+        try:
+            shared = flight.result()
+        except Exception:
+            shared = None
+        if shared is not None:
+            result = _joined(copy.deepcopy(shared), timings, started)
+            yield _finish("stream", triage.cross_check(result, provisional), timings)
+            return
+
+    result = None
+    try:
+        for item in _generate_stream(tenant_message, image_data, api_key, timings, context):
+            if item.get("_partial"):
+                yield item
+            else:
+                result = item
+
+        if key is not None:
+            with timings.stage("cache_store"):
+                result = _cache_store(key, result)
+    finally:
+        if leader:
+            error = None if result is not None else RuntimeError("Streamed request did not finish")
+            group.finish(key, flight, result, error)
+    yield _finish("stream", triage.cross_check(result, provisional), timings)
+
+
+def _generate_stream(tenant_message, image_data, api_key, timings=None, context=None):
+    """
+    One uncached streamed Gemini round trip with model failover (streams are
+    not hedged). The last item yielded is the final result.
+    """
+    timings = timings or metrics.Timings()
+    pool = failover.get_pool()
+    try:
+        parts = _build_parts(tenant_message, image_data, context)
+        cap = usage.output_cap()
+
+        last_error = None
+        tried = []
+        for attempt in range(MAX_ATTEMPTS):
+            model_name, backoff = _next_attempt(pool, tried, attempt)
+            if backoff:
+                with timings.stage("backoff"):
+                    time.sleep(backoff)
+            tried.append(model_name)
+            parser = partial_json.IncrementalJSONParser()
+            previous = None
+            started = time.perf_counter()
+            usage_metadata = None
+            truncated = False
+            try:
+                model = _model_for(api_key, model_name)
+                stream = model.generate_content(
+                    parts, stream=True, generation_config={"max_output_tokens": cap}, request_options=_REQUEST_OPTIONS
+                )
+                for chunk in stream:
+                    if "first_chunk" not in timings.stages:
+                        timings.add("first_chunk", time.perf_counter() - started)
+                    # Usage is cumulative; the last chunk that carries it has the totals
+                    if getattr(chunk, "usage_metadata", None):
+                        usage_metadata = chunk.usage_metadata
+                    truncated = truncated or _truncated(chunk)
+                    text = _chunk_text(chunk)
+                    if not text:
+                        continue
+                    partial = parser.feed(text)
+                    if partial != previous:
+                        previous = partial
+                        yield {**partial, "_partial": True, "_model_used": model_name}
+                elapsed = time.perf_counter() - started
+                pool.record(model_name, True, elapsed)
+                timings.add("model_call", elapsed)
+                metrics.MODEL_LATENCY.observe(elapsed, model=model_name)
+                result = _parse_response(
+                    parser.text, model_name, timings,
+                    lambda r: _regenerate_fields(r, tenant_message, image_data, api_key, model_name, timings),
+                )
+                _record_usage(result, usage_metadata, model_name, elapsed, "request", cap, truncated)
+                yield _note_attempts(result, tried)
+                return
+            except GeneratorExit:
+                # Consumer stopped reading mid-stream; that says nothing about the model
+                pool.breaker(model_name).release()
+                raise
+            except Exception as e:
+                # A failover restarts the stream; callers simply re-render from the new partials
+                pool.record(model_name, False)
+                _report_model_error(api_key, model_name, e)
+                timings.add("model_call", time.perf_counter() - started)
+                last_error = e
+                continue
+
+        metrics.ERRORS.inc(kind="api")
+        yield {"error": f"API call failed after {MAX_ATTEMPTS} attempts: {str(last_error)}"}
+
+    except Exception as e:
+        metrics.ERRORS.inc(kind="unexpected")
+        yield {"error": f"Unexpected error: {str(e)}"}
+
+
+def _post_process(result, notes=()):
+    """
+    Post-process Gemini output through validator.enforce(): normalize enums,
+    strip banned phrases, trim the reply for SMS, keep severity_reasoning to
+    one sentence, and turn remaining contract violations into warnings.
+    notes are fixes an earlier enforce() pass already made. Fields already
+    reported in "_lost_fields" are not warned about twice.
+    """
+    result, findings = validator.enforce(result)
+    lost = set(result.get("_lost_fields", ()))
+    warnings = list(dict.fromkeys(
+        f.message for f in [*notes, *findings] if not (f.kind == "missing" and f.field in lost)
+    ))
+    if warnings:
+        result.setdefault("_warnings", []).extend(warnings)
+    return result
+
+
+def severity_badge(severity):
+    """Return a colored badge for the severity level."""
+    badges = {
+        "EMERGENCY": "🔴 EMERGENCY",
+        "HIGH": "🟠 HIGH",
+        "MEDIUM": "🟡 MEDIUM",
+        "LOW": "🟢 LOW",
+        "UNKNOWN": "⚪ UNKNOWN",
+    }
+    return badges.get(severity.upper(), f"⚪ {severity}")
+
+
+def severity_color(severity):
+    """Return CSS color for the severity level."""
+    colors = {
+        "EMERGENCY": "#DC2626",
+        "HIGH": "#EA580C",
+        "MEDIUM": "#CA8A04",
+        "LOW": "#16A34A",
+        "UNKNOWN": "#6B7280",
+    }
+    return colors.get(severity.upper(), "#6B7280")
+
+
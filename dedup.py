@@ -0,0 +1,257 @@
+"""
+MiniMason — Near-Duplicate Report Detection
+
+Tenants resend the same problem in different words ("sink is leaking" an
+hour later becomes "the kitchen sink is STILL leaking!!"). Each recent work
+order is indexed by a MinHash signature of its message (with LSH banding for
+candidate lookup) and, when there is a photo, a 64-bit perceptual hash. A new
+report that matches one from the same tenant scope inside the window is
+attached to the existing work order instead of costing another model call and
+another WO number. Reports with no scope are neither indexed nor matched:
+similar wording from two different tenants is two work orders.
+
+Environment:
+    MINIMASON_DEDUP             set to 0 to turn detection off (default on)
+    MINIMASON_DEDUP_WINDOW      seconds a work order accepts repeat reports (default 3600)
+    MINIMASON_DEDUP_THRESHOLD   token Jaccard similarity that counts as a repeat (default 0.6)
+"""
+
+import base64
+import copy
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+
+import triage
+
+WINDOW = float(os.environ.get("MINIMASON_DEDUP_WINDOW", "3600"))
+THRESHOLD = float(os.environ.get("MINIMASON_DEDUP_THRESHOLD", "0.6"))
+# Photos within this many differing bits (of 64) are the same scene
+PHOTO_DISTANCE = 10
+
+# 16 bands x 4 rows: messages at the threshold collide in some band with probability > 0.8
+_BANDS, _ROWS = 16, 4
+_PERMUTATIONS = _BANDS * _ROWS
+_MASK = (1 << 61) - 1  # Mersenne prime modulus for the hash family
+_SEEDS = [
+    struct.unpack("<QQ", hashlib.sha256(f"minimason-minhash-{i}".encode()).digest()[:16])
+    for i in range(_PERMUTATIONS)
+]
+_COEFFICIENTS = [(a % _MASK or 1, b % _MASK) for a, b in _SEEDS]
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can could do does for from had has have hi hello i i'm im "
+    "in is it it's its just me my of on or our please so still that the there this to too up "
+    "us was we were when with you your again also now really very thanks thank".split()
+)
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def tokens(tenant_message):
+    """Content words of a message, lightly stemmed so "leaking"/"leaks"/"leak" agree."""
+    words = set()
+    for word in _WORD.findall((tenant_message or "").lower()):
+        if word in _STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[: -len(suffix)]
+                break
+        words.add(word)
+    return frozenset(words)
+
+
+def minhash(words):
+    """MinHash signature of a token set; equal positions estimate Jaccard similarity."""
+    hashes = [int.from_bytes(hashlib.blake2b(w.encode(), digest_size=8).digest(), "little") for w in words]
+    if not hashes:
+        return (0,) * _PERMUTATIONS
+    return tuple(min((a * h + b) % _MASK for h in hashes) for a, b in _COEFFICIENTS)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def photo_hash(image_data):
+    """64-bit difference hash of a base64 photo, or None if it can't be decoded."""
+    if not image_data:
+        return None
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(base64.b64decode(image_data))) as image:
+            pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def photo_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+@dataclass
+class _Entry:
+    scope: object
+    words: frozenset
+    bands: tuple
+    photo: int
+    category: str
+    result: dict
+    first_seen: float
+    last_seen: float
+    reports: int = 1
+
+
+@dataclass
+class Match:
+    """A recent work order that a new report repeats."""
+    result: dict
+    similarity: float
+    photo_distance: int = None
+    reports: int = 1
+    first_seen: float = 0.0
+
+
+class DuplicateIndex:
+    """Recent work orders per tenant scope, searchable for near-duplicate reports."""
+
+    def __init__(self, window=WINDOW, threshold=THRESHOLD, clock=time.time):
+        self.window = window
+        self.threshold = threshold
+        self.clock = clock
+        self._entries = OrderedDict()  # id -> _Entry, least recently reported first
+        self._buckets = {}  # (scope, band, values) -> set of ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _bands(self, signature):
+        return tuple(signature[i * _ROWS:(i + 1) * _ROWS] for i in range(_BANDS))
+
+    def _expire(self):
+        cutoff = self.clock() - self.window
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.last_seen >= cutoff:
+                break
+            del self._entries[entry_id]
+            for band, values in enumerate(entry.bands):
+                bucket = self._buckets.get((entry.scope, band, values))
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del self._buckets[(entry.scope, band, values)]
+
+    def add(self, tenant_message, image_data, result, scope=None):
+        """Index a finished work order. Errors, incomplete results and unscoped reports are skipped."""
+        if scope is None or "error" in result or "_lost_fields" in result or result.get("_duplicate"):
+            return
+        words = tokens(tenant_message)
+        if not words:
+            return
+        now = self.clock()
+        entry = _Entry(
+            scope=scope,
+            words=words,
+            bands=self._bands(minhash(words)),
+            photo=photo_hash(image_data),
+            category=triage.classify(tenant_message).category,
+            result=copy.deepcopy(result),
+            first_seen=now,
+            last_seen=now,
+        )
+        with self._lock:
+            self._expire()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            for band, values in enumerate(entry.bands):
+                self._buckets.setdefault((scope, band, values), set()).add(entry_id)
+
+    def find(self, tenant_message, image_data=None, scope=None):
+        """
+        The best recent work order in scope that this report repeats, or None.
+        A repeat needs similar wording with no contradicting photo, or the same
+        photo with loosely similar wording; reports the rules put in different
+        categories never match. Without a scope there is nothing to repeat.
+        """
+        if scope is None:
+            return None
+        words = tokens(tenant_message)
+        if not words:
+            return None
+        bands = self._bands(minhash(words))
+        photo = photo_hash(image_data)
+        category = triage.classify(tenant_message).category
+
+        with self._lock:
+            self._expire()
+            candidates = set()
+            for band, values in enumerate(bands):
+                candidates |= self._buckets.get((scope, band, values), set())
+            if photo is not None:
+                candidates |= {i for i, e in self._entries.items() if e.scope == scope and e.photo is not None}
+
+            best_id, best = None, None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if category and entry.category and category != entry.category:
+                    continue
+                similarity = jaccard(words, entry.words)
+                distance = photo_distance(photo, entry.photo) if photo is not None and entry.photo is not None else None
+                same_photo = distance is not None and distance <= PHOTO_DISTANCE
+                if distance is not None and not same_photo:
+                    continue
+                if similarity < (self.threshold / 2 if same_photo else self.threshold):
+                    continue
+                if best is None or similarity > best.similarity:
+                    best_id = entry_id
+                    best = Match(entry.result, similarity, distance, entry.reports, entry.first_seen)
+            if best is None:
+                return None
+
+            entry = self._entries[best_id]
+            entry.reports += 1
+            entry.last_seen = self.clock()
+            self._entries.move_to_end(best_id)
+            best.reports = entry.reports
+            best.result = copy.deepcopy(entry.result)
+            return best
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+
+def enabled():
+    return os.environ.get("MINIMASON_DEDUP", "1").lower() not in ("0", "false", "no", "off")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide DuplicateIndex, shared by every session, or None when detection is off."""
+    global _index
+    if not enabled():
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
@@ -0,0 +1,303 @@
+"""
+MiniMason — Model Failover, Circuit Breakers & Hedged Requests
+
+MODEL_NAMES is a failover order, applied per request: when a model errors
+(rate limit, outage, timeout) the next attempt goes straight to the next
+model instead of sleeping and retrying the same one. Each model has a
+circuit breaker that opens after repeated errors or slow responses, so a
+model having an incident is skipped entirely until a cooldown has passed
+and a single probe request succeeds.
+
+Hedging (off by default) trims tail latency: once a call has run longer
+than the model's recent p-th percentile latency, the same request is sent
+to the next healthy model and whichever answers first wins.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+# Consecutive failures (errors or slow responses) that open a model's breaker
+FAILURE_THRESHOLD = int(os.environ.get("MINIMASON_BREAKER_FAILURES", "3"))
+# A successful response slower than this counts as a failure
+SLOW_SECONDS = float(os.environ.get("MINIMASON_BREAKER_SLOW_SECONDS", "20"))
+# How long an open breaker skips its model before letting a probe through
+COOLDOWN_SECONDS = float(os.environ.get("MINIMASON_BREAKER_COOLDOWN", "30"))
+# Latency percentile after which a request is hedged to the next model; 0 disables hedging
+HEDGE_PERCENTILE = float(os.environ.get("MINIMASON_HEDGE_PERCENTILE", "0"))
+# Latency samples a model needs before its percentile is trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+
+_LATENCY_SAMPLES = 200
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Closed → open after FAILURE_THRESHOLD failures → half-open after the cooldown → closed on a good probe."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, slow_seconds=SLOW_SECONDS,
+                 cooldown=COOLDOWN_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.latencies = deque(maxlen=_LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at >= self.cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    def reopens_in(self):
+        """Seconds until an open breaker lets a probe through (0 if it already would)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - self.clock())
+
+    def allow(self):
+        """Whether a request may go to this model now. A half-open breaker admits one probe at a time."""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a probe slot claimed by allow() for a call that never finished."""
+        with self._lock:
+            self.probing = False
+
+    def record(self, ok, latency=None):
+        """Record an outcome. Returns True if this outcome tripped the breaker open."""
+        with self._lock:
+            self.probing = False
+            if ok and latency is not None:
+                self.latencies.append(latency)
+            if ok and (latency is None or latency <= self.slow_seconds):
+                self.failures = 0
+                self.opened_at = None
+                return False
+            self.failures += 1
+            was_closed = self.opened_at is None
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # A failed probe restarts the cooldown
+                self.opened_at = self.clock()
+                return was_closed
+            return False
+
+    def percentile(self, pct):
+        """Recent successful-call latency at pct, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "reopens_in": round(self.reopens_in(), 1),
+            "samples": len(self.latencies),
+        }
+
+
+class ModelPool:
+    """A circuit breaker per model name plus the failover and hedging policy built on them."""
+
+    def __init__(self, hedge_percentile=HEDGE_PERCENTILE, breaker_factory=CircuitBreaker):
+        self.hedge_percentile = hedge_percentile
+        self._factory = breaker_factory
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model_name):
+        with self._lock:
+            breaker = self._breakers.get(model_name)
+            if breaker is None:
+                breaker = self._breakers[model_name] = self._factory()
+            return breaker
+
+    def pick(self, model_names, tried=()):
+        """
+        The model for the next attempt: the first one in failover order that is
+        healthy and not yet tried, else the first healthy one (a retry), else the
+        one whose breaker reopens soonest — a request is never refused outright.
+        """
+        # allow() claims a half-open breaker's probe slot, so stop at the first yes
+        for name in model_names:
+            if name not in tried and self.breaker(name).allow():
+                return name
+        for name in model_names:
+            if self.breaker(name).allow():
+                return name
+        return min(model_names, key=lambda name: self.breaker(name).reopens_in())
+
+    def record(self, model_name, ok, latency=None):
+        if self.breaker(model_name).record(ok, latency):
+            metrics.BREAKER_TRIPS.inc(model=model_name)
+
+    def hedge_delay(self, model_name):
+        """Seconds to wait on model_name before hedging, or None if hedging is off or not yet calibrated."""
+        if not self.hedge_percentile:
+            return None
+        return self.breaker(model_name).percentile(self.hedge_percentile)
+
+    def hedge_partner(self, model_names, primary, tried=()):
+        """The healthy model to hedge primary with, or None. Claims the breaker's probe slot if half-open."""
+        for name in model_names:
+            if name != primary and name not in tried and self.breaker(name).allow():
+                return name
+        return None
+
+    def stats(self):
+        with self._lock:
+            names = list(self._breakers)
+        return {name: self.breaker(name).snapshot() for name in names}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide ModelPool, shared by every session and call path."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ModelPool()
+        return _pool
+
+
+# ---------------------------------------------------------------------------
+# HEDGED CALLS
+# ---------------------------------------------------------------------------
+
+_hedge_executor = None
+
+
+def _executor():
+    global _hedge_executor
+    with _pool_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="minimason-hedge")
+        return _hedge_executor
+
+
+def timed(pool, model_name, fn):
+    """Run fn(), record the outcome on model_name's breaker, and return (latency, value)."""
+    started = time.perf_counter()
+    try:
+        value = fn()
+    except Exception:
+        pool.record(model_name, False)
+        raise
+    latency = time.perf_counter() - started
+    pool.record(model_name, True, latency)
+    return latency, value
+
+
+def hedged(pool, primary, delay, call, choose_backup, started=None):
+    """
+    Run call(primary); if it hasn't finished after delay seconds, also run
+    call(backup) where backup = choose_backup() (no hedge if that is None).
+    Returns (model_name, latency, value) from the first call to succeed and
+    raises the primary's error if every call fails. Models actually called
+    are appended to started. The slower call runs to completion in the
+    background so its breaker still learns from it.
+    """
+    started = started if started is not None else []
+    executor = _executor()
+    futures = {executor.submit(timed, pool, primary, lambda: call(primary)): primary}
+    started.append(primary)
+    done, _ = wait(futures, timeout=delay)
+    backup = None if done else choose_backup()
+    if backup is not None:
+        futures[executor.submit(timed, pool, backup, lambda: call(backup))] = backup
+        started.append(backup)
+        metrics.HEDGES.inc(outcome="started")
+
+    pending = set(futures)
+    errors = {}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future]
+            try:
+                latency, value = future.result()
+            except Exception as e:
+                errors[name] = e
+                continue
+            if backup is not None:
+                metrics.HEDGES.inc(outcome="backup_won" if name == backup else "primary_won")
+            return name, latency, value
+    raise errors.get(primary) or next(iter(errors.values()))
+
+
+async def timed_async(pool, model_name, coro):
+    """Async timed(): awaits coro. A cancelled call releases its probe slot without counting as a failure."""
+    # Not imported at module level: sync-only callers never need asyncio
+    import asyncio
+
+    started = time.perf_counter()
+    try:
+        value = await coro
+    except asyncio.CancelledError:
+        pool.breaker(model_name).release()
+        raise
+    except Exception:
+        pool.record(model_name, False)
+        raise
+    latency = time.perf_counter() - started
+    pool.record(model_name, True, latency)
+    return latency, value
+
+
+async def hedged_async(pool, primary, delay, call, choose_backup, started=None):
+    """Async hedged(): call(name) returns an awaitable. The losing task is cancelled."""
+    import asyncio
+
+    started = started if started is not None else []
+    tasks = {asyncio.ensure_future(timed_async(pool, primary, call(primary))): primary}
+    started.append(primary)
+    done, _ = await asyncio.wait(tasks, timeout=delay)
+    backup = None if done else choose_backup()
+    if backup is not None:
+        tasks[asyncio.ensure_future(timed_async(pool, backup, call(backup)))] = backup
+        started.append(backup)
+        metrics.HEDGES.inc(outcome="started")
+
+    pending = set(tasks)
+    errors = {}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                try:
+                    latency, value = task.result()
+                except Exception as e:
+                    errors[name] = e
+                    continue
+                if backup is not None:
+                    metrics.HEDGES.inc(outcome="backup_won" if name == backup else "primary_won")
+                return name, latency, value
+    finally:
+        for task in pending:
+            task.cancel()
+    raise errors.get(primary) or next(iter(errors.values()))
@@ -0,0 +1,573 @@
+"""
+MiniMason — Local Gemini Stand-In
+
+A small HTTP server that speaks the slice of the Gemini REST API that
+call_gemini uses (generateContent, streamGenerateContent and cachedContents),
+so tests and benchmarks can run offline and reproducibly. Point the app at it with:
+
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765
+
+Modes:
+  synthetic  build a plausible work order from the tenant message (default)
+  replay     serve responses recorded earlier, keyed by request; unknown
+             requests fall back to synthetic
+  record     forward to the real API and append each response to the recordings file
+
+Every mode can inject latency (fixed, uniform or lognormal), server errors,
+rate limiting (429 with Retry-After) and malformed JSON, each at a given
+rate. A --seed makes the injected faults repeat run to run.
+
+Usage:
+    python fake_gemini.py --latency-ms 800 --latency-dist lognormal --rate-limit-rate 0.05
+    python fake_gemini.py --mode record --recordings recordings.jsonl   # needs GEMINI_API_KEY
+    python fake_gemini.py --mode replay --recordings recordings.jsonl --seed 7
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import triage
+
+UPSTREAM = "https://generativelanguage.googleapis.com"
+DEFAULT_PORT = 8765
+
+_ROUTE = re.compile(r"^/v1beta/models/([\w.\-]+):(generateContent|streamGenerateContent)$")
+_CACHE_ROUTE = re.compile(r"^/v1beta/(cachedContents(?:/[\w\-]+)?)$")
+_TENANT_MESSAGE = re.compile(r"TENANT MESSAGE:\n(.*?)(?:\n\n(?:Analyze|Note:)|$)", re.DOTALL)
+
+# Status names the API puts in error bodies, by HTTP status
+_STATUS_NAMES = {
+    400: "INVALID_ARGUMENT",
+    404: "NOT_FOUND",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+@dataclass
+class FaultProfile:
+    """What the fake server does to each request. Rates are probabilities in [0, 1]."""
+    latency_ms: float = 800
+    latency_dist: str = "lognormal"  # fixed | uniform | lognormal
+    jitter: float = 0.3              # uniform: ±fraction of latency_ms; lognormal: sigma
+    error_rate: float = 0.0          # 500/503 responses
+    rate_limit_rate: float = 0.0     # 429 responses
+    retry_after: int = 1             # seconds advertised on 429s
+    malformed_rate: float = 0.0      # truncated, fenced or trailing-comma JSON
+    stream_chunks: int = 6           # chunks per streamed response
+    failing_models: tuple = ()       # models that always return 503
+    context_cache: bool = True       # accept cachedContents.create
+    min_cache_tokens: int = 1024     # smallest cacheable system instruction
+
+    def latency(self, rng):
+        """One latency sample in seconds."""
+        base = self.latency_ms / 1000
+        if self.latency_dist == "fixed" or base <= 0:
+            return max(0.0, base)
+        if self.latency_dist == "uniform":
+            return max(0.0, rng.uniform(base * (1 - self.jitter), base * (1 + self.jitter)))
+        # lognormal with latency_ms as the median: a long right tail like real provider latency
+        return rng.lognormvariate(math.log(base), self.jitter)
+
+
+# ---------------------------------------------------------------------------
+# RESPONSES
+# ---------------------------------------------------------------------------
+
+def request_key(model, body):
+    """
+    Stable key for a generateContent request: the model plus the canonical
+    request body. The output token cap is left out; it adapts to recent
+    response lengths (see usage.py) and would otherwise orphan recordings.
+    """
+    body = dict(body)
+    for name in ("generationConfig", "generation_config"):
+        if isinstance(body.get(name), dict):
+            body[name] = {k: v for k, v in body[name].items() if k not in ("maxOutputTokens", "max_output_tokens")}
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{model}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+def tenant_message(body):
+    """The tenant's message from a request body, or "" if it can't be found."""
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            match = _TENANT_MESSAGE.search(part.get("text", ""))
+            if match:
+                return match.group(1).strip()
+    return ""
+
+
+def has_photo(body):
+    return any("inlineData" in part or "inline_data" in part
+               for content in body.get("contents", []) for part in content.get("parts", []))
+
+
+def synthetic_work_order(message, photo, rng):
+    """A schema-complete response whose severity/category follow the rule-based triage."""
+    provisional = triage.classify(message)
+    severity = provisional.severity or "MEDIUM"
+    category = provisional.category or "GENERAL"
+    wo_id = f"WO-{rng.randrange(10000):04d}"
+    summary = " ".join(message.split()[:12]) or "Tenant maintenance request"
+    return {
+        "work_order": {
+            "id": wo_id,
+            "category": category,
+            "severity": severity,
+            "description": f"{summary}. Reported by tenant; details to be confirmed on site.",
+            "severity_reasoning": f"Classified {severity} based on the reported {category.lower()} issue.",
+            "tenant_details": "Photo provided" if photo else "No photo provided",
+        },
+        "tenant_reply": "Thanks for letting us know — I've logged this and someone will be in touch shortly to schedule a visit.",
+        "suggested_actions": [
+            f"Dispatch {category.lower()} technician per {severity} response window",
+            "Confirm access window with tenant",
+        ],
+        "log_entry": f"{time.strftime('%Y-%m-%d %H:%M')} | {wo_id} | {severity} | {category} | {summary[:60]}",
+        "red_flags": [],
+    }
+
+
+def response_body(text, prompt_tokens=0, finish_reason="STOP"):
+    """A generateContent response wrapping text as the single candidate."""
+    candidates_tokens = max(1, len(text) // 4)
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": finish_reason,
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": candidates_tokens,
+            "totalTokenCount": prompt_tokens + candidates_tokens,
+        },
+    }
+
+
+def response_text(body):
+    """Concatenated candidate text of a generateContent response."""
+    candidates = body.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def malform(text, rng):
+    """Damage a JSON response the way models do: cut off, fenced, or with a trailing comma."""
+    kind = rng.choice(["truncate", "fence", "trailing_comma"])
+    if kind == "truncate":
+        return text[: max(1, int(len(text) * rng.uniform(0.3, 0.9)))], kind
+    if kind == "fence":
+        return f"Here is the work order:\n```json\n{text}\n```", kind
+    return re.sub(r"\]\s*}\s*$", "],}", text), kind
+
+
+def error_body(status, message):
+    return {"error": {"code": status, "message": message, "status": _STATUS_NAMES.get(status, "UNKNOWN")}}
+
+
+# ---------------------------------------------------------------------------
+# RECORDINGS
+# ---------------------------------------------------------------------------
+
+class Recordings:
+    """Request-keyed responses persisted as JSON lines ({"key", "model", "response"})."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._responses[entry["key"]] = entry["response"]
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self._responses)
+
+    def get(self, key):
+        return self._responses.get(key)
+
+    def add(self, key, model, response):
+        with self._lock:
+            self._responses[key] = response
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "model": model, "response": response}) + "\n")
+
+
+def forward(model, body, api_key, timeout=60):
+    """Send a generateContent request to the real API. Returns (status, response body)."""
+    request = urllib.request.Request(
+        f"{UPSTREAM}/v1beta/models/{model}:generateContent",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read())
+        except ValueError:
+            return e.code, error_body(e.code, str(e))
+
+
+# ---------------------------------------------------------------------------
+# SERVER
+# ---------------------------------------------------------------------------
+
+class FakeGemini:
+    """The fake backend's state: mode, fault profile, recordings, RNG and counters."""
+
+    def __init__(self, mode="synthetic", profile=None, recordings=None, seed=None, upstream_key=None):
+        if mode not in ("synthetic", "replay", "record"):
+            raise ValueError(f"Unknown mode {mode!r}")
+        self.mode = mode
+        self.profile = profile or FaultProfile()
+        self.recordings = recordings if recordings is not None else Recordings()
+        self.upstream_key = upstream_key
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.cached_contents = {}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def draw(self):
+        """Roll this request's faults under the lock so a seeded run is reproducible."""
+        p = self.profile
+        with self._lock:
+            roll = self._rng.random()
+            return {
+                "latency": p.latency(self._rng),
+                "rate_limited": roll < p.rate_limit_rate,
+                "error": p.rate_limit_rate <= roll < p.rate_limit_rate + p.error_rate,
+                "malformed": self._rng.random() < p.malformed_rate,
+                "rng": random.Random(self._rng.random()),
+            }
+
+    # ---- cachedContents ----
+
+    def create_cache(self, body):
+        """cachedContents.create. Names are derived from the content, so replay keys stay stable."""
+        if not self.profile.context_cache:
+            return 400, error_body(400, "Context caching is not supported for this model.")
+        instruction = body.get("systemInstruction") or {}
+        tokens = len(json.dumps(instruction)) // 4
+        if tokens < self.profile.min_cache_tokens:
+            return 400, error_body(
+                400, f"Cached content is too small. total_token_count={tokens}, min_total_token_count="
+                     f"{self.profile.min_cache_tokens}")
+        digest = hashlib.sha256(json.dumps([body.get("model"), instruction], sort_keys=True).encode()).hexdigest()
+        entry = {
+            "name": f"cachedContents/{digest[:16]}",
+            "model": body.get("model", ""),
+            "displayName": body.get("displayName", ""),
+            "systemInstruction": instruction,
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+        with self._lock:
+            self.cached_contents[entry["name"]] = entry
+        self.count("caches_created")
+        return 200, self._cache_view(entry, body.get("ttl"))
+
+    def update_cache(self, name, body):
+        entry = self.cached_contents.get(name)
+        if entry is None:
+            return 404, error_body(404, f"CachedContent not found: {name}")
+        self.count("caches_updated")
+        return 200, self._cache_view(entry, body.get("ttl"))
+
+    def _cache_view(self, entry, ttl):
+        seconds = float(str(ttl or "3600s").rstrip("s"))
+        now = time.time()
+        stamp = lambda t: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+        view = {k: v for k, v in entry.items() if k != "systemInstruction"}
+        return dict(view, createTime=stamp(now), updateTime=stamp(now), expireTime=stamp(now + seconds))
+
+    def _resolve_cache(self, body):
+        """Swap a cachedContent reference for the instruction it holds. Returns (body, cached tokens) or None."""
+        name = body.get("cachedContent")
+        if not name:
+            return body, 0
+        entry = self.cached_contents.get(name)
+        if entry is None:
+            return None
+        resolved = {k: v for k, v in body.items() if k != "cachedContent"}
+        resolved["systemInstruction"] = entry["systemInstruction"]
+        return resolved, entry["usageMetadata"]["totalTokenCount"]
+
+    # ---- generateContent ----
+
+    def handle(self, model, body):
+        """Return (status, headers, response body, delay seconds) for one generateContent request."""
+        self.count("requests")
+        faults = self.draw()
+        delay = faults["latency"]
+
+        resolved = self._resolve_cache(body)
+        if resolved is None:
+            return 404, {}, error_body(404, f"CachedContent not found: {body.get('cachedContent')}"), delay
+        body, cached_tokens = resolved
+
+        if model in self.profile.failing_models:
+            self.count("errors")
+            return 503, {}, error_body(503, f"Model {model} is temporarily unavailable."), delay
+        if faults["rate_limited"]:
+            self.count("rate_limited")
+            headers = {"Retry-After": str(self.profile.retry_after)}
+            return 429, headers, error_body(429, "Resource has been exhausted (e.g. check quota)."), delay
+        if faults["error"]:
+            self.count("errors")
+            status = faults["rng"].choice([500, 503])
+            return status, {}, error_body(status, "The service encountered an internal error."), delay
+
+        key = request_key(model, body)
+        response = None
+        if self.mode in ("replay", "record"):
+            response = self.recordings.get(key)
+            self.count("replayed" if response is not None else "replay_misses")
+        if response is None and self.mode == "record":
+            status, response = forward(model, body, self.upstream_key)
+            if status != 200:
+                self.count("upstream_errors")
+                return status, {}, response, 0
+            self.recordings.add(key, model, response)
+            self.count("recorded")
+            delay = 0  # the upstream call already took real time
+        if response is None:
+            message = tenant_message(body)
+            text = json.dumps(synthetic_work_order(message, has_photo(body), faults["rng"]), indent=2)
+            response = response_body(text, prompt_tokens=len(json.dumps(body)) // 4)
+            self.count("synthetic")
+
+        if faults["malformed"]:
+            text, kind = malform(response_text(response), faults["rng"])
+            response = response_body(text, response.get("usageMetadata", {}).get("promptTokenCount", 0),
+                                     finish_reason="MAX_TOKENS" if kind == "truncate" else "STOP")
+            self.count("malformed")
+        if cached_tokens:
+            usage = dict(response.get("usageMetadata", {}), cachedContentTokenCount=cached_tokens)
+            response = dict(response, usageMetadata=usage)
+            self.count("cached_requests")
+        return 200, {}, response, delay
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, recordings=len(self.recordings), mode=self.mode)
+
+
+def _handler_class(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self._cache_request("GET"):
+                return
+            if self.path == "/healthz":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/stats":
+                self._send_json(200, fake.stats())
+            else:
+                self._send_json(404, error_body(404, f"No route for GET {self.path}"))
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            try:
+                return json.loads(raw or b"{}")
+            except ValueError:
+                self._send_json(400, error_body(400, "Request body is not valid JSON."))
+                return None
+
+        def _cache_request(self, method):
+            """cachedContents create (POST), update (PATCH), get (GET) and delete (DELETE)."""
+            match = _CACHE_ROUTE.match(self.path.split("?", 1)[0])
+            if not match:
+                return False
+            name = match.group(1)
+            body = self._read_json() if method in ("POST", "PATCH") else {}
+            if body is None:
+                return True
+            if method == "POST" and name == "cachedContents":
+                status, response = fake.create_cache(body)
+            elif method == "PATCH":
+                status, response = fake.update_cache(name, body.get("cachedContent", body))
+            elif method == "GET" and name in fake.cached_contents:
+                status, response = 200, fake._cache_view(fake.cached_contents[name], None)
+            elif method == "DELETE" and fake.cached_contents.pop(name, None) is not None:
+                status, response = 200, {}
+            else:
+                status, response = 404, error_body(404, f"CachedContent not found: {name}")
+            self._send_json(status, response)
+            return True
+
+        def do_PATCH(self):
+            if not self._cache_request("PATCH"):
+                self._send_json(404, error_body(404, f"No route for PATCH {self.path}"))
+
+        def do_DELETE(self):
+            if not self._cache_request("DELETE"):
+                self._send_json(404, error_body(404, f"No route for DELETE {self.path}"))
+
+        def do_POST(self):
+            if self._cache_request("POST"):
+                return
+            match = _ROUTE.match(self.path.split("?", 1)[0])
+            if not match:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._send_json(404, error_body(404, f"No route for POST {self.path}"))
+                return
+            body = self._read_json()
+            if body is None:
+                return
+
+            model, method = match.groups()
+            status, headers, response, delay = fake.handle(model, body)
+            if status != 200 or method == "generateContent":
+                time.sleep(delay)
+                self._send_json(status, response, headers)
+                return
+            self._stream(response, delay)
+
+        def _stream(self, response, delay):
+            """Send the response as a JSON array of chunks, spreading the latency across them."""
+            text = response_text(response)
+            count = max(1, min(fake.profile.stream_chunks, len(text)))
+            size = math.ceil(len(text) / count)
+            pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+            finish = response["candidates"][0].get("finishReason", "STOP")
+
+            # First byte arrives after ~40% of the latency, the rest trickles in
+            time.sleep(delay * 0.4)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                last = i == len(pieces) - 1
+                chunk = response_body(piece, finish_reason=finish if last else None)
+                if not last:
+                    del chunk["candidates"][0]["finishReason"]
+                else:
+                    chunk["usageMetadata"] = response.get("usageMetadata", {})
+                data = ("[" if i == 0 else ",\r\n") + json.dumps(chunk) + ("]" if last else "")
+                self._write_chunk(data.encode("utf-8"))
+                if not last:
+                    time.sleep(delay * 0.6 / len(pieces))
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(fake, host="127.0.0.1", port=DEFAULT_PORT):
+    """Create the HTTP server for a FakeGemini. Call serve_forever() on the result."""
+    server = ThreadingHTTPServer((host, port), _handler_class(fake))
+    server.daemon_threads = True
+    return server
+
+
+def start(fake=None, host="127.0.0.1", port=0):
+    """
+    Run a fake server on a background thread (port 0 picks a free port).
+    Returns (server, endpoint URL); stop it with server.shutdown().
+    """
+    server = serve(fake or FakeGemini(), host, port)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local Gemini stand-in for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--mode", choices=["synthetic", "replay", "record"], default="synthetic")
+    parser.add_argument("--recordings", help="JSON-lines file of recorded responses (replay/record modes).")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median (lognormal) or mean response latency.")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Uniform ±fraction, or lognormal sigma.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500/503.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered 429.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of responses with damaged JSON.")
+    parser.add_argument("--fail-model", action="append", default=[], help="Model name that always returns 503.")
+    parser.add_argument("--no-context-cache", action="store_true", help="Reject cachedContents.create (test fallback).")
+    parser.add_argument("--seed", type=int, help="Seed the fault and latency RNG for reproducible runs.")
+    args = parser.parse_args(argv)
+
+    upstream_key = None
+    if args.mode == "record":
+        from core import get_api_key
+        upstream_key = get_api_key()
+        if not upstream_key:
+            parser.error("record mode needs GEMINI_API_KEY for the real API")
+
+    profile = FaultProfile(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        malformed_rate=args.malformed_rate,
+        failing_models=tuple(args.fail_model),
+        context_cache=not args.no_context_cache,
+    )
+    fake = FakeGemini(args.mode, profile, Recordings(args.recordings), args.seed, upstream_key)
+    server = serve(fake, args.host, args.port)
+    print(f"Fake Gemini ({args.mode}) on http://{args.host}:{server.server_address[1]} "
+          f"— set GEMINI_API_ENDPOINT to this URL. Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(fake.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+MiniMason — Timing Spans & Metrics
+
+Per-request stage timings (attached to each result as "_timings") and
+process-wide counters and histograms rendered in the Prometheus text format.
+Everything lives at module level, so Streamlit reruns and sessions share one
+set of series. Set MINIMASON_METRICS_PORT to serve them on /metrics.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans sub-millisecond rules up to a slow model round trip with retries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, one set per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """The set of metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "minimason_requests_total", "Tenant messages processed, by call path and outcome.", ["path", "outcome"])
+RETRIES = REGISTRY.counter(
+    "minimason_retries_total", "Attempts that retried the same model after a failure (nothing left to fail over to).", ["model"])
+ERRORS = REGISTRY.counter(
+    "minimason_errors_total", "Requests that ended in an error result, by kind.", ["kind"])
+FAILOVERS = REGISTRY.counter(
+    "minimason_failovers_total", "Requests moved to the next model after a failure, by failed model.", ["model"])
+BREAKER_TRIPS = REGISTRY.counter(
+    "minimason_breaker_trips_total", "Times a model's circuit breaker opened.", ["model"])
+HEDGES = REGISTRY.counter(
+    "minimason_hedges_total", "Hedged requests started, and which call won.", ["outcome"])
+TOKENS = REGISTRY.counter(
+    "minimason_tokens_total", "Tokens billed per model: prompt (including cached), cached, output.", ["model", "kind"])
+REGENERATIONS = REGISTRY.counter(
+    "minimason_regenerations_total", "Fields re-asked from the model after failing validation, by field and outcome.",
+    ["field", "outcome"])
+STORE_DROPPED = REGISTRY.counter(
+    "minimason_store_dropped_rows_total", "Rows the work-order store failed to write, by table.", ["table"])
+CACHE_HITS = REGISTRY.counter(
+    "minimason_cache_hits_total", "Response cache hits, by tier.", ["tier"])
+CACHE_MISSES = REGISTRY.counter(
+    "minimason_cache_misses_total", "Response cache misses.")
+MODEL_LATENCY = REGISTRY.histogram(
+    "minimason_model_latency_seconds", "Duration of successful model calls.", ["model"])
+STAGE_LATENCY = REGISTRY.histogram(
+    "minimason_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+
+
+# ---------------------------------------------------------------------------
+# PER-REQUEST SPANS
+# ---------------------------------------------------------------------------
+
+class Timings:
+    """
+    Stage durations for one request. Each stage is also observed in
+    STAGE_LATENCY; a stage that runs more than once (retries) accumulates.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_LATENCY.observe(seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def to_dict(self):
+        """Stage durations in milliseconds, in the order they first ran, plus the total."""
+        timings = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+
+# ---------------------------------------------------------------------------
+# /metrics ENDPOINT
+# ---------------------------------------------------------------------------
+
+def _handler_class():
+    # http.server is only imported when the endpoint is actually started
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve /metrics on a background thread. Only the first call starts a server."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            _server = ThreadingHTTPServer((host, port), _handler_class())
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="minimason-metrics", daemon=True).start()
+        return _server
+
+
+def start_http_server_from_env():
+    """Start the /metrics server if MINIMASON_METRICS_PORT is set. Safe to call on every rerun."""
+    port = os.environ.get("MINIMASON_METRICS_PORT")
+    if port:
+        try:
+            return start_http_server(int(port))
+        except OSError:
+            # Port taken (e.g. a second app process); metrics stay available in-process
+            return None
+    return None
@@ -0,0 +1,390 @@
+"""
+MiniMason — Incremental JSON Parsing
+
+Parses the prefix of a JSON document that has arrived so far, keeping only
+values that are complete: a string appears once its closing quote arrives,
+an object or array appears as soon as it opens and fills in as members
+finish. This lets the UI render work_order fields and tenant_reply while
+the model is still generating the rest.
+
+The same parser backs repair(), which salvages truncated, fenced or
+otherwise damaged model output and reports exactly which fields were lost.
+"""
+
+import copy
+import json
+import re
+
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_NUMBER_PREFIX = re.compile(r"-?\d*(?:\.\d*)?(?:[eE][+-]?\d*)?")
+_LITERALS = {"true": True, "false": False, "null": None}
+_WHITESPACE = " \t\n\r"
+_KEY = re.compile(r',\s*"([A-Za-z_]\w*)"\s*:')
+_STRING_STOP = re.compile(r'["\\]')
+_SCALAR = re.compile(r"[\w.+-]*")
+# The closing fence must start a line (or the text is cut off): ``` inside a JSON string doesn't end it
+_FENCE = re.compile(r"```[A-Za-z]*[ \t]*\n?(.*?)(?:\n[ \t]*```|\Z)", re.DOTALL)
+
+
+class _Incomplete(Exception):
+    """Raised when the text ends before the current value does."""
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        # Top-level keys whose values were fully parsed
+        self.completed = []
+
+    def skip_ws(self):
+        while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+            self.pos += 1
+        if self.pos >= len(self.text):
+            raise _Incomplete
+
+    def value(self):
+        self.skip_ws()
+        ch = self.text[self.pos]
+        if ch == '"':
+            return self.string()
+        return self.scalar()
+
+    def member(self, attach, depth):
+        """
+        Parse one value and hand it to attach(). Containers are attached before
+        they are filled, so their finished members survive an early end of text.
+        """
+        self.skip_ws()
+        ch = self.text[self.pos]
+        if ch == "{":
+            container = {}
+            attach(container)
+            self.obj(container, depth + 1)
+        elif ch == "[":
+            container = []
+            attach(container)
+            self.arr(container, depth + 1)
+        else:
+            attach(self.value())
+
+    def string(self):
+        start = self.pos
+        i = start + 1
+        while i < len(self.text):
+            ch = self.text[i]
+            if ch == "\\":
+                i += 2
+                continue
+            if ch == '"':
+                self.pos = i + 1
+                # strict=False tolerates raw newlines/tabs inside strings, a common model slip
+                return json.loads(self.text[start:self.pos], strict=False)
+            i += 1
+        raise _Incomplete
+
+    def scalar(self):
+        for literal, value in _LITERALS.items():
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+            if literal.startswith(self.text[self.pos:]):
+                raise _Incomplete
+        # A number that runs to the end of the text may still be growing
+        if _NUMBER_PREFIX.match(self.text, self.pos).end() >= len(self.text):
+            raise _Incomplete
+        match = _NUMBER.match(self.text, self.pos)
+        if not match:
+            raise ValueError(f"Unexpected character {self.text[self.pos]!r} at {self.pos}")
+        self.pos = match.end()
+        return json.loads(match.group())
+
+    def obj(self, out, depth=0):
+        self.pos += 1
+        while True:
+            self.skip_ws()
+            # "}" here closes an empty object or follows a trailing comma
+            if self.text[self.pos] == "}":
+                self.pos += 1
+                return
+            if self.text[self.pos] != '"':
+                raise ValueError(f"Expected object key at {self.pos}")
+            key = self.string()
+            self.skip_ws()
+            if self.text[self.pos] != ":":
+                raise ValueError(f"Expected ':' at {self.pos}")
+            self.pos += 1
+            self.member(lambda v: out.__setitem__(key, v), depth)
+            if depth == 0:
+                self.completed.append(key)
+            self.skip_ws()
+            ch = self.text[self.pos]
+            self.pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError(f"Expected ',' or '}}' at {self.pos - 1}")
+
+    def arr(self, out, depth):
+        self.pos += 1
+        while True:
+            self.skip_ws()
+            if self.text[self.pos] == "]":
+                self.pos += 1
+                return
+            self.member(out.append, depth)
+            self.skip_ws()
+            ch = self.text[self.pos]
+            self.pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise ValueError(f"Expected ',' or ']' at {self.pos - 1}")
+
+
+def parse_partial(text):
+    """
+    Parse a possibly unfinished JSON object. Returns (value, done) where value
+    holds every member that is complete so far and done is True once the
+    top-level object has closed. Raises ValueError on malformed input.
+    """
+    start = text.find("{")
+    if start == -1:
+        return {}, False
+    parser = _Parser(text)
+    parser.pos = start
+    out = {}
+    try:
+        parser.obj(out)
+    except _Incomplete:
+        return out, False
+    return out, True
+
+
+def _strip_fences(text):
+    """Return the body of the first ``` code fence, or the text unchanged if there is none."""
+    match = _FENCE.search(text)
+    if match and "{" in match.group(1):
+        return match.group(1)
+    return text
+
+
+def _next_schema_key(text, pos, schema, completed):
+    """Index of the comma before the next unparsed top-level schema key after pos, or None."""
+    for match in _KEY.finditer(text, pos):
+        if schema and match.group(1) in schema and match.group(1) not in completed:
+            return match.start()
+    return None
+
+
+def lost_fields(value, schema, completed=None):
+    """
+    List the schema fields that did not survive intact. schema maps each
+    top-level key to a list of required sub-keys (for objects) or None.
+    Objects report their missing sub-keys as "parent.child". completed names
+    the keys known to be fully parsed; by default every present key counts.
+    """
+    lost = []
+    for key, subkeys in schema.items():
+        present = value.get(key)
+        if subkeys and isinstance(present, dict):
+            lost.extend(f"{key}.{sub}" for sub in subkeys if sub not in present)
+        elif key not in value or (completed is not None and key not in completed):
+            lost.append(key)
+    return lost
+
+
+def repair(text, schema=None):
+    """
+    Salvage a damaged JSON object: strips code fences and surrounding prose,
+    ignores trailing garbage, tolerates trailing commas and raw newlines in
+    strings, and keeps every member completed before a truncation or syntax
+    error. Returns (value, lost) where lost lists the schema fields that could
+    not be recovered (empty when schema is None).
+    """
+    text = _strip_fences(text)
+    start = text.find("{")
+    if start == -1:
+        return {}, list(schema or ())
+
+    parser = _Parser(text)
+    parser.pos = start
+    value = {}
+    while True:
+        try:
+            parser.obj(value)
+            break
+        except _Incomplete:
+            break
+        except ValueError:
+            # Skip the damaged member and resume at the next known top-level key.
+            # obj() steps over the character at pos, so point it at the comma.
+            resume = _next_schema_key(text, parser.pos, schema, parser.completed)
+            if resume is None:
+                break
+            parser.pos = resume
+
+    # Drop containers that were cut off mid-way unless the schema can describe what's missing
+    for key in list(value):
+        if key not in parser.completed and not (schema and schema.get(key) and isinstance(value[key], dict)):
+            del value[key]
+
+    return value, lost_fields(value, schema or {}, parser.completed)
+
+
+class IncrementalJSONParser:
+    """
+    Push parser for a streamed object. Each feed() scans only the new chunk:
+    the open containers, the current key and any unfinished string or scalar
+    carry over to the next call, so a whole stream parses in linear time.
+    Values follow the same rules as parse_partial().
+    """
+
+    def __init__(self):
+        self.value = {}
+        self.done = False
+        self._chunks = []
+        self._snapshot = {}
+        self._changed = False
+        self._failed = False
+        self._started = False
+        # Open containers, innermost last: [container, state, key]
+        self._stack = []
+        # Unfinished string or scalar: its kind and the raw text seen so far
+        self._token = None
+        self._pieces = []
+        self._escape = False
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        """Consume a chunk and return a snapshot of the current partial object."""
+        self._chunks.append(chunk)
+        if not (self.done or self._failed):
+            try:
+                self._consume(chunk)
+            except ValueError:
+                # Keep what parsed so far; the final full-text parse will report the problem
+                self._failed = True
+        if self._changed:
+            # Snapshots are taken once per finished value, not per chunk
+            self._changed = False
+            self._snapshot = copy.deepcopy(self.value)
+        return self._snapshot
+
+    def _consume(self, text):
+        i = 0
+        while i < len(text):
+            if self._token == "string":
+                i = self._string(text, i)
+                continue
+            if self._token == "scalar":
+                i = self._scalar(text, i)
+                continue
+            ch = text[i]
+            i += 1
+            if ch in _WHITESPACE:
+                continue
+            if not self._stack:
+                if self._started:
+                    return
+                if ch == "{":
+                    self._started = True
+                    self._stack.append([self.value, "key", None])
+                continue
+
+            frame = self._stack[-1]
+            state = frame[1]
+            if state == "next":
+                close = "}" if isinstance(frame[0], dict) else "]"
+                if ch == close:
+                    self._close()
+                elif ch == ",":
+                    frame[1] = "key" if isinstance(frame[0], dict) else "item"
+                else:
+                    raise ValueError(f"Expected ',' or '{close}'")
+            elif state == "colon":
+                if ch != ":":
+                    raise ValueError("Expected ':'")
+                frame[1] = "value"
+            elif state == "key":
+                # "}" here closes an empty object or follows a trailing comma
+                if ch == "}":
+                    self._close()
+                elif ch == '"':
+                    self._token = "string"
+                else:
+                    raise ValueError("Expected object key")
+            elif state == "item" and ch == "]":
+                self._close()
+            elif ch in "{[":
+                container = {} if ch == "{" else []
+                self._attach(container)
+                self._stack.append([container, "key" if ch == "{" else "item", None])
+            elif ch == '"':
+                self._token = "string"
+            else:
+                self._token = "scalar"
+                i -= 1
+
+    def _attach(self, value):
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[0][frame[2]] = value
+        else:
+            frame[0].append(value)
+        frame[1] = "next"
+        self._changed = True
+
+    def _close(self):
+        self._stack.pop()
+        if not self._stack:
+            self.done = True
+            self._changed = True
+
+    def _string(self, text, i):
+        while i < len(text):
+            if self._escape:
+                self._pieces.append(text[i])
+                self._escape = False
+                i += 1
+                continue
+            match = _STRING_STOP.search(text, i)
+            if match is None:
+                self._pieces.append(text[i:])
+                return len(text)
+            j = match.start()
+            self._pieces.append(text[i:j + 1])
+            if text[j] == "\\":
+                self._escape = True
+                i = j + 1
+                continue
+            # strict=False tolerates raw newlines/tabs inside strings, a common model slip
+            value = json.loads('"' + "".join(self._pieces), strict=False)
+            self._token, self._pieces = None, []
+            frame = self._stack[-1]
+            if frame[1] == "key":
+                frame[1], frame[2] = "colon", value
+            else:
+                self._attach(value)
+            return j + 1
+        return i
+
+    def _scalar(self, text, i):
+        match = _SCALAR.match(text, i)
+        self._pieces.append(match.group())
+        token = "".join(self._pieces)
+        if match.end() >= len(text) and token not in _LITERALS:
+            # A number that runs to the end of the chunk may still be growing
+            return match.end()
+        self._token, self._pieces = None, []
+        if token in _LITERALS:
+            self._attach(_LITERALS[token])
+        elif _NUMBER.fullmatch(token):
+            self._attach(json.loads(token))
+        else:
+            raise ValueError(f"Unexpected value {token!r}")
+        return match.end()
@@ -0,0 +1,152 @@
+"""
+MiniMason — System-Prompt Context Caching
+
+SYSTEM_PROMPT is several thousand tokens and identical on every request.
+With MINIMASON_PROMPT_CACHE=1 it is uploaded once per model as a Gemini
+cached-content resource, and requests reference it instead of resending it,
+which cuts billed input tokens and prefill time. The cache's TTL is extended
+before it runs out. If caching is unavailable (unsupported model, prompt
+below the provider's minimum size, quota, an endpoint without the API) the
+plain model is used and creation is retried only after a back-off.
+"""
+
+import datetime
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+# Lifetime requested for each cached-content resource, in seconds
+CACHE_TTL = int(os.environ.get("MINIMASON_PROMPT_CACHE_TTL", "3600"))
+# Extend the TTL when less than this much of it is left
+REFRESH_MARGIN = 300
+# After a failed create, use the plain model for this long before trying again
+RETRY_AFTER = 600
+
+
+def enabled():
+    return os.environ.get("MINIMASON_PROMPT_CACHE", "").lower() in ("1", "true", "yes", "on")
+
+
+def _is_cache_error(error):
+    """Whether a generate_content failure means the cached content is gone or unusable."""
+    text = str(error).lower()
+    return type(error).__name__ == "NotFound" or "cachedcontent" in text or "cached content" in text
+
+
+@dataclass
+class _Entry:
+    cache: object = None
+    refresh_at: float = 0.0
+    retry_at: float = 0.0
+    error: str = None
+
+
+class PromptCache:
+    """Cached-content resources for one system instruction, keyed by (api key, model name, endpoint)."""
+
+    def __init__(self, system_instruction, ttl=CACHE_TTL, clock=time.monotonic):
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key, model_name):
+        """
+        The CachedContent holding the system instruction for model_name, or
+        None when the plain model should be used. One caller per key does the
+        create/refresh round trip; the rest wait for it.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and self._usable(entry):
+            return entry.cache
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and self._usable(entry):
+                return entry.cache
+            if entry is None or entry.cache is None or not self._refresh(entry):
+                entry = self._create(model_name)
+            self._entries[key] = entry
+            return entry.cache
+
+    def ready(self, key):
+        """True if get() can answer for key without a create/refresh round trip."""
+        entry = self._entries.get(key)
+        return entry is not None and self._usable(entry)
+
+    def _usable(self, entry):
+        """True if entry can be returned as is: a live cache, or a fallback still backing off."""
+        now = self.clock()
+        if entry.cache is not None:
+            return now < entry.refresh_at
+        return now < entry.retry_at
+
+    def _create(self, model_name):
+        import google.generativeai as genai
+
+        try:
+            cache = genai.caching.CachedContent.create(
+                model=model_name,
+                display_name=f"minimason-{hashlib.sha256(self.system_instruction.encode()).hexdigest()[:12]}",
+                system_instruction=self.system_instruction,
+                ttl=datetime.timedelta(seconds=self.ttl),
+            )
+        except Exception as e:
+            return _Entry(retry_at=self.clock() + RETRY_AFTER, error=str(e))
+        return _Entry(cache, refresh_at=self.clock() + max(0, self.ttl - REFRESH_MARGIN))
+
+    def _refresh(self, entry):
+        """Extend an existing cache's TTL. False if it has to be recreated."""
+        try:
+            entry.cache.update(ttl=datetime.timedelta(seconds=self.ttl))
+        except Exception:
+            return False
+        entry.refresh_at = self.clock() + max(0, self.ttl - REFRESH_MARGIN)
+        return True
+
+    def report_error(self, key, error):
+        """Fall back to the plain model for key if error shows its cached content is unusable."""
+        if not _is_cache_error(error):
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.cache is not None:
+                self._entries[key] = _Entry(retry_at=self.clock() + RETRY_AFTER, error=str(error))
+
+    def status(self):
+        """Per-key cache state for display: active (with resource name) or fallback (with reason)."""
+        now = self.clock()
+        status = {}
+        for key, entry in list(self._entries.items()):
+            model_name = key[1] if isinstance(key, tuple) and len(key) > 1 else str(key)
+            if entry.cache is not None:
+                status[model_name] = {"state": "active", "name": entry.cache.name}
+            else:
+                status[model_name] = {
+                    "state": "fallback",
+                    "error": entry.error,
+                    "retry_in": round(max(0.0, entry.retry_at - now)),
+                }
+        return status
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def shared(system_instruction):
+    """Process-wide PromptCache for a system instruction, so reruns and sessions reuse one cache."""
+    fingerprint = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    with _caches_lock:
+        cache = _caches.get(fingerprint)
+        if cache is None:
+            cache = _caches[fingerprint] = PromptCache(system_instruction)
+        return cache
@@ -0,0 +1,135 @@
+"""
+MiniMason — Targeted Field Regeneration
+
+When a response comes back with a few bad or missing fields (suggested_actions
+lost to truncation, a severity outside the enum, a reply far over the SMS
+limit), re-running the whole request costs the full prompt and ~2k output
+tokens again. Instead this module works out which fields need redoing, builds
+a short prompt that asks for only those (with the existing work order as
+context), and merges the answer back in. core.py makes the call with a compact
+system instruction and a small max_output_tokens.
+
+Environment:
+    MINIMASON_REGENERATE          set to 0 to turn regeneration off (default on)
+    MINIMASON_REGENERATE_TOKENS   output token cap for a regeneration call (default 512)
+"""
+
+import json
+import os
+
+import validator
+
+MAX_OUTPUT_TOKENS = int(os.environ.get("MINIMASON_REGENERATE_TOKENS", "512"))
+# Validation passes; fields still bad after the first answer are asked for once more
+ROUNDS = 2
+# Past half the schema's fields a full re-run is the better deal
+MAX_FIELDS = 5
+
+# Findings worth a model call; banned phrases and id format are fixed locally
+_REGENERATE_KINDS = ("missing", "type", "enum", "reply_length", "too_many")
+
+_FIELD_RULES = {
+    "tenant_reply": "Ready-to-send text message: at most 4 sentences, 80-110 words, warm and plain. "
+                    "Say what you're doing about it and when they'll hear back.",
+    "suggested_actions": f"Array of 3-{validator.MAX_ACTIONS} short, concrete next steps for the property manager.",
+    "log_entry": "\"YYYY-MM-DD HH:MM | WO-XXXX | SEVERITY | CATEGORY | short summary\" using this work order's values.",
+    "red_flags": f"Array of \"FLAG_TYPE: brief explanation\" with FLAG_TYPE one of "
+                 f"{', '.join(validator.RED_FLAG_TYPES)}; empty array if none apply.",
+    "work_order.id": "\"WO-\" followed by a random 4-digit number.",
+    "work_order.category": f"One of {' | '.join(validator.CATEGORIES)}.",
+    "work_order.severity": "One of EMERGENCY (< 1 hour: flooding near electrical, gas, sparks, structural "
+                           "collapse, no heat below 32°F) | HIGH (< 4 hours: active leak, no heat or AC, "
+                           "security, sewage, water heater) | MEDIUM (24-48 hours: appliance, minor plumbing, "
+                           "non-urgent HVAC, single pest) | LOW (3-7 days: cosmetic, squeaks, routine).",
+    "work_order.description": "Clear, actionable description of the ONE primary issue for a technician.",
+    "work_order.severity_reasoning": "One sentence explaining the severity.",
+    "work_order.tenant_details": "Relevant context from the tenant's message: name/unit, timeline, key details.",
+}
+
+SYSTEM_PROMPT = (
+    "You are MiniMason, fixing individual fields of a property-maintenance work order that failed "
+    "validation. Keep every field consistent with the existing work order and the tenant's message. "
+    "Respond with ONLY a JSON object containing exactly the requested fields, nested as shown. "
+    "Never use these phrases: " + "; ".join(f'"{p}"' for p in validator.BANNED_PHRASES) + "."
+)
+
+
+def enabled():
+    return os.environ.get("MINIMASON_REGENERATE", "1").lower() not in ("0", "false", "no", "off")
+
+
+def targets(result):
+    """
+    The fields to ask for again, as dotted paths ("work_order.severity"), from
+    "_lost_fields" and the validator's findings. Empty when nothing needs a
+    model call or so much is broken that only a full re-run makes sense.
+    """
+    if "error" in result:
+        return []
+    fields = list(result.get("_lost_fields", ()))
+    for finding in validator.check(result):
+        if finding.kind in _REGENERATE_KINDS and finding.field not in fields:
+            fields.append(finding.field)
+    if not fields or len(fields) > MAX_FIELDS or "work_order" in fields:
+        return []
+    return [f for f in fields if f in _FIELD_RULES]
+
+
+def _problems(result, fields):
+    findings = {f.field: f.message for f in validator.check(result)}
+    return [f"- {field}: {findings.get(field, 'Missing.')} Rule: {_FIELD_RULES[field]}" for field in fields]
+
+
+def _shape(fields):
+    """The JSON skeleton the answer should follow, nested like the full result."""
+    shape = {}
+    for field in fields:
+        parent, _, child = field.partition(".")
+        if child:
+            shape.setdefault(parent, {})[child] = "..."
+        else:
+            shape[parent] = [] if validator.FIELD_TYPES[parent] is list else "..."
+    return json.dumps(shape, ensure_ascii=False)
+
+
+def build_prompt(tenant_message, result, fields):
+    """A short prompt asking for just the given fields, with the current work order as context."""
+    work_order = result.get("work_order") if isinstance(result.get("work_order"), dict) else {}
+    context = {k: v for k, v in work_order.items() if f"work_order.{k}" not in fields}
+    return (
+        f"TENANT MESSAGE:\n{tenant_message}\n\n"
+        f"CURRENT WORK ORDER:\n{json.dumps(context, ensure_ascii=False)}\n\n"
+        "FIX THESE FIELDS:\n" + "\n".join(_problems(result, fields)) + "\n\n"
+        f"Return ONLY: {_shape(fields)}"
+    )
+
+
+def merge(result, patch, fields):
+    """
+    Copy the well-typed values for fields from patch into result. Returns the
+    fields that were replaced; "_lost_fields" drops them (and goes when empty).
+    """
+    if not isinstance(patch, dict):
+        return []
+    merged = []
+    for field in fields:
+        parent, _, child = field.partition(".")
+        if child:
+            source = patch.get(parent)
+            value = source.get(child) if isinstance(source, dict) else patch.get(field)
+            if not isinstance(value, str) or not value.strip() or not isinstance(result.get(parent), dict):
+                continue
+            result[parent][child] = value
+        else:
+            value = patch.get(parent)
+            if not isinstance(value, validator.FIELD_TYPES[parent]):
+                continue
+            result[parent] = value
+        merged.append(field)
+
+    lost = [f for f in result.get("_lost_fields", ()) if f not in merged]
+    if lost:
+        result["_lost_fields"] = lost
+    else:
+        result.pop("_lost_fields", None)
+    return merged
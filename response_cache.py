@@ -0,0 +1,216 @@
+"""
+MiniMason — Content-Addressed Response Cache
+
+Identical submissions (same normalized tenant message, same photo bytes, same
+model chain and prompt version) map to the same key, so repeat clicks and
+resent messages skip the Gemini round trip.
+
+Two tiers:
+  - in-memory LRU (always on)
+  - on-disk JSON files with TTL and size-based eviction (set MINIMASON_CACHE_DIR)
+
+Environment:
+    MINIMASON_CACHE_DIR       directory for the disk tier (disabled if unset)
+    MINIMASON_CACHE_TTL       seconds an entry stays valid (default 86400)
+    MINIMASON_CACHE_MAX_MB    disk tier size cap in megabytes (default 100)
+    MINIMASON_CACHE_ENTRIES   in-memory LRU capacity (default 512)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_DISK_MB = 100
+
+# Result keys that describe one particular call rather than the answer
+_CALL_METADATA = {"_cache", "_timings", "_models_tried", "_usage"}
+
+
+def normalize_message(tenant_message):
+    """Collapse whitespace and case so trivially different resends share a key."""
+    return " ".join((tenant_message or "").split()).lower()
+
+
+def make_key(tenant_message, image_data=None, models=(), prompt_version=""):
+    """Content hash of everything that determines the model's answer."""
+    h = hashlib.sha256()
+    for part in (normalize_message(tenant_message), image_data or "", "|".join(models), prompt_version):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def prompt_fingerprint(*parts):
+    """Short version tag for a system prompt + generation settings."""
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class MemoryTier:
+    """Thread-safe LRU of key -> (stored_at, json_text)."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, text = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def set(self, key, text):
+        with self._lock:
+            self._entries[key] = (time.time(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskTier:
+    """One JSON file per key. Expired files are dropped on read; the oldest go first when over the size cap."""
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, text):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            now = time.time()
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    _remove_quietly(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                _remove_quietly(path)
+                total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                _remove_quietly(os.path.join(self.directory, name))
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ResponseCache:
+    """Memory LRU in front of an optional disk tier. Values are JSON-serializable result dicts."""
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory or MemoryTier()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (result, tier) where tier is "memory", "disk", or None on a miss."""
+        text = self.memory.get(key)
+        tier = "memory"
+        if text is None and self.disk is not None:
+            text = self.disk.get(key)
+            tier = "disk"
+            if text is not None:
+                self.memory.set(key, text)
+        if text is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return json.loads(text), tier
+
+    def set(self, key, result):
+        # Metadata describing this particular call doesn't belong in the cached copy
+        text = json.dumps({k: v for k, v in result.items() if k not in _CALL_METADATA}, ensure_ascii=False)
+        self.memory.set(key, text)
+        if self.disk is not None:
+            self.disk.set(key, text)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, built from the environment on first use."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            ttl = float(os.environ.get("MINIMASON_CACHE_TTL", DEFAULT_TTL))
+            memory = MemoryTier(int(os.environ.get("MINIMASON_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)), ttl)
+            disk = None
+            directory = os.environ.get("MINIMASON_CACHE_DIR")
+            if directory:
+                max_mb = float(os.environ.get("MINIMASON_CACHE_MAX_MB", DEFAULT_MAX_DISK_MB))
+                disk = DiskTier(directory, ttl, int(max_mb * 1024 * 1024))
+            _default_cache = ResponseCache(memory, disk)
+        return _default_cache
@@ -0,0 +1,170 @@
+"""
+MiniMason — Severity-Aware Scheduler
+
+Orders pending requests before they reach call_gemini. EMERGENCY work always
+goes first; everything else is served earliest-deadline-first, where the
+deadline is submission time plus the SLA window from the prompt's severity
+table (<4h, 24-48h, 3-7d). Because a waiting item's deadline never moves,
+newer MEDIUM/HIGH work can only jump ahead of an old LOW item for a bounded
+time — LOW requests age their way to the front instead of starving.
+
+Usage:
+    scheduler = SeverityScheduler(lambda msg, img=None: call_gemini(msg, img, api_key), workers=8)
+    future = scheduler.submit("I smell gas in the hallway")
+    result = future.result()
+    scheduler.shutdown()
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import triage
+
+# Start of each severity's response window from SYSTEM_PROMPT, in seconds
+SLA_SECONDS = {
+    "EMERGENCY": 60 * 60,
+    "HIGH": 4 * 60 * 60,
+    "MEDIUM": 24 * 60 * 60,
+    "LOW": 3 * 24 * 60 * 60,
+}
+
+# Severity assumed when the rules can't classify a message
+DEFAULT_SEVERITY = "MEDIUM"
+
+# Wait-time samples kept per severity for percentiles
+_WAIT_SAMPLES = 1000
+
+
+class SeverityScheduler:
+    """Priority queue plus a fixed pool of worker threads that run handler(tenant_message, *args)."""
+
+    def __init__(self, handler, workers=4, sla_seconds=None, clock=time.monotonic):
+        self.handler = handler
+        self.sla_seconds = dict(sla_seconds or SLA_SECONDS)
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = 0
+        self._waits = {sev: deque(maxlen=_WAIT_SAMPLES) for sev in self.sla_seconds}
+        self._completed = {sev: 0 for sev in self.sla_seconds}
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"minimason-scheduler-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---- Submission ----
+
+    def submit(self, tenant_message, *args, severity=None):
+        """
+        Queue handler(tenant_message, *args) and return a Future for its result.
+        Severity defaults to the rule-based provisional severity of the message.
+        """
+        if severity is None:
+            severity = triage.classify(tenant_message).severity or DEFAULT_SEVERITY
+        severity = severity.upper() if severity.upper() in self.sla_seconds else DEFAULT_SEVERITY
+
+        future = Future()
+        now = self.clock()
+        rank = 0 if severity == "EMERGENCY" else 1
+        entry = (rank, now + self.sla_seconds[severity], next(self._seq), now, severity,
+                 tenant_message, args, future)
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler has been shut down.")
+            heapq.heappush(self._heap, entry)
+            self._cond.notify()
+        return future
+
+    # ---- Workers ----
+
+    def _next(self):
+        with self._cond:
+            while not self._heap and not self._closed:
+                self._cond.wait()
+            if not self._heap:
+                return None
+            entry = heapq.heappop(self._heap)
+            _, _, _, enqueued, severity = entry[:5]
+            self._waits[severity].append(self.clock() - enqueued)
+            self._in_flight += 1
+            return entry
+
+    def _worker(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            severity, tenant_message, args, future = entry[4:]
+            result = error = None
+            running = future.set_running_or_notify_cancel()
+            if running:
+                try:
+                    result = self.handler(tenant_message, *args)
+                except Exception as e:
+                    error = e
+            # Update counters before resolving the future so stats() is current for waiters
+            with self._cond:
+                self._in_flight -= 1
+                self._completed[severity] += 1
+            if running:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work. Queued requests still run; wait=True blocks until they finish."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    # ---- Reporting ----
+
+    def stats(self):
+        """Queue depth, in-flight count, and wait-time summary (ms) per severity."""
+        with self._cond:
+            depth = {sev: 0 for sev in self.sla_seconds}
+            for entry in self._heap:
+                depth[entry[4]] += 1
+            waits = {sev: sorted(samples) for sev, samples in self._waits.items()}
+            completed = dict(self._completed)
+            in_flight = self._in_flight
+
+        wait_ms = {}
+        for sev, samples in waits.items():
+            if not samples:
+                wait_ms[sev] = {"samples": 0}
+                continue
+            wait_ms[sev] = {
+                # Percentiles cover the most recent _WAIT_SAMPLES waits; "completed" counts requests
+                "samples": len(samples),
+                "avg": round(sum(samples) / len(samples) * 1000, 1),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                "max": round(samples[-1] * 1000, 1),
+            }
+
+        return {
+            "depth": depth,
+            "queued": sum(depth.values()),
+            "in_flight": in_flight,
+            "completed": completed,
+            "wait_ms": wait_ms,
+        }
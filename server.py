@@ -0,0 +1,373 @@
+"""
+MiniMason — HTTP API
+
+A headless service so ticketing systems can call MiniMason directly. It runs
+the same pipeline as the Streamlit app and batch mode: triage, response
+cache, failover, repeat-report detection, conversation threads and the
+work-order store.
+
+Endpoints:
+    POST /v1/process   JSON {"tenant_message": "...", "photo": "<base64>", "tenant": "unit-4B", "split": false}
+                       or multipart/form-data with a tenant_message field and a photo file part
+    GET  /v1/usage     token usage and estimated cost per day and model (?days=7)
+    GET  /healthz      liveness, worker-pool load, per-model breaker state and output budget
+    GET  /metrics      Prometheus metrics
+
+Requests run on a bounded worker pool. When every worker is busy and the
+queue is full, the server answers 503 with Retry-After instead of piling up
+work. A request that passes its deadline gets a 504; its model call still
+finishes in the background and lands in the response cache, so a retry is
+cheap. Set MINIMASON_API_TOKEN to require "Authorization: Bearer <token>".
+
+Usage:
+    python server.py --port 8080 --workers 8 --timeout 120
+    curl -F tenant_message='Toilet is overflowing' -F photo=@leak.jpg http://localhost:8080/v1/process
+"""
+
+import argparse
+import base64
+import binascii
+import email.parser
+import email.policy
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs
+
+import dedup
+import failover
+import metrics
+import store
+import usage
+from core import (
+    attach_image_stats,
+    call_gemini_split,
+    call_gemini_threaded,
+    encode_image_to_base64,
+    get_api_key,
+    record_result,
+)
+
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = int(os.environ.get("MINIMASON_API_WORKERS", "8"))
+# Seconds a request may take end to end, across model failovers
+DEFAULT_TIMEOUT = float(os.environ.get("MINIMASON_API_TIMEOUT", "120"))
+# Requests allowed to wait for a worker, per worker, before new ones get a 503
+QUEUE_PER_WORKER = 4
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class ApiError(Exception):
+    """A request the API rejects, with the HTTP status to answer it with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ---------------------------------------------------------------------------
+# REQUEST PARSING
+# ---------------------------------------------------------------------------
+
+def parse_multipart(content_type, body):
+    """Split a multipart/form-data body into ({field: text}, {field: bytes}) for text fields and file parts."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    if not message.is_multipart():
+        raise ApiError(400, "Malformed multipart body.")
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files[name] = payload
+        else:
+            fields[name] = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    return fields, files
+
+
+def _flag(value, default):
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _scope(fields):
+    """The tenant scope named by a request (tenant, else unit) as a string, or None."""
+    scope = fields.get("tenant") or fields.get("unit") or None
+    if scope is None:
+        return None
+    if isinstance(scope, bool) or not isinstance(scope, (str, int)):
+        raise ApiError(400, "tenant/unit must be a string or an integer.")
+    return str(scope).strip() or None
+
+
+def parse_request(content_type, body):
+    """
+    Normalize a JSON or multipart process request to a dict with
+    tenant_message, photo (raw bytes or None), scope, split and attach_duplicates.
+    """
+    content_type = content_type or ""
+    media_type = content_type.lower()
+    if media_type.startswith("multipart/form-data"):
+        fields, files = parse_multipart(content_type, body)
+        photo = files.get("photo") or files.get("image") or None
+    elif media_type.startswith("application/json") or not media_type:
+        try:
+            fields = json.loads(body or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON.")
+        if not isinstance(fields, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        photo = None
+        if fields.get("photo"):
+            try:
+                photo = base64.b64decode(fields["photo"], validate=True)
+            except (binascii.Error, ValueError, TypeError):
+                raise ApiError(400, "photo must be base64-encoded image bytes.")
+    else:
+        raise ApiError(415, f"Unsupported Content-Type {content_type!r}; send JSON or multipart/form-data.")
+
+    tenant_message = fields.get("tenant_message") or fields.get("message") or fields.get("text") or ""
+    if not isinstance(tenant_message, str) or not tenant_message.strip():
+        raise ApiError(400, "tenant_message is required.")
+    return {
+        "tenant_message": tenant_message,
+        "photo": photo,
+        "scope": _scope(fields),
+        "split": _flag(fields.get("split"), False),
+        "attach_duplicates": _flag(fields.get("attach_duplicates"), True),
+    }
+
+
+# ---------------------------------------------------------------------------
+# SERVICE
+# ---------------------------------------------------------------------------
+
+class Service:
+    """The worker pool behind the API, with admission control and per-request deadlines."""
+
+    def __init__(self, api_key, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, queue_limit=None):
+        self.api_key = api_key
+        self.workers = workers
+        self.timeout = timeout
+        self.capacity = workers + (queue_limit if queue_limit is not None else workers * QUEUE_PER_WORKER)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="minimason-api")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def process(self, request):
+        """Run one parsed request through the pipeline. Returns a result dict, or a list when split."""
+        tenant_message = request["tenant_message"]
+        image_data = None
+        image_stats = {}
+        if request["photo"]:
+            image_data = encode_image_to_base64(BytesIO(request["photo"]), stats=image_stats)
+            if image_data is None:
+                raise ApiError(400, f"Could not process photo: {image_stats.get('error', 'unreadable file')}")
+
+        attach = request["attach_duplicates"] and dedup.enabled()
+        if request["split"]:
+            results = call_gemini_split(tenant_message, image_data, self.api_key, attach, request["scope"])
+        else:
+            results = [call_gemini_threaded(tenant_message, image_data, self.api_key, request["scope"], attach)]
+        for result in results:
+            attach_image_stats(result, image_stats)
+            record_result(result, tenant_message, source="api")
+        return results if request["split"] else results[0]
+
+    def submit(self, request):
+        """Process a request on the pool within the deadline. Returns (status, body)."""
+        if not self._slots.acquire(blocking=False):
+            metrics.ERRORS.inc(kind="api_busy")
+            raise ApiError(503, "Server is at capacity; retry shortly.")
+        with self._lock:
+            self.pending += 1
+        future = self.executor.submit(self.process, request)
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            metrics.ERRORS.inc(kind="api_timeout")
+            raise ApiError(504, f"Request did not finish within {self.timeout:g}s.")
+
+        if isinstance(result, list):
+            ok = any("error" not in r for r in result)
+            return (200 if ok else 502), {"results": result}
+        return (502 if "error" in result else 200), result
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def health(self):
+        return {
+            "status": "ok" if self.api_key else "no_api_key",
+            "workers": self.workers,
+            "pending": self.pending,
+            "capacity": self.capacity,
+            "models": failover.get_pool().stats(),
+            "output_budget": usage.get_budget().stats(),
+        }
+
+    def usage(self, days=7):
+        """Per-day, per-model usage from the store, or None when the store is off."""
+        work_orders = store.get_store()
+        if work_orders is None:
+            return None
+        return work_orders.usage(since=time.time() - days * 86400)
+
+
+# ---------------------------------------------------------------------------
+# SERVER
+# ---------------------------------------------------------------------------
+
+def _handler_class(service, token=None):
+    """A request handler bound to a Service."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self._send(status, payload, "application/json; charset=utf-8", headers)
+
+        def _authorized(self):
+            if not token:
+                return True
+            supplied = self.headers.get("Authorization", "")
+            return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/v1/usage":
+                if not self._authorized():
+                    self._send_json(401, {"error": "Missing or invalid bearer token."}, {"WWW-Authenticate": "Bearer"})
+                    return
+                try:
+                    days = int(parse_qs(query).get("days", ["7"])[0])
+                except ValueError:
+                    self._send_json(400, {"error": "days must be an integer."})
+                    return
+                rows = service.usage(days)
+                if rows is None:
+                    self._send_json(404, {"error": "Usage is recorded in the store, which is turned off."})
+                else:
+                    self._send_json(200, {"days": days, "usage": rows})
+            elif path == "/healthz":
+                health = service.health()
+                self._send_json(200 if health["status"] == "ok" else 503, health)
+            elif path == "/metrics":
+                self._send(200, metrics.REGISTRY.render().encode("utf-8"), metrics.CONTENT_TYPE)
+            else:
+                self._send_json(404, {"error": f"No route for GET {path}"})
+
+        def do_POST(self):
+            path = self.path.split("?", 1)[0]
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_BODY_BYTES:
+                # Refuse without reading the body, and don't reuse the connection
+                self.close_connection = True
+                status = 400 if length < 0 else 413
+                self._send_json(status, {"error": "Bad Content-Length." if length < 0 else "Request body too large."})
+                return
+            body = self.rfile.read(length)
+
+            if path != "/v1/process":
+                self._send_json(404, {"error": f"No route for POST {path}"})
+                return
+            if not self._authorized():
+                self._send_json(401, {"error": "Missing or invalid bearer token."}, {"WWW-Authenticate": "Bearer"})
+                return
+            try:
+                status, response = service.submit(parse_request(self.headers.get("Content-Type"), body))
+            except ApiError as e:
+                headers = {"Retry-After": "1"} if e.status == 503 else None
+                self._send_json(e.status, {"error": e.message}, headers)
+                return
+            except Exception as e:
+                metrics.ERRORS.inc(kind="unexpected")
+                self._send_json(500, {"error": f"Unexpected error: {e}"})
+                return
+            self._send_json(status, response)
+
+    return Handler
+
+
+def serve(service, host="0.0.0.0", port=DEFAULT_PORT, token=None):
+    """Create the HTTP server for a Service. Call serve_forever() on the result."""
+    server = ThreadingHTTPServer((host, port), _handler_class(service, token))
+    server.daemon_threads = True
+    return server
+
+
+def start(service, host="127.0.0.1", port=0, token=None):
+    """Run the API on a background thread (port 0 picks a free port). Returns (server, base URL)."""
+    server = serve(service, host, port, token)
+    threading.Thread(target=server.serve_forever, name="minimason-api", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve MiniMason as an HTTP API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="Requests processed concurrently.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Per-request deadline in seconds.")
+    args = parser.parse_args(argv)
+
+    api_key = get_api_key()
+    if not api_key:
+        print("No API key configured. Please set GEMINI_API_KEY.", file=sys.stderr)
+        return 1
+
+    service = Service(api_key, args.workers, args.timeout)
+    server = serve(service, args.host, args.port, os.environ.get("MINIMASON_API_TOKEN") or None)
+    print(f"MiniMason API on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, {args.timeout:g}s timeout). Ctrl+C to stop.", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
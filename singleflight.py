@@ -0,0 +1,99 @@
+"""
+MiniMason — Single-Flight Request Coalescing
+
+Two managers (or two tabs) pressing Process on the same message at the same
+moment would otherwise both pay for a Gemini call: neither finds the result
+in the response cache because neither has finished. A Group lets the first
+caller for a key run the call while concurrent callers with the same key wait
+for it and receive a copy of its result.
+
+The group lives at module level, so it is shared by every Streamlit session
+in the process (app.py itself is re-executed on each rerun and cannot hold
+it), and by sync, async and streaming callers alike.
+"""
+
+import copy
+import threading
+from concurrent.futures import Future
+
+
+class Group:
+    """In-flight calls keyed by request key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """
+        Return (future, leader). The leader must run the call and pass its
+        outcome to finish(); everyone else waits on the future.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def finish(self, key, future, value=None, error=None):
+        """Publish the leader's outcome and let the next call for key start afresh."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            # Waiters copy from a snapshot, so the leader can keep modifying its own result
+            future.set_result(copy.deepcopy(value))
+
+    def do(self, key, fn):
+        """
+        Run fn() unless an identical call is already in flight, in which case
+        wait for it. Returns (value, shared). A waiter whose leader raised runs
+        fn() itself rather than inheriting the error.
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            try:
+                return copy.deepcopy(future.result()), True
+            except Exception:
+                return fn(), False
+        try:
+            value = fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, value)
+        return value, False
+
+    async def do_async(self, key, fn):
+        """Async do(): fn() returns an awaitable. Waiting never blocks the event loop."""
+        import asyncio
+
+        future, leader = self.claim(key)
+        if not leader:
+            try:
+                return copy.deepcopy(await asyncio.wrap_future(future)), True
+            except Exception:
+                return await fn(), False
+        try:
+            value = await fn()
+        except BaseException as e:
+            # Includes cancellation: waiters in other sessions then make their own call
+            self.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Leader call cancelled"))
+            raise
+        self.finish(key, future, value)
+        return value, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+_group = Group()
+
+
+def get_group():
+    """Process-wide Group shared by every session and call path."""
+    return _group
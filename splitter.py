@@ -0,0 +1,124 @@
+"""
+MiniMason — Multi-Issue Splitting
+
+The Unit of Work rule says one work order per issue, but tenants bundle
+("also the faucet drips and the closet door squeaks"). This module finds the
+distinct issues in a message with the triage rules and fans them out as
+parallel sub-requests, so total latency is that of the slowest issue rather
+than the sum, and the results come back as linked work orders.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import triage
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# Clause boundaries inside a sentence: commas/semicolons, or "and"/"also" before a new subject
+_CLAUSE = re.compile(
+    r"\s*[;,]\s*(?:and\s+)?(?:now\s+)?|\s+and\s+(?=(?:the|my|our|also|now)\b)|\s+also\s+",
+    re.IGNORECASE,
+)
+
+# Remarks that apply to the whole message (and drive red flags), not to one issue
+_MESSAGE_LEVEL = re.compile(
+    r"\brent\b|\blawyer|\blegal\b|\bwithhold|\bdeduct|\bhealth\s+department|\bcontractor"
+    r"|\brequests?\b|\bpatient\b|\$\d",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Issue:
+    """One distinct problem found in a tenant message."""
+    text: str
+    severity: str
+    category: str
+    rule: str
+    clauses: list = field(default_factory=list)
+
+
+def _top_rule(provisional):
+    """The rule that decided a triage result (the first matched rule at its severity and category)."""
+    for rule in triage.RULES:
+        if rule.name in provisional.rules and rule.category == provisional.category:
+            return rule.name
+    return provisional.rules[0]
+
+
+def _split_sentence(sentence):
+    """Break a sentence into clauses only if it names more than one distinct issue."""
+    clauses = [c.strip() for c in _CLAUSE.split(sentence) if c and c.strip()]
+    if len(clauses) < 2:
+        return [sentence]
+    rules = {_top_rule(t) for t in map(triage.classify, clauses) if t.severity}
+    return clauses if len(rules) > 1 else [sentence]
+
+
+def split_issues(tenant_message):
+    """
+    Return (issues, context). issues are the distinct problems, most severe
+    first; context is the sentences that describe no issue on their own
+    (timelines, rent references, threats) and is shared by every sub-request.
+    """
+    issues = {}
+    context = []
+    last = None
+
+    for sentence in _SENTENCE.split((tenant_message or "").strip()):
+        for clause in _split_sentence(sentence):
+            provisional = triage.classify(clause)
+            if not provisional.severity:
+                # Rent/legal/history remarks concern every issue; other sentences continue
+                # the previous issue ("I tried plunging it but...") or open the message
+                if last is None or _MESSAGE_LEVEL.search(clause):
+                    context.append(clause)
+                else:
+                    last.clauses.append(clause)
+                continue
+            rule = _top_rule(provisional)
+            issue = issues.get(rule)
+            if issue is None:
+                issue = issues[rule] = Issue("", provisional.severity, provisional.category, rule)
+            issue.clauses.append(clause)
+            last = issue
+
+    for issue in issues.values():
+        issue.text = " ".join(issue.clauses)
+
+    ordered = sorted(issues.values(), key=lambda i: -triage.SEVERITY_RANK[i.severity])
+    return ordered, context
+
+
+def sub_request(issue, context):
+    """The tenant message sent to the model for one issue."""
+    if not context:
+        return issue.text
+    return f"{issue.text}\n\n(Other context from the same message: {' '.join(context)})"
+
+
+def process_split(tenant_message, handler, max_workers=None):
+    """
+    Split a message into issues and run handler(sub_message) for each in
+    parallel. Returns a list of results (most severe issue first), each tagged
+    with "_split" linking it to its sibling work orders. A message with zero
+    or one issue is handled as a single request.
+    """
+    issues, context = split_issues(tenant_message)
+    if len(issues) < 2:
+        return [handler(tenant_message)]
+
+    messages = [sub_request(issue, context) for issue in issues]
+    with ThreadPoolExecutor(max_workers=max_workers or len(messages)) as executor:
+        results = list(executor.map(handler, messages))
+
+    ids = [r.get("work_order", {}).get("id") if "error" not in r else None for r in results]
+    for index, (issue, result) in enumerate(zip(issues, results)):
+        result["_split"] = {
+            "index": index + 1,
+            "total": len(results),
+            "issue": issue.text,
+            "linked_work_orders": [wo_id for i, wo_id in enumerate(ids) if i != index and wo_id],
+        }
+    return results
@@ -0,0 +1,320 @@
+"""
+MiniMason — Work-Order Store
+
+Durable history of every processed work order, and of every model call's
+token usage, in SQLite (WAL mode, so readers never block the writer). Results are queued and written by a
+background thread in batched transactions, so recording a result costs the
+caller a queue put rather than an fsync. Indexes on severity, category,
+creation time and work-order ID keep history queries fast at hundreds of
+thousands of rows. A batch that can't be written is logged and counted in
+minimason_store_dropped_rows_total rather than stopping the writer.
+
+Configure with MINIMASON_DB_PATH (default minimason.db); set it empty to
+turn the store off.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = "minimason.db"
+# Rows per transaction, and the longest a queued row waits before being written
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_orders (
+    id INTEGER PRIMARY KEY,
+    wo_id TEXT,
+    created_at REAL NOT NULL,
+    source TEXT,
+    severity TEXT,
+    category TEXT,
+    tenant_message TEXT,
+    description TEXT,
+    tenant_reply TEXT,
+    suggested_actions TEXT,
+    red_flags TEXT,
+    log_entry TEXT,
+    model TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    timings TEXT,
+    usage TEXT,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_work_orders_wo_id ON work_orders (wo_id);
+CREATE INDEX IF NOT EXISTS idx_work_orders_created_at ON work_orders (created_at);
+CREATE INDEX IF NOT EXISTS idx_work_orders_severity ON work_orders (severity, created_at);
+CREATE INDEX IF NOT EXISTS idx_work_orders_category ON work_orders (category, created_at);
+CREATE TABLE IF NOT EXISTS model_calls (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms REAL,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    max_output_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_model_calls_day ON model_calls (day, model);
+"""
+
+_COLUMNS = (
+    "wo_id", "created_at", "source", "severity", "category", "tenant_message", "description",
+    "tenant_reply", "suggested_actions", "red_flags", "log_entry", "model", "cached", "timings",
+    "usage", "result",
+)
+_INSERT = f"INSERT INTO work_orders ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+_JSON_COLUMNS = ("suggested_actions", "red_flags", "timings", "usage", "result")
+_INSERT_CALL = (
+    "INSERT INTO model_calls (created_at, day, model, kind, prompt_tokens, cached_tokens, output_tokens, "
+    "latency_ms, cost_usd, max_output_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+_STOP = object()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last few commits, never corrupt
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def to_row(result, tenant_message="", source="ui", created_at=None):
+    """The column values for one result, in _COLUMNS order."""
+    work_order = result.get("work_order") or {}
+    return (
+        work_order.get("id"),
+        created_at if created_at is not None else time.time(),
+        source,
+        str(work_order.get("severity") or "").upper() or None,
+        str(work_order.get("category") or "").upper() or None,
+        tenant_message,
+        work_order.get("description"),
+        result.get("tenant_reply"),
+        json.dumps(result.get("suggested_actions") or [], ensure_ascii=False),
+        json.dumps(result.get("red_flags") or [], ensure_ascii=False),
+        result.get("log_entry"),
+        result.get("_model_used"),
+        1 if str(result.get("_cache", "")).startswith("hit") else 0,
+        json.dumps(result.get("_timings") or {}),
+        json.dumps(result.get("_usage") or {}),
+        json.dumps(result, ensure_ascii=False, default=str),
+    )
+
+
+def _from_row(row):
+    record = dict(row)
+    for column in _JSON_COLUMNS:
+        if record.get(column):
+            record[column] = json.loads(record[column])
+    record["cached"] = bool(record["cached"])
+    return record
+
+
+class WorkOrderStore:
+    """SQLite-backed work-order history with a batching background writer."""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+
+        conn = _connect(path)
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="minimason-store", daemon=True)
+        self._writer.start()
+
+    # ---- Writing ----
+
+    def add(self, result, tenant_message="", source="ui"):
+        """Queue a result for writing. Errors and streaming partials are not stored."""
+        if self._closed or "error" in result or result.get("_partial"):
+            return
+        self._queue.put((_INSERT, to_row(result, tenant_message, source)))
+
+    def add_call(self, model, kind, usage, max_output_tokens=None, created_at=None):
+        """Queue one model call's usage (token counts, latency_ms, cost_usd) for writing."""
+        if self._closed:
+            return
+        created_at = created_at if created_at is not None else time.time()
+        self._queue.put((_INSERT_CALL, (
+            created_at, time.strftime("%Y-%m-%d", time.localtime(created_at)), model, kind,
+            usage.get("prompt_tokens", 0), usage.get("cached_tokens", 0), usage.get("output_tokens", 0),
+            usage.get("latency_ms"), usage.get("cost_usd", 0.0), max_output_tokens,
+        )))
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far has been written (or dropped).
+        Returns False on timeout or if the writer has stopped.
+        """
+        if not self._writer.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Wait in slices so a writer that exits (close() racing us) can't strand the caller
+        while not done.wait(0.1):
+            if not self._writer.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                return done.is_set()
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        batch, waiters = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stop = item is _STOP
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None and not stop:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # A steady trickle never lets get() time out, so check the deadline here too
+            due = item is None or (deadline is not None and time.monotonic() >= deadline)
+            if batch and (due or stop or waiters or len(batch) >= self.batch_size):
+                self._write_batch(conn, batch)
+                batch = []
+                deadline = None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+            if stop:
+                conn.close()
+                return
+
+    def _write_batch(self, conn, batch):
+        """
+        Commit one batch. Locks are already waited out by the connection's busy
+        timeout, so a batch that still fails (disk full, read-only file) is
+        dropped, logged and counted: better than killing the writer, and the
+        results were already returned.
+        """
+        try:
+            with conn:
+                for statement in dict.fromkeys(sql for sql, _ in batch):
+                    conn.executemany(statement, [row for sql, row in batch if sql == statement])
+            return True
+        except sqlite3.Error as e:
+            for table, sql in (("work_orders", _INSERT), ("model_calls", _INSERT_CALL)):
+                dropped = sum(1 for statement, _ in batch if statement == sql)
+                if dropped:
+                    metrics.STORE_DROPPED.inc(dropped, table=table)
+            log.error("Work-order store dropped %d rows writing to %s: %s", len(batch), self.path, e)
+            return False
+
+    # ---- Reading ----
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def get(self, wo_id):
+        """The most recent stored work order with this ID, or None."""
+        row = self._reader().execute(
+            "SELECT * FROM work_orders WHERE wo_id = ? ORDER BY created_at DESC LIMIT 1", (wo_id,)
+        ).fetchone()
+        return _from_row(row) if row else None
+
+    def recent(self, limit=50, severity=None, category=None, since=None, until=None):
+        """Newest work orders first, optionally filtered by severity, category and time range (epoch seconds)."""
+        clauses, params = [], []
+        if severity:
+            clauses.append("severity = ?")
+            params.append(severity.upper())
+        if category:
+            clauses.append("category = ?")
+            params.append(category.upper())
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT * FROM work_orders {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def counts(self, since=None):
+        """Work orders per severity, optionally since an epoch time."""
+        where, params = ("WHERE created_at >= ?", (since,)) if since is not None else ("", ())
+        rows = self._reader().execute(
+            f"SELECT severity, COUNT(*) AS n FROM work_orders {where} GROUP BY severity", params
+        ).fetchall()
+        return {row["severity"]: row["n"] for row in rows}
+
+    def usage(self, since=None, until=None):
+        """Model-call totals per local day and model, newest day first."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            "SELECT day, model, COUNT(*) AS calls, SUM(kind = 'regenerate') AS regenerations, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(cached_tokens) AS cached_tokens, "
+            "SUM(output_tokens) AS output_tokens, COALESCE(AVG(latency_ms), 0) AS avg_latency_ms, "
+            "MAX(output_tokens) AS largest_output, SUM(cost_usd) AS cost_usd "
+            f"FROM model_calls {where} GROUP BY day, model ORDER BY day DESC, model", params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide WorkOrderStore from MINIMASON_DB_PATH, or None when the store is turned off."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get("MINIMASON_DB_PATH", DEFAULT_PATH)
+            if not path:
+                return None
+            _store = WorkOrderStore(path)
+            atexit.register(_store.close)
+        return _store
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Modules read their settings at import time: keep the store off and the tests offline
+os.environ["MINIMASON_DB_PATH"] = ""
+os.environ.pop("GEMINI_API_ENDPOINT", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """A local Gemini stand-in (fake_gemini.py) with the pipeline pointed at it."""
+    pytest.importorskip("google.generativeai")
+    import fake_gemini
+
+    fake = fake_gemini.FakeGemini(profile=fake_gemini.FaultProfile(latency_ms=5, latency_dist="fixed"), seed=1)
+    server, url = fake_gemini.start(fake)
+    monkeypatch.setenv("GEMINI_API_ENDPOINT", url)
+    yield fake
+    server.shutdown()
+    server.server_close()
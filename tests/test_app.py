@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def run_app():
+    return AppTest.from_file(APP, default_timeout=60).run()
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label.startswith(label))
+
+
+def test_renders_without_a_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "your_api_key_here")
+    at = run_app()
+    assert not at.exception
+    assert "No Gemini API key found" in at.warning[0].value
+    assert button(at, "🚀 Process").disabled
+
+
+def test_demo_scenario_fills_the_message(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    at = run_app()
+    scenario = next(name for name in at.selectbox(key="scenario_selector").options if not name.startswith("—"))
+    at.selectbox(key="scenario_selector").select(scenario).run()
+    assert at.text_area[0].value
+    assert not button(at, "🚀 Process").disabled
+
+
+def test_process_renders_the_work_order(fake_api, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    at = run_app()
+    at.text_area[0].input("App test: the toilet is overflowing onto the floor").run()
+    button(at, "🚀 Process").click().run()
+    assert not at.exception
+    result = at.session_state["result"]
+    assert result["work_order"]["severity"] == "HIGH"
+    assert any(result["work_order"]["id"] in m.value for m in at.markdown)
+
+
+def test_split_result_gets_a_tab_per_work_order(monkeypatch):
+    from test_validator import valid_result
+
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    at = AppTest.from_file(APP, default_timeout=60)
+    second = valid_result()
+    second["work_order"]["id"] = "WO-5678"
+    at.session_state["result"] = [valid_result(), second, {"error": "API call failed"}]
+    at.run()
+    assert not at.exception
+    assert [tab.label for tab in at.tabs] == ["WO-1234 · HIGH", "WO-5678 · HIGH", "Issue 3 · error"]
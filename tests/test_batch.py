@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+core = pytest.importorskip("core")
+batch = pytest.importorskip("batch")
+
+
+def write_inbox(path, lines):
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+    return str(path)
+
+
+def read_rows(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_results_come_back_in_input_order(fake_api, tmp_path):
+    from PIL import Image
+
+    Image.new("RGB", (3000, 2000), "gray").save(tmp_path / "leak.jpg")
+    inbox = write_inbox(tmp_path / "inbox.jsonl", [
+        {"id": "a", "tenant_message": "Batch test: the closet door squeaks"},
+        {"id": "b", "message": "Batch test: water heater is leaking", "photo": "leak.jpg"},
+        "{not json",
+        {"id": "d", "tenant_message": "   "},
+        {"id": "e", "text": "Batch test: there's a photo", "photo_path": "missing.jpg"},
+        [1, 2],
+    ])
+    summary = batch.run_batch(inbox, str(tmp_path / "out.jsonl"), api_key="test-key", max_workers=2)
+    rows = read_rows(tmp_path / "out.jsonl")
+
+    assert [row["id"] for row in rows] == ["a", "b", 3, "d", "e", 6]
+    assert (summary["processed"], summary["failed"]) == (6, 4)
+    assert rows[0]["result"]["work_order"]["severity"] == "LOW"
+    assert max(rows[1]["result"]["_image"]["encoded_size"]) <= core.IMAGE_MAX_EDGE
+    assert rows[2]["result"]["error"].startswith("Invalid JSON on line 3")
+    assert rows[3]["result"]["error"] == "Record has no tenant message."
+    assert rows[4]["result"]["error"].startswith("Photo not found")
+    assert rows[5]["result"]["error"] == "Line 6 is not a JSON object."
+
+
+def test_prioritized_run_reports_queue_stats(fake_api, tmp_path):
+    inbox = write_inbox(tmp_path / "inbox.jsonl", [
+        {"id": "low", "tenant_message": "Batch priority test: cabinet hinge is loose"},
+        {"id": "gas", "tenant_message": "Batch priority test: I smell gas in the kitchen"},
+    ])
+    summary = batch.run_batch(inbox, str(tmp_path / "out.jsonl"), api_key="test-key", max_workers=1,
+                              prioritize=True)
+    assert [row["id"] for row in read_rows(tmp_path / "out.jsonl")] == ["low", "gas"]
+    assert summary["failed"] == 0
+    assert summary["queue"]["completed"]["EMERGENCY"] == 1
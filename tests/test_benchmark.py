@@ -0,0 +1,41 @@
+import pytest
+
+benchmark = pytest.importorskip("benchmark")
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(1, 101))
+    assert benchmark.percentile(samples, 50) == 50
+    assert benchmark.percentile(samples, 95) == 95
+    assert benchmark.percentile([7], 99) == 7
+    assert benchmark.percentile([], 50) is None
+
+
+def test_summarize_reports_milliseconds():
+    assert benchmark.summarize([0.01, 0.02, 0.03]) == {"count": 3, "p50": 20.0, "p95": 30.0, "p99": 30.0,
+                                                        "max": 30.0}
+    assert benchmark.summarize([]) == {"count": 0}
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"stages": {"triage": {"p95": 1.0}, "call_gemini": {"p95": 100.0}}}
+    current = {"stages": {"triage": {"p95": 1.1}, "call_gemini": {"p95": 150.0}, "new": {"p95": 5.0}}}
+    regressions = benchmark.compare(current, baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("call_gemini: p95 100.0ms → 150.0ms")
+
+
+def test_workload_cycles_scenarios_and_photo_sizes():
+    workload = benchmark.build_workload(5, photo_mix=("none", "small"))
+    assert [label for _, label, _ in workload] == ["none", "small", "none", "small", "none"]
+    assert workload[0][2] is None and workload[1][2][:2] == b"\xff\xd8"
+    assert workload[0][0] == benchmark.scenario_messages()[0]
+
+
+def test_stub_run_reports_every_stage_and_level():
+    with benchmark.stub_backend(latency_ms=1):
+        report = benchmark.run_benchmark(requests=4, concurrency_levels=[1, 2], api_key="key")
+    assert [row["concurrency"] for row in report["throughput"]] == [1, 2]
+    assert all(row["errors"] == 0 for row in report["throughput"])
+    assert report["stages"]["end_to_end"]["count"] == 8
+    assert report["stages"]["image_encode"]["count"] == 6  # three of every four items carry a photo
+    assert set(report["image_encode_by_size"]) == set(benchmark.PHOTO_SIZES)
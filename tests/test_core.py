@@ -0,0 +1,150 @@
+import base64
+import json
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+
+core = pytest.importorskip("core")
+Image = pytest.importorskip("PIL.Image")
+
+
+def image_bytes(mode="RGB", size=(40, 30), fmt="JPEG", color="gray", orientation=None):
+    buffer = BytesIO()
+    image = Image.new(mode, size, color)
+    if orientation:
+        exif = image.getexif()
+        exif[core._EXIF_ORIENTATION] = orientation
+        image.save(buffer, format=fmt, exif=exif)
+    else:
+        image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def decoded(data):
+    return Image.open(BytesIO(data))
+
+
+def test_small_upright_jpeg_is_sent_as_is():
+    raw = image_bytes()
+    data, stats = core.preprocess_image(BytesIO(raw))
+    assert data == raw
+    assert stats["original_bytes"] == stats["encoded_bytes"]
+
+
+def test_large_image_is_downscaled_keeping_aspect():
+    data, stats = core.preprocess_image(BytesIO(image_bytes(size=(4000, 3000))), max_edge=800)
+    assert decoded(data).size == (800, 600)
+    assert stats["original_size"] == [4000, 3000] and stats["encoded_size"] == [800, 600]
+
+
+def test_exif_rotation_is_applied():
+    data, _ = core.preprocess_image(BytesIO(image_bytes(size=(40, 30), orientation=6)))
+    assert decoded(data).size == (30, 40)
+
+
+def test_transparency_is_flattened_onto_white():
+    data, _ = core.preprocess_image(BytesIO(image_bytes("RGBA", fmt="PNG", color=(0, 0, 0, 0))))
+    image = decoded(data)
+    assert (image.format, image.mode) == ("JPEG", "RGB")
+    assert min(image.getpixel((20, 15))) > 240
+
+
+def test_sixteen_bit_grayscale_is_stretched_not_clipped():
+    image = Image.new("I;16", (40, 30))
+    image.putpixel((0, 0), 4000)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    data, _ = core.preprocess_image(BytesIO(buffer.getvalue()))
+    assert decoded(data).convert("L").getpixel((20, 15)) < 20
+
+
+def test_encode_reports_unreadable_files():
+    stats = {}
+    assert core.encode_image_to_base64(BytesIO(b"not an image"), stats=stats) is None
+    assert "error" in stats
+
+
+def test_encode_accepts_paths(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(image_bytes())
+    stats = {}
+    assert base64.b64decode(core.encode_image_to_base64(str(path), stats=stats)) == path.read_bytes()
+    assert "encode_ms" in stats
+
+
+class SlowModel:
+    """Stands in for an async GenerativeModel, tracking how many calls overlap."""
+
+    def __init__(self, text):
+        self.text = text
+        self.in_flight = self.peak = self.calls = 0
+
+    async def generate_content_async(self, parts, **kwargs):
+        import asyncio
+
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        return SimpleNamespace(text=self.text, usage_metadata=None, candidates=[])
+
+
+@pytest.fixture
+def slow_model(monkeypatch):
+    import failover
+    from test_validator import valid_result
+
+    model = SlowModel(json.dumps(valid_result()))
+
+    async def model_for(api_key, model_name):
+        return model
+
+    monkeypatch.setattr(core, "_async_model_for", model_for)
+    monkeypatch.setattr(failover, "_pool", failover.ModelPool(hedge_percentile=0))
+    return model
+
+
+def test_async_calls_are_capped_per_event_loop(slow_model, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(core, "ASYNC_CONCURRENCY", core.ASYNC_CONCURRENCY)
+    core.set_async_concurrency(2)
+
+    async def burst():
+        return await asyncio.gather(*(
+            core.call_gemini_async(f"Async burst {i}: faucet drips", api_key="key", use_cache=False)
+            for i in range(6)))
+
+    results = asyncio.run(burst())
+    assert all("error" not in r for r in results)
+    assert (slow_model.calls, slow_model.peak) == (6, 2)
+
+    # A new loop gets its own limiter
+    asyncio.run(burst())
+    assert slow_model.peak == 2
+
+
+def test_async_call_needs_an_api_key():
+    import asyncio
+
+    assert "error" in asyncio.run(core.call_gemini_async("Sink leaking", api_key=None))
+
+
+def test_models_are_built_once_per_configuration(monkeypatch):
+    pytest.importorskip("google.generativeai")
+    monkeypatch.delenv("MINIMASON_PROMPT_CACHE", raising=False)
+    model = core._model_for("key", core.MODEL_NAMES[0])
+    assert core._model_for("key", core.MODEL_NAMES[0]) is model
+    assert core._model_for("other-key", core.MODEL_NAMES[0]) is not model
+    assert core._model_for("key", core.MODEL_NAMES[1]) is not model
+    monkeypatch.setenv("GEMINI_API_ENDPOINT", "http://127.0.0.1:9")
+    assert core._model_for("key", core.MODEL_NAMES[0]) is not model
+
+
+def test_importing_the_pipeline_loads_no_heavy_dependencies():
+    benchmark = pytest.importorskip("benchmark")
+    report = benchmark.import_times(["core", "batch", "server"], runs=1)
+    assert report["core"]["loaded"] == [] and report["batch"]["loaded"] == []
+    assert report["server"]["loaded"] == ["http.server"]
@@ -0,0 +1,79 @@
+import base64
+from io import BytesIO
+
+import pytest
+
+import dedup
+
+RESULT = {"work_order": {"id": "WO-1111", "category": "PLUMBING"}, "tenant_reply": "On it."}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def index():
+    return dedup.DuplicateIndex(window=3600, threshold=0.6, clock=Clock())
+
+
+def test_tokens_drop_stopwords_and_stem():
+    assert dedup.tokens("My sink is LEAKING and it leaks") == {"sink", "leak"}
+
+
+def test_repeat_from_same_scope_matches(index):
+    index.add("My kitchen sink is leaking under the cabinet", None, RESULT, "4B")
+    match = index.find("kitchen sink STILL leaking under the cabinet!!", None, "4B")
+    assert match is not None and match.result["work_order"]["id"] == "WO-1111"
+    assert match.reports == 2
+
+
+def test_other_scope_and_no_scope_never_match(index):
+    index.add("My kitchen sink is leaking under the cabinet", None, RESULT, "4B")
+    assert index.find("My kitchen sink is leaking under the cabinet", None, "5C") is None
+    assert index.find("My kitchen sink is leaking under the cabinet", None, None) is None
+    index.add("My kitchen sink is leaking under the cabinet", None, RESULT, None)
+    assert len(index) == 1
+
+
+def test_different_categories_never_match(index):
+    index.add("The kitchen sink is clogged and smells", None, RESULT, "4B")
+    assert index.find("The kitchen smells like gas", None, "4B") is None
+
+
+def test_entries_expire(index):
+    index.add("My kitchen sink is leaking under the cabinet", None, RESULT, "4B")
+    index.clock.now += 3601
+    assert index.find("My kitchen sink is leaking under the cabinet", None, "4B") is None
+
+
+def test_incomplete_results_are_not_indexed(index):
+    index.add("My kitchen sink is leaking", None, {"error": "boom"}, "4B")
+    index.add("My kitchen sink is leaking", None, {**RESULT, "_lost_fields": ["log_entry"]}, "4B")
+    assert len(index) == 0
+
+
+def test_returned_result_is_a_copy(index):
+    index.add("My kitchen sink is leaking under the cabinet", None, RESULT, "4B")
+    index.find("My kitchen sink is leaking under the cabinet", None, "4B").result["work_order"]["id"] = "changed"
+    assert index.find("My kitchen sink is leaking under the cabinet", None, "4B").result["work_order"]["id"] == "WO-1111"
+
+
+def _photo(shade):
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.new("RGB", (64, 64), (shade, shade, shade))
+    image.paste((255 - shade, 0, 0), (0, 0, 32, 64))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_same_photo_loosens_the_wording_threshold(index):
+    photo = _photo(200)
+    index.add("Water stain on the bathroom ceiling", photo, RESULT, "4B")
+    assert index.find("Bathroom ceiling stain getting bigger", None, "4B") is None
+    assert index.find("Bathroom ceiling stain getting bigger", photo, "4B") is not None
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+
+import failover
+from failover import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ModelPool
+
+MODELS = ["primary", "secondary", "tertiary"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(clock, threshold=2):
+    return ModelPool(hedge_percentile=0, breaker_factory=lambda: CircuitBreaker(
+        failure_threshold=threshold, slow_seconds=10, cooldown=30, clock=clock))
+
+
+def test_breaker_opens_after_threshold_and_probes_after_cooldown():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30, clock=clock)
+    assert breaker.record(False) is False and breaker.state == CLOSED
+    assert breaker.record(False) is True and breaker.state == OPEN
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()  # one probe at a time
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_restarts_cooldown():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30, clock=clock)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.reopens_in() == 30
+
+
+def test_slow_success_counts_as_failure():
+    breaker = CircuitBreaker(failure_threshold=1, slow_seconds=1)
+    breaker.record(True, 5.0)
+    assert breaker.state == OPEN
+
+
+def test_pick_fails_over_to_next_healthy_model():
+    clock = Clock()
+    pool = make_pool(clock, threshold=1)
+    assert pool.pick(MODELS) == "primary"
+    pool.record("primary", False)
+    assert pool.pick(MODELS) == "secondary"
+    assert pool.pick(MODELS, tried=["secondary"]) == "tertiary"
+
+
+def test_pick_never_refuses():
+    clock = Clock()
+    pool = make_pool(clock, threshold=1)
+    for name in MODELS:
+        pool.record(name, False)
+        clock.now += 1
+    assert pool.pick(MODELS) == "primary"  # reopens soonest
+
+
+def test_timed_records_outcome():
+    pool = make_pool(Clock(), threshold=1)
+    with pytest.raises(RuntimeError):
+        failover.timed(pool, "primary", lambda: (_ for _ in ()).throw(RuntimeError("down")))
+    assert pool.breaker("primary").state == OPEN
+    latency, value = failover.timed(pool, "secondary", lambda: "ok")
+    assert value == "ok" and latency >= 0
+
+
+def test_hedged_returns_the_faster_backup():
+    pool = make_pool(Clock())
+    started = []
+
+    def call(name):
+        time.sleep(0.5 if name == "primary" else 0.01)
+        return name
+
+    name, _, value = failover.hedged(pool, "primary", 0.05, call, lambda: "secondary", started=started)
+    assert (name, value) == ("secondary", "secondary")
+    assert started == ["primary", "secondary"]
+
+
+def test_cancelled_async_call_releases_probe():
+    clock = Clock()
+    pool = make_pool(clock, threshold=1)
+    pool.record("primary", False)
+    clock.now += 30
+    assert pool.breaker("primary").allow()
+
+    async def main():
+        task = asyncio.ensure_future(failover.timed_async(pool, "primary", asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    breaker = pool.breaker("primary")
+    assert not breaker.probing and breaker.state == HALF_OPEN
+
+
+def test_async_request_cancelled_while_queued_releases_probe(monkeypatch):
+    core = pytest.importorskip("core")
+    clock = Clock()
+    pool = make_pool(clock, threshold=1)
+    monkeypatch.setattr(failover, "get_pool", lambda: pool)
+    for name in core.MODEL_NAMES:
+        pool.record(name, False)
+    clock.now += 30
+
+    async def main():
+        limiter = core._async_limiter()
+        for _ in range(core.ASYNC_CONCURRENCY):
+            await limiter.acquire()
+        task = asyncio.ensure_future(core._generate_async("sink leak", None, "key"))
+        await asyncio.sleep(0.01)
+        assert pool.breaker(core.MODEL_NAMES[0]).probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert not pool.breaker(core.MODEL_NAMES[0]).probing
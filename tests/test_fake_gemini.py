@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+import fake_gemini
+from fake_gemini import FakeGemini, FaultProfile, Recordings
+
+
+def request_body(message):
+    return {"contents": [{"role": "user", "parts": [{"text": f"TENANT MESSAGE:\n{message}\n\nAnalyze this."}]}],
+            "generationConfig": {"temperature": 0.3, "maxOutputTokens": 2048}}
+
+
+def quiet(**faults):
+    return FaultProfile(latency_ms=0, **faults)
+
+
+def test_synthetic_work_order_follows_triage():
+    status, _, response, _ = FakeGemini(profile=quiet(), seed=1).handle("m", request_body("I smell gas"))
+    assert status == 200
+    work_order = json.loads(fake_gemini.response_text(response))["work_order"]
+    assert (work_order["severity"], work_order["category"]) == ("EMERGENCY", "SAFETY")
+
+
+def test_replay_serves_recordings_from_file(tmp_path):
+    path = str(tmp_path / "recordings.jsonl")
+    body = request_body("Faucet drips")
+    recorded = fake_gemini.response_body('{"recorded": true}')
+    Recordings(path).add(fake_gemini.request_key("m", body), "m", recorded)
+
+    fake = FakeGemini("replay", quiet(), Recordings(path), seed=1)
+    assert fake.handle("m", body)[2] == recorded
+    assert fake.handle("m", request_body("Something else"))[0] == 200
+    assert fake.stats()["replayed"] == 1 and fake.stats()["replay_misses"] == 1
+
+
+def test_seeded_faults_repeat_run_to_run():
+    def statuses():
+        fake = FakeGemini(profile=quiet(error_rate=0.3, rate_limit_rate=0.2), seed=7)
+        return [fake.handle("m", request_body("x"))[0] for _ in range(30)]
+
+    first = statuses()
+    assert first == statuses()
+    assert {200, 429} <= set(first)
+
+
+def test_rate_limit_advertises_retry_after():
+    status, headers, response, _ = FakeGemini(profile=quiet(rate_limit_rate=1, retry_after=3)).handle(
+        "m", request_body("x"))
+    assert (status, headers["Retry-After"], response["error"]["status"]) == (429, "3", "RESOURCE_EXHAUSTED")
+
+
+def test_failing_model_always_503():
+    fake = FakeGemini(profile=quiet(failing_models=("bad",)))
+    assert fake.handle("bad", request_body("x"))[0] == 503
+    assert fake.handle("good", request_body("x"))[0] == 200
+
+
+def test_cached_content_is_resolved_and_reported():
+    fake = FakeGemini(profile=quiet(min_cache_tokens=10))
+    instruction = {"parts": [{"text": "You are a property manager. " * 10}]}
+    assert fake.create_cache({"model": "models/m", "systemInstruction": {"parts": [{"text": "x"}]}})[0] == 400
+    status, cache = fake.create_cache({"model": "models/m", "systemInstruction": instruction, "ttl": "60s"})
+    assert status == 200
+
+    body = dict(request_body("Faucet drips"), cachedContent=cache["name"])
+    status, _, response, _ = fake.handle("m", body)
+    assert status == 200 and response["usageMetadata"]["cachedContentTokenCount"] > 0
+    assert fake.handle("m", dict(body, cachedContent="cachedContents/missing"))[0] == 404
+
+
+def test_pipeline_round_trip(fake_api):
+    import core
+
+    result = core.call_gemini("The toilet is overflowing onto the floor", api_key="test-key", use_cache=False)
+    assert "error" not in result
+    assert result["work_order"]["severity"] == "HIGH"
+    assert result["_usage"]["output_tokens"] > 0
+
+    result = asyncio.run(core.call_gemini_async("The faucet drips", api_key="test-key", use_cache=False))
+    assert "error" not in result
+    assert fake_api.stats()["synthetic"] == 2
+
+
+def test_pipeline_streams_partials(fake_api):
+    import core
+
+    items = list(core.call_gemini_stream("The closet door squeaks", api_key="test-key", use_cache=False))
+    assert any(item.get("_partial") for item in items[:-1])
+    assert "error" not in items[-1] and not items[-1].get("_partial")
+
+
+def test_pipeline_repairs_malformed_json(fake_api):
+    import core
+
+    fake_api.profile.malformed_rate = 1
+    result = core.call_gemini("The faucet drips in the bathroom", api_key="test-key", use_cache=False)
+    assert "error" not in result and result["_repaired"]
+    assert fake_api.stats()["malformed"] == 1
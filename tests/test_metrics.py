@@ -0,0 +1,62 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+
+
+def test_counter_keeps_one_series_per_label_set():
+    counter = metrics.Counter("test_total", "Test.", ["model"])
+    counter.inc(model="a")
+    counter.inc(2, model="a")
+    counter.inc(model="b")
+    assert counter.value(model="a") == 3
+    assert counter.value(model="c") == 0
+    with pytest.raises(ValueError):
+        counter.inc(stage="a")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[("test_seconds_bucket", '{le="0.1"}')] == 1
+    assert samples[("test_seconds_bucket", '{le="1"}')] == 3
+    assert samples[("test_seconds_bucket", '{le="+Inf"}')] == 4
+    assert samples[("test_seconds_count", "")] == 4
+    assert samples[("test_seconds_sum", "")] == pytest.approx(6.05)
+
+
+def test_render_uses_the_exposition_format():
+    registry = metrics.Registry()
+    registry.counter("test_errors_total", "Errors.", ["kind"]).inc(kind='say "hi"\n')
+    assert registry.render() == (
+        "# HELP test_errors_total Errors.\n"
+        "# TYPE test_errors_total counter\n"
+        'test_errors_total{kind="say \\"hi\\"\\n"} 1\n'
+    )
+
+
+def test_timings_accumulate_repeated_stages():
+    timings = metrics.Timings()
+    timings.add("model", 0.010)
+    timings.add("model", 0.005)
+    with timings.stage("parse"):
+        pass
+    result = timings.to_dict()
+    assert list(result) == ["model", "parse", "total"]
+    assert result["model"] == 15.0
+
+
+def test_endpoint_serves_metrics_only():
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    assert metrics.start_http_server(0, host="127.0.0.1") is server
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert "# TYPE minimason_stage_seconds histogram" in response.read().decode("utf-8")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{base}/other", timeout=5)
+    assert error.value.code == 404
@@ -0,0 +1,94 @@
+import json
+import random
+
+import pytest
+
+import partial_json
+
+DOC = {
+    "work_order": {"id": "WO-1234", "severity": "HIGH", "description": 'Leak "under" sink\\n é é', "n": -12.5e3},
+    "tenant_reply": "Hi Sarah, " * 30,
+    "suggested_actions": ["Shut off the valve", {"nested": [1, 2, [], True, False, None]}],
+    "red_flags": [],
+}
+
+
+def test_parse_partial_keeps_only_finished_values():
+    value, done = partial_json.parse_partial('{"a": "done", "b": "half')
+    assert value == {"a": "done"} and not done
+
+
+def test_parse_partial_shows_containers_as_they_open():
+    value, done = partial_json.parse_partial('{"work_order": {"id": "WO-1", "severity": ')
+    assert value == {"work_order": {"id": "WO-1"}} and not done
+
+
+def test_trailing_number_is_incomplete():
+    assert partial_json.parse_partial('{"n": 12')[0] == {}
+    assert partial_json.parse_partial('{"n": 12,')[0] == {"n": 12}
+
+
+@pytest.mark.parametrize("text", [json.dumps(DOC), json.dumps(DOC, indent=2), '{"a": "x\ny", "b": [1, 2,], "c": {},}'])
+def test_incremental_parser_matches_parse_partial_on_every_prefix(text):
+    rng = random.Random(7)
+    for _ in range(50):
+        parser = partial_json.IncrementalJSONParser()
+        pos = 0
+        while pos < len(text):
+            step = rng.randint(1, 12)
+            snapshot = parser.feed(text[pos:pos + step])
+            pos += step
+            assert snapshot == partial_json.parse_partial(text[:pos])[0]
+        assert parser.done and parser.text == text
+
+
+def test_incremental_parser_keeps_last_good_value_on_error():
+    parser = partial_json.IncrementalJSONParser()
+    parser.feed('{"a": 1, "b": oops')
+    assert parser.feed(', "c": 2}') == {"a": 1}
+    assert not parser.done
+
+
+def test_incremental_parser_snapshots_are_independent():
+    parser = partial_json.IncrementalJSONParser()
+    first = parser.feed('{"items": ["a"')
+    parser.feed(', "b"]}')
+    assert first == {"items": ["a"]}
+
+
+def test_incremental_parser_is_linear():
+    text = '{"tenant_reply": "' + "word " * 200000 + '", "x": 1}'
+    parser = partial_json.IncrementalJSONParser()
+    for i in range(0, len(text), 20):
+        parser.feed(text[i:i + 20])
+    assert parser.done and parser.value["x"] == 1
+
+
+SCHEMA = {"work_order": ["id", "severity"], "tenant_reply": None, "log_entry": None}
+
+
+def test_repair_reports_fields_lost_to_truncation():
+    value, lost = partial_json.repair('{"work_order": {"id": "WO-1"}, "tenant_reply": "Hi', SCHEMA)
+    assert value == {"work_order": {"id": "WO-1"}}
+    assert lost == ["work_order.severity", "tenant_reply", "log_entry"]
+
+
+def test_repair_skips_a_damaged_member():
+    text = '{"tenant_reply": "ok", "work_order": {"id": oops}, "log_entry": "x"}'
+    value, lost = partial_json.repair(text, SCHEMA)
+    assert value["tenant_reply"] == "ok" and value["log_entry"] == "x"
+    assert lost == ["work_order.id", "work_order.severity"]
+
+
+@pytest.mark.parametrize("text", [
+    'Sure! ```json\n{"tenant_reply": "Use ``` here", "log_entry": "x"}\n```\nThanks!',
+    '```json\n{"tenant_reply": "Use ``` here", "log_entry": "x"}',
+    '```\n{"tenant_reply": "Use ``` here", "log_entry": "x"}```',
+])
+def test_repair_strips_fences_without_cutting_strings(text):
+    value, _ = partial_json.repair(text, SCHEMA)
+    assert value == {"tenant_reply": "Use ``` here", "log_entry": "x"}
+
+
+def test_repair_of_text_without_json():
+    assert partial_json.repair("no json here", SCHEMA) == ({}, list(SCHEMA))
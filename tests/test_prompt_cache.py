@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+import prompt_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCache(prompt_cache.PromptCache):
+    """A PromptCache whose create and update round trips are scripted."""
+
+    def __init__(self, clock, create_error=None):
+        super().__init__("You are a property manager.", ttl=3600, clock=clock)
+        self.create_error = create_error
+        self.update_error = None
+        self.created = self.updated = 0
+
+    def _create(self, model_name):
+        self.created += 1
+        if self.create_error:
+            return prompt_cache._Entry(retry_at=self.clock() + prompt_cache.RETRY_AFTER, error=self.create_error)
+        cache = SimpleNamespace(name=f"cachedContents/{self.created}", update=self._update)
+        return prompt_cache._Entry(cache, refresh_at=self.clock() + self.ttl - prompt_cache.REFRESH_MARGIN)
+
+    def _update(self, ttl):
+        self.updated += 1
+        if self.update_error:
+            raise self.update_error
+
+
+def test_cache_is_created_once_and_refreshed_before_expiry():
+    clock = Clock()
+    cache = FakeCache(clock)
+    first = cache.get("k", "m")
+    assert cache.get("k", "m") is first and cache.ready("k")
+    clock.now += 3600 - prompt_cache.REFRESH_MARGIN
+    assert not cache.ready("k")
+    assert cache.get("k", "m") is first
+    assert (cache.created, cache.updated) == (1, 1)
+
+
+def test_failed_refresh_recreates():
+    clock = Clock()
+    cache = FakeCache(clock)
+    first = cache.get("k", "m")
+    cache.update_error = RuntimeError("gone")
+    clock.now += 3600
+    assert cache.get("k", "m") is not first
+    assert cache.created == 2
+
+
+def test_failed_create_backs_off():
+    clock = Clock()
+    cache = FakeCache(clock, create_error="Cached content is too small")
+    assert cache.get("k", "m") is None
+    assert cache.get("k", "m") is None and cache.created == 1
+    assert cache.status()["k"] == {"state": "fallback", "error": "Cached content is too small",
+                                   "retry_in": prompt_cache.RETRY_AFTER}
+    clock.now += prompt_cache.RETRY_AFTER
+    cache.get("k", "m")
+    assert cache.created == 2
+
+
+def test_only_cache_errors_cause_a_fallback():
+    cache = FakeCache(Clock())
+    cache.get(("key", "m", None), "m")
+    cache.report_error(("key", "m", None), RuntimeError("503 unavailable"))
+    assert cache.status()["m"]["state"] == "active"
+    cache.report_error(("key", "m", None), RuntimeError("CachedContent not found"))
+    assert cache.status()["m"]["state"] == "fallback"
+
+
+def test_requests_reference_the_cached_prompt(fake_api, monkeypatch):
+    import core
+
+    monkeypatch.setenv("MINIMASON_PROMPT_CACHE", "1")
+    for message in ("Prompt cache test: faucet drips", "Prompt cache test: door squeaks"):
+        result = core.call_gemini(message, api_key="test-key", use_cache=False)
+        assert result["_usage"]["cached_tokens"] > 0
+    stats = fake_api.stats()
+    assert (stats["caches_created"], stats["cached_requests"]) == (1, 2)
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import regenerate
+from test_validator import valid_result
+
+
+def test_nothing_to_regenerate_for_a_valid_result():
+    assert regenerate.targets(valid_result()) == []
+
+
+def test_targets_lost_and_invalid_fields():
+    result = valid_result()
+    del result["suggested_actions"]
+    result["_lost_fields"] = ["suggested_actions"]
+    result["work_order"]["severity"] = "urgent"
+    assert regenerate.targets(result) == ["suggested_actions", "work_order.severity"]
+
+
+def test_too_much_broken_means_a_full_rerun():
+    result = {"tenant_reply": "Hi"}
+    assert regenerate.targets(result) == []
+
+
+def test_build_prompt_asks_for_only_the_targets():
+    result = valid_result()
+    result["work_order"]["severity"] = "urgent"
+    prompt = regenerate.build_prompt("Sink leaking", result, ["work_order.severity", "suggested_actions"])
+    assert prompt.endswith('Return ONLY: {"work_order": {"severity": "..."}, "suggested_actions": []}')
+    assert '"severity"' not in prompt.split("CURRENT WORK ORDER:")[1].split("FIX THESE FIELDS:")[0]
+
+
+def test_merge_takes_only_well_typed_values():
+    result = valid_result()
+    result["_lost_fields"] = ["suggested_actions", "log_entry"]
+    patch = {"suggested_actions": ["Call plumber"], "log_entry": 42, "work_order": {"severity": "MEDIUM"}}
+    merged = regenerate.merge(result, patch, ["suggested_actions", "log_entry", "work_order.severity"])
+    assert merged == ["suggested_actions", "work_order.severity"]
+    assert result["suggested_actions"] == ["Call plumber"] and result["work_order"]["severity"] == "MEDIUM"
+    assert result["_lost_fields"] == ["log_entry"]
+
+
+def test_local_fixes_run_before_regeneration():
+    core = pytest.importorskip("core")
+    result = valid_result()
+    result["work_order"]["category"] = "plumbing"
+    result["tenant_reply"] = "A plumber is on the way. " * 40
+    seen = []
+
+    def regenerate_fields(r):
+        seen.append(regenerate.targets(r))
+        return r
+
+    parsed = core._parse_response(json.dumps(result), "model", None, regenerate_fields)
+    assert seen == [[]]
+    assert parsed["work_order"]["category"] == "PLUMBING"
+    assert any("trimmed" in w for w in parsed["_warnings"])
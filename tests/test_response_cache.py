@@ -0,0 +1,64 @@
+import os
+import time
+
+import response_cache
+
+
+def test_key_ignores_whitespace_and_case_but_not_content():
+    key = response_cache.make_key("Sink  is LEAKING\n", None, ("m1",), "v1")
+    assert key == response_cache.make_key("sink is leaking", None, ("m1",), "v1")
+    assert key != response_cache.make_key("sink is leaking", "photo", ("m1",), "v1")
+    assert key != response_cache.make_key("sink is leaking", None, ("m2",), "v1")
+    assert key != response_cache.make_key("sink is leaking", None, ("m1",), "v2")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memory = response_cache.MemoryTier(max_entries=2)
+    memory.set("a", "1")
+    memory.set("b", "2")
+    memory.get("a")
+    memory.set("c", "3")
+    assert memory.get("b") is None
+    assert memory.get("a") == "1" and memory.get("c") == "3"
+
+
+def test_memory_tier_expires_entries():
+    memory = response_cache.MemoryTier(ttl=-1)
+    memory.set("a", "1")
+    assert memory.get("a") is None
+    assert len(memory) == 0
+
+
+def test_call_metadata_is_not_cached():
+    cache = response_cache.ResponseCache()
+    cache.set("k", {"tenant_reply": "On it", "_usage": {"output_tokens": 5}, "_timings": {}})
+    assert cache.get("k") == ({"tenant_reply": "On it"}, "memory")
+    assert cache.get("missing") == (None, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_tier_refills_memory(tmp_path):
+    disk = response_cache.DiskTier(str(tmp_path))
+    response_cache.ResponseCache(disk=disk).set("k", {"tenant_reply": "On it"})
+    cache = response_cache.ResponseCache(disk=disk)
+    assert cache.get("k") == ({"tenant_reply": "On it"}, "disk")
+    assert cache.get("k") == ({"tenant_reply": "On it"}, "memory")
+
+
+def test_disk_tier_drops_expired_files(tmp_path):
+    disk = response_cache.DiskTier(str(tmp_path), ttl=60)
+    disk.set("k", "{}")
+    old = time.time() - 120
+    os.utime(tmp_path / "k.json", (old, old))
+    assert disk.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+
+
+def test_disk_tier_evicts_oldest_over_the_size_cap(tmp_path):
+    disk = response_cache.DiskTier(str(tmp_path), max_bytes=250)
+    for i, key in enumerate("abc"):
+        disk.set(key, "x" * 100)
+        stamp = time.time() - 100 + i
+        os.utime(tmp_path / f"{key}.json", (stamp, stamp))
+    disk.set("d", "x" * 100)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["c.json", "d.json"]
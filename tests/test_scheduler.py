@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from scheduler import SLA_SECONDS, SeverityScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_in_order(submissions, clock=None):
+    """Submit while the single worker is busy, then return the order handler saw the messages in."""
+    gate = threading.Event()
+    order = []
+
+    def handler(message):
+        if message == "block":
+            gate.wait(5)
+        else:
+            order.append(message)
+
+    kwargs = {"clock": clock} if clock else {}
+    with SeverityScheduler(handler, workers=1, **kwargs) as scheduler:
+        first = scheduler.submit("block", severity="EMERGENCY")
+        futures = []
+        for message, severity, at in submissions:
+            if clock:
+                clock.now = at
+            futures.append(scheduler.submit(message, severity=severity))
+        gate.set()
+        first.result(5)
+        for future in futures:
+            future.result(5)
+        stats = scheduler.stats()
+    return order, stats
+
+
+def test_emergency_first_then_earliest_deadline():
+    order, _ = run_in_order([("low", "LOW", 0), ("medium", "MEDIUM", 0), ("high", "HIGH", 0), ("emergency", "EMERGENCY", 0)],
+                            clock=Clock())
+    assert order == ["emergency", "high", "medium", "low"]
+
+
+def test_old_low_request_ages_ahead_of_new_medium():
+    late = SLA_SECONDS["LOW"] - SLA_SECONDS["MEDIUM"] + 1
+    order, _ = run_in_order([("low", "LOW", 0), ("medium", "MEDIUM", late)], clock=Clock())
+    assert order == ["low", "medium"]
+
+
+def test_severity_defaults_to_the_rules():
+    order, _ = run_in_order([("Closet door squeaks", None, 0), ("I smell gas in the hallway", None, 0)], clock=Clock())
+    assert order == ["I smell gas in the hallway", "Closet door squeaks"]
+
+
+def test_stats_count_requests_and_wait_samples():
+    _, stats = run_in_order([("low", "LOW", 0), ("other", "LOW", 0)])
+    assert stats["completed"]["LOW"] == 2 and stats["completed"]["EMERGENCY"] == 1
+    assert stats["wait_ms"]["LOW"]["samples"] == 2
+    assert stats["queued"] == 0 and stats["in_flight"] == 0
+
+
+def test_handler_errors_reach_the_future():
+    def handler(message):
+        raise ValueError(message)
+
+    with SeverityScheduler(handler, workers=1) as scheduler:
+        with pytest.raises(ValueError):
+            scheduler.submit("boom").result(5)
+
+
+def test_submit_after_shutdown_is_refused():
+    scheduler = SeverityScheduler(lambda message: message, workers=1)
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("late")
@@ -0,0 +1,117 @@
+import base64
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import server
+from server import ApiError, Service, parse_request
+
+
+def test_parse_json_request():
+    photo = base64.b64encode(b"jpeg-bytes").decode()
+    body = json.dumps({"message": "Sink leaking", "photo": photo, "unit": 12, "split": "yes"}).encode()
+    request = parse_request("Application/JSON; charset=utf-8", body)
+    assert request == {"tenant_message": "Sink leaking", "photo": b"jpeg-bytes", "scope": "12",
+                       "split": True, "attach_duplicates": True}
+
+
+def test_parse_multipart_request_case_insensitively():
+    body = (b'--XX\r\nContent-Disposition: form-data; name="tenant_message"\r\n\r\nToilet overflowing\r\n'
+            b'--XX\r\nContent-Disposition: form-data; name="photo"; filename="a.jpg"\r\n'
+            b'Content-Type: image/jpeg\r\n\r\nJPEG\r\n--XX--\r\n')
+    request = parse_request("Multipart/Form-Data; boundary=XX", body)
+    assert request["tenant_message"] == "Toilet overflowing" and request["photo"] == b"JPEG"
+
+
+@pytest.mark.parametrize("content_type, body, status", [
+    ("application/json", b"{not json", 400),
+    ("application/json", b"[1, 2]", 400),
+    ("application/json", b'{"tenant_message": "  "}', 400),
+    ("application/json", b'{"tenant_message": "x", "photo": "***"}', 400),
+    ("application/json", b'{"tenant_message": "x", "tenant": ["4B"]}', 400),
+    ("application/json", b'{"tenant_message": "x", "unit": {"id": 1}}', 400),
+    ("application/json", b'{"tenant_message": "x", "tenant": true}', 400),
+    ("text/plain", b"hello", 415),
+])
+def test_bad_requests_are_rejected(content_type, body, status):
+    with pytest.raises(ApiError) as error:
+        parse_request(content_type, body)
+    assert error.value.status == status
+
+
+class StubService(Service):
+    """A Service whose pipeline is replaced by a function of the request."""
+
+    def __init__(self, fn, **kwargs):
+        super().__init__("key", **kwargs)
+        self.fn = fn
+
+    def process(self, request):
+        return self.fn(request)
+
+
+def test_full_pool_answers_503():
+    gate = threading.Event()
+    service = StubService(lambda request: gate.wait(5) and {"ok": True}, workers=1, queue_limit=0, timeout=5)
+    request = parse_request("application/json", b'{"tenant_message": "x"}')
+    first = threading.Thread(target=service.submit, args=(request,))
+    first.start()
+    try:
+        while service.pending == 0:
+            time.sleep(0.001)
+        with pytest.raises(ApiError) as error:
+            service.submit(request)
+        assert error.value.status == 503
+    finally:
+        gate.set()
+        first.join()
+
+
+def test_slow_request_answers_504():
+    gate = threading.Event()
+    service = StubService(lambda request: gate.wait(5) and {"ok": True}, workers=1, timeout=0.05)
+    try:
+        with pytest.raises(ApiError) as error:
+            service.submit(parse_request("application/json", b'{"tenant_message": "x"}'))
+        assert error.value.status == 504
+    finally:
+        gate.set()
+
+
+def test_model_error_answers_502():
+    service = StubService(lambda request: {"error": "API call failed"})
+    status, body = service.submit(parse_request("application/json", b'{"tenant_message": "x"}'))
+    assert status == 502 and body["error"]
+
+
+@pytest.fixture
+def api():
+    service = StubService(lambda request: {"echo": request["tenant_message"], "scope": request["scope"]})
+    httpd, url = server.start(service, token="secret")
+    yield url
+    httpd.shutdown()
+
+
+def post(url, body, token="secret"):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST",
+                                     headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_http_process(api):
+    assert post(f"{api}/v1/process", {"tenant_message": "Sink leaking", "tenant": "4B"}) == (
+        200, {"echo": "Sink leaking", "scope": "4B"})
+
+
+def test_http_rejects_bad_token_route_and_scope(api):
+    assert post(f"{api}/v1/process", {"tenant_message": "x"}, token="wrong")[0] == 401
+    assert post(f"{api}/v1/nope", {"tenant_message": "x"})[0] == 404
+    assert post(f"{api}/v1/process", {"tenant_message": "x", "tenant": ["4B"]})[0] == 400
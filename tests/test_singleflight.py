@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import pytest
+
+import singleflight
+
+
+class SignallingGroup(singleflight.Group):
+    """Sets an event once a second caller has joined an in-flight call."""
+
+    def __init__(self):
+        super().__init__()
+        self.joined = threading.Event()
+
+    def claim(self, key):
+        future, leader = super().claim(key)
+        if not leader:
+            self.joined.set()
+        return future, leader
+
+
+def test_concurrent_callers_share_one_call():
+    group = SignallingGroup()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"reply": "On it"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(group.do("k", slow)))
+    waiter.start()
+    group.joined.wait(5)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+    first, second = (value for value, _ in results)
+    assert first == second and first is not second
+    assert group.in_flight() == 0
+
+
+def test_waiter_runs_the_call_itself_when_the_leader_fails():
+    group = singleflight.Group()
+    future, leader = group.claim("k")
+    assert leader
+    assert group.claim("k") == (future, False)
+    group.finish("k", future, error=RuntimeError("boom"))
+    assert future.exception() is not None
+    assert group.do("k", lambda: 42) == (42, False)
+
+
+def test_leader_error_propagates():
+    group = singleflight.Group()
+
+    def fail():
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        group.do("k", fail)
+    assert group.in_flight() == 0
+
+
+def test_async_callers_share_one_call():
+    group = singleflight.Group()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"reply": "On it"}
+
+    async def main():
+        return await asyncio.gather(group.do_async("k", slow), group.do_async("k", slow))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True]
+
+
+def test_cancelled_leader_lets_waiters_retry():
+    group = singleflight.Group()
+
+    async def never():
+        await asyncio.sleep(10)
+
+    async def main():
+        leader = asyncio.ensure_future(group.do_async("k", never))
+        await asyncio.sleep(0)
+        future, _ = group.claim("k")
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return future
+
+    future = asyncio.run(main())
+    assert isinstance(future.exception(), RuntimeError)
+    assert group.in_flight() == 0
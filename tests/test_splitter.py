@@ -0,0 +1,57 @@
+import threading
+
+import splitter
+
+BUNDLED = ("The faucet drips, also the closet door squeaks. I smell gas in the hallway. "
+           "I will withhold rent if this is not fixed.")
+
+
+def test_distinct_issues_most_severe_first():
+    issues, context = splitter.split_issues(BUNDLED)
+    assert [(i.severity, i.rule) for i in issues] == [
+        ("EMERGENCY", "gas_smell"), ("MEDIUM", "minor_plumbing"), ("LOW", "squeaky_or_loose")]
+    assert issues[1].text == "The faucet drips"
+    assert context == ["I will withhold rent if this is not fixed."]
+
+
+def test_follow_on_sentences_stay_with_their_issue():
+    issues, context = splitter.split_issues("My toilet is clogged. I tried plunging it but nothing works.")
+    assert len(issues) == 1
+    assert issues[0].text == "My toilet is clogged. I tried plunging it but nothing works."
+    assert context == []
+
+
+def test_one_issue_in_several_clauses_is_not_split():
+    issues, _ = splitter.split_issues("The faucet drips and the faucet drips louder at night")
+    assert len(issues) == 1
+
+
+def test_sub_request_carries_shared_context():
+    issues, context = splitter.split_issues(BUNDLED)
+    message = splitter.sub_request(issues[0], context)
+    assert message.startswith("I smell gas in the hallway.")
+    assert "withhold rent" in message
+    assert splitter.sub_request(issues[0], []) == issues[0].text
+
+
+def test_single_issue_is_handled_whole():
+    seen = []
+    results = splitter.process_split("My toilet is clogged.", lambda m: seen.append(m) or {"ok": True})
+    assert seen == ["My toilet is clogged."]
+    assert results == [{"ok": True}]
+
+
+def test_issues_run_in_parallel_and_link_their_work_orders():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def handler(message):
+        barrier.wait()
+        if "closet" in message:
+            return {"error": "failed"}
+        return {"work_order": {"id": "WO-GAS" if "gas" in message else "WO-FAUCET"}}
+
+    results = splitter.process_split(BUNDLED, handler)
+    assert [r["_split"]["index"] for r in results] == [1, 2, 3]
+    assert results[0]["_split"]["linked_work_orders"] == ["WO-FAUCET"]
+    assert results[1]["_split"]["linked_work_orders"] == ["WO-GAS"]
+    assert results[2]["_split"]["linked_work_orders"] == ["WO-GAS", "WO-FAUCET"]
@@ -0,0 +1,97 @@
+import sqlite3
+import time
+
+import pytest
+
+import metrics
+import store
+
+
+def work_order(wo_id, severity="HIGH", category="PLUMBING"):
+    return {
+        "work_order": {"id": wo_id, "severity": severity, "category": category, "description": "Leak"},
+        "tenant_reply": "We're on it.",
+        "suggested_actions": ["Send a plumber"],
+        "red_flags": [],
+        "_model_used": "gemini-2.5-flash",
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    work_orders = store.WorkOrderStore(str(tmp_path / "wo.db"), flush_interval=0.05)
+    yield work_orders
+    work_orders.close()
+
+
+def test_round_trip_and_filters(db):
+    db.add(work_order("WO-0001"), "Sink leaking")
+    db.add(work_order("WO-0002", "LOW", "GENERAL"), "Door squeaks")
+    assert db.flush(5)
+    record = db.get("WO-0001")
+    assert record["tenant_message"] == "Sink leaking"
+    assert record["suggested_actions"] == ["Send a plumber"] and record["cached"] is False
+    assert [r["wo_id"] for r in db.recent(severity="low")] == ["WO-0002"]
+    assert db.counts() == {"HIGH": 1, "LOW": 1}
+
+
+def test_errors_and_partials_are_not_stored(db):
+    db.add({"error": "boom"})
+    db.add({**work_order("WO-0003"), "_partial": True})
+    db.flush(5)
+    assert db.recent() == []
+
+
+def test_usage_rolls_up_per_day_and_model(db):
+    call = {"prompt_tokens": 100, "cached_tokens": 40, "output_tokens": 20, "latency_ms": 50.0, "cost_usd": 0.001}
+    db.add_call("gemini-2.5-flash", "request", call, 512)
+    db.add_call("gemini-2.5-flash", "regenerate", call, 512)
+    db.flush(5)
+    (row,) = db.usage()
+    assert row["calls"] == 2 and row["regenerations"] == 1
+    assert row["prompt_tokens"] == 200 and row["output_tokens"] == 40
+
+
+def test_flush_interval_holds_under_a_steady_trickle(tmp_path):
+    path = str(tmp_path / "wo.db")
+    work_orders = store.WorkOrderStore(path, batch_size=10 ** 6, flush_interval=0.1)
+    try:
+        for i in range(20):
+            work_orders.add(work_order(f"WO-{i:04d}"))
+            time.sleep(0.02)
+        time.sleep(0.2)
+        count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM work_orders").fetchone()[0]
+        assert count == 20
+    finally:
+        work_orders.close()
+
+
+def test_failed_batch_is_logged_and_counted(tmp_path, monkeypatch, caplog):
+    connect = store._connect
+
+    def quick(path):
+        conn = connect(path)
+        conn.execute("PRAGMA busy_timeout=50")
+        return conn
+
+    monkeypatch.setattr(store, "_connect", quick)
+    path = str(tmp_path / "wo.db")
+    work_orders = store.WorkOrderStore(path)
+    blocker = sqlite3.connect(path, timeout=0)
+    blocker.execute("BEGIN EXCLUSIVE")
+    before = metrics.STORE_DROPPED.value(table="work_orders")
+    try:
+        work_orders.add(work_order("WO-0009"))
+        assert work_orders.flush(5)
+    finally:
+        blocker.rollback()
+        work_orders.close()
+    assert metrics.STORE_DROPPED.value(table="work_orders") == before + 1
+    assert "dropped 1 rows" in caplog.text
+
+
+def test_flush_after_close_returns_immediately(db):
+    db.close()
+    started = time.monotonic()
+    assert db.flush() is False
+    assert time.monotonic() - started < 1
@@ -0,0 +1,94 @@
+import threads
+
+
+def _result(wo_id, description, category="plumbing", reply="Thanks, we're on it."):
+    return {"work_order": {"id": wo_id, "description": description, "category": category, "severity": "MEDIUM"},
+            "tenant_reply": reply}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _index_with(*reports, scope="4B"):
+    clock = Clock()
+    index = threads.ThreadIndex(window=3600, clock=clock)
+    for wo_id, message in reports:
+        index.record(index.prepare(message, scope), _result(wo_id, message))
+        clock.now += 1
+    return index, clock
+
+
+def test_parse_transcript_splits_off_earlier_turns():
+    text = "Tenant: The kitchen sink is leaking\nMe: We'll send someone Tuesday\nTenant: Still leaking.\nAny update?"
+    message, earlier = threads.parse_transcript(text)
+    assert message == "Still leaking.\nAny update?"
+    assert [(t.role, t.text) for t in earlier] == [
+        ("tenant", "The kitchen sink is leaking"), ("manager", "We'll send someone Tuesday")]
+
+
+def test_plain_text_is_not_a_transcript():
+    text = "Note: the sink is leaking again"
+    assert threads.parse_transcript(text) == (text, [])
+
+
+def test_follow_up_needs_more_than_the_word_still():
+    index, _ = _index_with(("WO-1", "Kitchen sink is leaking under the cabinet"))
+    assert index.find("4B", "The smoke detector is still beeping") is None
+    assert index.find("4B", "any update??") is not None
+    assert index.find("4B", "The sink is still leaking") is not None
+
+
+def test_unrelated_message_without_cues_opens_nothing():
+    index, _ = _index_with(("WO-1", "Kitchen sink is leaking under the cabinet"))
+    assert index.find("4B", "Hallway light bulb burned out") is None
+    assert index.find("7A", "The sink is still leaking") is None
+    assert index.find(None, "The sink is still leaking") is None
+
+
+def test_most_shared_thread_wins():
+    index, _ = _index_with(
+        ("WO-1", "Kitchen sink is leaking under the cabinet"),
+        ("WO-2", "Bathroom faucet dripping all night"),
+    )
+    assert index.find("4B", "kitchen sink cabinet still leaking").wo_id == "WO-1"
+    assert index.find("4B", "bathroom faucet still dripping").wo_id == "WO-2"
+
+
+def test_threads_expire_after_the_window():
+    index, clock = _index_with(("WO-1", "Kitchen sink is leaking under the cabinet"))
+    assert len(index) == 1
+    clock.now += 3601
+    assert len(index) == 0
+    assert index.find("4B", "The sink is still leaking") is None
+
+
+def test_errors_and_partial_results_are_not_recorded():
+    index = threads.ThreadIndex()
+    prepared = index.prepare("Kitchen sink is leaking", "4B")
+    index.record(prepared, {"error": "boom"})
+    index.record(prepared, {**_result("WO-1", "sink"), "_partial": True})
+    assert len(index) == 0
+
+
+def test_summary_stays_bounded():
+    thread = threads.Thread("4B", wo_id="WO-1", description="Kitchen sink leaking")
+    for i in range(40):
+        thread.add("tenant" if i % 2 == 0 else "manager", f"Message number {i}. " + "x" * 1000)
+    assert len(thread.turns) == threads.RECENT_TURNS
+    assert len(thread.summary) == threads.SUMMARY_LINES
+    assert thread.info() == {"id": "WO-1", "turns": 40, "summarized": 36}
+    context = thread.context()
+    assert "30 older messages omitted" in context
+    assert len(context) < 4000
+
+
+def test_follow_up_context_names_the_open_work_order():
+    index, _ = _index_with(("WO-1", "Kitchen sink is leaking under the cabinet"))
+    prepared = index.prepare("The sink is still leaking", "4B")
+    assert prepared.thread.wo_id == "WO-1"
+    assert "follow-up on WO-1" in prepared.context
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import triage
+
+
+@pytest.mark.parametrize("message, severity, category", [
+    ("I smell gas in the hallway", "EMERGENCY", "SAFETY"),
+    ("Water is pooling right under the outlet in the kitchen", "EMERGENCY", "ELECTRICAL"),
+    ("The AC is out and it's 95 degrees inside", "HIGH", "HVAC"),
+    ("We only have one bathroom and the toilet won't flush", "HIGH", "PLUMBING"),
+    ("Dishwasher is making a humming noise", "MEDIUM", "APPLIANCE"),
+    ("Closet door squeaks when I open it", "LOW", "GENERAL"),
+])
+def test_classify(message, severity, category):
+    result = triage.classify(message)
+    assert (result.severity, result.category) == (severity, category)
+
+
+def test_unmatched_message_has_no_severity():
+    result = triage.classify("Hi, just wanted to say thanks!")
+    assert result.severity is None and result.category is None
+
+
+def test_delayed_safety_issue_escalates():
+    result = triage.classify("The front door lock has been broken for weeks")
+    assert result.severity == "EMERGENCY" and result.escalated
+
+
+@pytest.mark.parametrize("message, severity", [
+    ("No heat and it's 20 degrees outside", "EMERGENCY"),
+    ("No heat, it is -5°C out there tonight", "EMERGENCY"),
+    ("No heat and the pipes are starting to freeze", "EMERGENCY"),
+    ("Heater stopped, it's 25 degrees in here", "HIGH"),
+    ("No heat, thermostat says 28°C", "HIGH"),
+])
+def test_freezing_escalation_needs_weather_or_pipes(message, severity):
+    assert triage.classify(message).severity == severity
+
+
+@pytest.mark.parametrize("token", ["mold ", "ac ", "toilet ", "ground floor "])
+def test_repetitive_input_stays_fast(token):
+    started = time.perf_counter()
+    triage.classify(token * 5000)
+    assert time.perf_counter() - started < 0.5
+
+
+def test_cross_check_warns_on_disagreement():
+    provisional = triage.classify("I smell gas in the hallway")
+    result = triage.cross_check({"work_order": {"severity": "LOW"}}, provisional)
+    assert result["_triage"]["agrees"] is False
+    assert "below" in result["_warnings"][0]
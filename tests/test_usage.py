@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import fake_gemini
+import usage
+
+
+def test_output_tokens_include_thinking():
+    metadata = SimpleNamespace(prompt_token_count=1500, cached_content_token_count=1000,
+                               candidates_token_count=400, thoughts_token_count=1000, total_token_count=2900)
+    tokens = usage.counts(metadata)
+    assert tokens == {"prompt_tokens": 1500, "cached_tokens": 1000, "output_tokens": 1400, "total_tokens": 2900}
+
+
+def test_output_tokens_from_total_when_thoughts_are_not_reported():
+    metadata = SimpleNamespace(prompt_token_count=100, candidates_token_count=50, total_token_count=300)
+    assert usage.counts(metadata)["output_tokens"] == 200
+
+
+def test_missing_metadata_counts_zero():
+    assert set(usage.counts(None).values()) == {0}
+
+
+def test_cost_bills_cached_prompt_at_the_cached_rate():
+    tokens = {"prompt_tokens": 1_000_000, "cached_tokens": 1_000_000, "output_tokens": 0}
+    assert usage.cost("gemini-2.5-flash", tokens) == usage.PRICES["gemini-2.5-flash"][1]
+    assert usage.cost("unknown-model", tokens) == 0.0
+
+
+def test_budget_stays_at_ceiling_until_it_has_enough_samples():
+    budget = usage.OutputBudget(ceiling=2048, floor=512, min_samples=10)
+    for _ in range(9):
+        budget.observe(100)
+    assert budget.cap() == 2048
+    budget.observe(100)
+    assert budget.cap() == 512
+
+
+def test_budget_sizes_from_the_percentile_with_headroom():
+    budget = usage.OutputBudget(ceiling=4096, floor=128, min_samples=10, percentile=99, headroom=1.25)
+    for _ in range(20):
+        budget.observe(1000)
+    assert budget.cap() == 1280
+
+
+def test_truncation_pushes_the_budget_back_to_the_ceiling():
+    budget = usage.OutputBudget(ceiling=2048, floor=512, min_samples=10, percentile=90)
+    for _ in range(20):
+        budget.observe(100)
+    for _ in range(3):
+        budget.observe(512, truncated=True)
+    assert budget.cap() == 2048
+
+
+def test_replay_key_ignores_the_output_cap():
+    def body(cap, temperature=0.7):
+        return {"contents": [{"parts": [{"text": "x"}]}],
+                "generationConfig": {"temperature": temperature, "maxOutputTokens": cap}}
+
+    assert fake_gemini.request_key("m", body(2048)) == fake_gemini.request_key("m", body(512))
+    assert fake_gemini.request_key("m", body(512)) != fake_gemini.request_key("m", body(512, temperature=0.2))
@@ -0,0 +1,80 @@
+import copy
+
+import pytest
+
+import validator
+
+
+def valid_result():
+    return {
+        "work_order": {
+            "id": "WO-1234", "category": "PLUMBING", "severity": "HIGH", "description": "Kitchen sink leaking.",
+            "severity_reasoning": "Active leak.", "tenant_details": "Sarah, 4B",
+        },
+        "tenant_reply": "Thanks Sarah. A plumber will come by this afternoon.",
+        "suggested_actions": ["Dispatch plumber"],
+        "log_entry": "2026-01-01 10:00 | WO-1234 | HIGH | PLUMBING | Sink leak",
+        "red_flags": [],
+    }
+
+
+def kinds(findings):
+    return {(f.kind, f.field) for f in findings}
+
+
+def test_valid_result_has_no_findings():
+    assert validator.check(valid_result()) == []
+
+
+def test_check_reports_each_violation():
+    result = valid_result()
+    del result["log_entry"]
+    result["suggested_actions"] = "call someone"
+    result["work_order"].update(severity="urgent", id="1234", description="Fix the leak. Additionally, paint.")
+    result["red_flags"] = ["ANGRY: yelling"]
+    assert kinds(validator.check(result)) == {
+        ("missing", "log_entry"), ("type", "suggested_actions"), ("enum", "work_order.severity"),
+        ("format", "work_order.id"), ("bundle", "work_order.description"), ("red_flag", "red_flags"),
+    }
+
+
+def test_check_is_read_only():
+    result = valid_result()
+    result["tenant_reply"] = "Rest assured, we'll fix it."
+    before = copy.deepcopy(result)
+    validator.check(result)
+    assert result == before
+
+
+@pytest.mark.parametrize("text, sentences", [
+    ("Dr. Smith at 12 St. James Ave. called. He'll be there at 3 p.m. today!", 2),
+    ("One. Two? Three! Four…", 4),
+])
+def test_split_sentences_respects_abbreviations(text, sentences):
+    assert len(validator.split_sentences(text)) == sentences
+
+
+def test_enforce_fixes_what_it_can_locally():
+    result = valid_result()
+    result["work_order"].update(category="plumbing", severity=" high ", severity_reasoning="Active leak. Might spread.")
+    result["tenant_reply"] = "Rest assured, a plumber is coming. " + "We will keep you posted on timing today. " * 20
+    result, findings = validator.enforce(result)
+    assert result["work_order"]["category"] == "PLUMBING" and result["work_order"]["severity"] == "HIGH"
+    assert result["work_order"]["severity_reasoning"] == "Active leak."
+    assert result["tenant_reply"].startswith("A plumber is coming.")
+    assert len(validator.split_sentences(result["tenant_reply"])) == validator.MAX_REPLY_SENTENCES
+    assert kinds(findings) == {("banned_phrase", "tenant_reply"), ("reply_length", "tenant_reply")}
+    assert validator.check(result) == []
+
+
+def test_enforce_leaves_a_reply_that_is_only_a_banned_phrase():
+    result = valid_result()
+    result["tenant_reply"] = "We understand your frustration."
+    result, findings = validator.enforce(result)
+    assert result["tenant_reply"] == "We understand your frustration."
+    assert ("banned_phrase", "tenant_reply") in kinds(findings)
+
+
+def test_error_results_are_ignored():
+    assert validator.check({"error": "boom"}) == []
+    assert validator.enforce({"error": "boom"}) == ({"error": "boom"}, [])
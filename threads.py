@@ -0,0 +1,320 @@
+"""
+MiniMason — Conversation Threads
+
+Tenants follow up ("still leaking", "any update??"), and managers paste whole
+text threads into the box. Without context each of those becomes a new work
+order, and a pasted thread sends every old message to the model again.
+
+A thread belongs to a tenant scope (tenant or unit) and one open work order.
+A new message from that scope is a follow-up when it says so ("still", "any
+update?", "again") or shares real content words with the thread, and the
+rules don't put it in a different category. A follow-up is processed with the
+thread as context and keeps the thread's work-order ID; anything else from
+the scope is a new work order. Only the last few turns go to the model verbatim;
+older ones are folded into a short rolling summary with a bounded number of
+lines, so the context stays roughly the same size however long the thread gets.
+A pasted transcript is split into turns the same way: its newest tenant
+message is what gets processed, the rest becomes context.
+
+Threads live in process memory (like the repeat-report index) and expire
+after a quiet window.
+
+Environment:
+    MINIMASON_THREADS          set to 0 to turn threading off (default on)
+    MINIMASON_THREAD_WINDOW    seconds a quiet thread stays open (default 604800, 7 days)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+import dedup
+import triage
+import validator
+
+WINDOW = float(os.environ.get("MINIMASON_THREAD_WINDOW", "604800"))
+# Turns sent verbatim, and the characters kept of each
+RECENT_TURNS = 4
+TURN_CHARS = 400
+# Summary lines for older turns, and the characters kept of each
+SUMMARY_LINES = 6
+LINE_CHARS = 140
+# Content words a message must share with its thread, and the share of its own words they must be
+MIN_SHARED_WORDS = 2
+MIN_OVERLAP = 0.4
+
+# Wording that refers back to an earlier report
+_FOLLOW_UP = re.compile(
+    r"\b(?:still|again|any\s+(?:updates?|news|word)|update\s+on|follow(?:ing)?[\s-]*up|checking\s+(?:in|on|back)"
+    r"|hear(?:d)?\s+back|same\s+(?:issue|problem|thing)|(?:reported|mentioned|told\s+you)\s+(?:earlier|before|yesterday|last)"
+    r"|as\s+(?:i|we)\s+(?:said|mentioned)|(?:getting|got)\s+worse|(?:not|never)\s+(?:been\s+)?fixed"
+    r"|no\s*one\s+(?:came|showed|has\s+come)|when\s+(?:is|will)\s+(?:some|any)one)\b",
+    re.IGNORECASE,
+)
+# Words a pure check-in ("any update? nobody came yet") uses without naming an issue
+_CHECK_IN_WORDS = dedup.tokens(
+    "any update updates news word follow following up checking check in on back hear heard same issue problem "
+    "thing reported mentioned told said earlier before yesterday last worse getting got not never been fixed fix "
+    "no one nobody anyone someone somebody came come coming showed show has will is when yet today tomorrow "
+    "hour hours day days week weeks ago what happening going status ok okay"
+)
+
+# "Tenant: ...", "[10/12 3:45 PM] Me: ...", "Oct 12, 9:02 AM - Sarah: ..."
+_SPEAKER = re.compile(
+    r"^\s*(?:\[[^\]]{1,40}\]\s*|[\w/.,: ]{1,24}?\d{1,2}:\d{2}\s*(?:[AaPp]\.?[Mm]\.?)?\s*[-–]\s*)?"
+    r"(?P<speaker>[A-Za-z][\w .'()-]{0,30}?)\s*:\s+(?P<text>\S.*)$"
+)
+_MANAGER_SPEAKERS = frozenset({
+    "me", "manager", "pm", "property manager", "landlord", "office", "leasing office", "front desk",
+    "maintenance", "management", "super", "superintendent", "minimason",
+})
+
+
+@dataclass
+class Turn:
+    role: str  # "tenant" or "manager"
+    text: str
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def parse_transcript(text):
+    """
+    Split a pasted conversation into turns. Returns (message, earlier): the
+    newest tenant message and the turns before it. Text that isn't a
+    transcript (fewer than two labelled turns from two speakers) comes back
+    whole with no earlier turns.
+    """
+    turns = []
+    for line in (text or "").splitlines():
+        match = _SPEAKER.match(line)
+        if match:
+            speaker = match.group("speaker").strip().lower()
+            role = "manager" if speaker in _MANAGER_SPEAKERS else "tenant"
+            turns.append([role, speaker, match.group("text").strip()])
+        elif turns and line.strip():
+            turns[-1][2] += "\n" + line.strip()
+        elif line.strip():
+            # Text before the first label: not a transcript we can trust
+            return text, []
+    if len(turns) < 2 or len({speaker for _, speaker, _ in turns}) < 2:
+        return text, []
+    tenant = [i for i, (role, _, _) in enumerate(turns) if role == "tenant"]
+    if not tenant:
+        return text, []
+
+    # The newest run of tenant turns is the message; anything after it (our own reply) is dropped
+    end = tenant[-1]
+    start = end
+    while start > 0 and turns[start - 1][0] == "tenant":
+        start -= 1
+    message = "\n".join(t for _, _, t in turns[start:end + 1])
+    return message, [Turn(role, t) for role, _, t in turns[:start]]
+
+
+@dataclass
+class Thread:
+    """One tenant scope's conversation about one work order."""
+    scope: object
+    wo_id: str = None
+    severity: str = None
+    categories: set = field(default_factory=set)
+    description: str = ""
+    opened: float = 0.0
+    updated: float = 0.0
+    turns: deque = field(default_factory=deque)
+    summary: deque = field(default_factory=deque)
+    folded: int = 0  # older turns dropped from the summary too
+
+    def add(self, role, text):
+        """Append a turn, folding the oldest verbatim turn into the summary when there are too many."""
+        if not text:
+            return
+        self.turns.append(Turn(role, text))
+        while len(self.turns) > RECENT_TURNS:
+            old = self.turns.popleft()
+            self.summary.append(f"{old.role}: {_clip(validator.first_sentence(old.text), LINE_CHARS)}")
+            if len(self.summary) > SUMMARY_LINES:
+                self.summary.popleft()
+                self.folded += 1
+
+    def context(self):
+        """The thread as a bounded prompt block: work-order state, rolling summary, recent turns."""
+        lines = []
+        if self.wo_id:
+            lines.append(
+                f"OPEN WORK ORDER: {self.wo_id} · {self.severity or 'UNKNOWN'} · "
+                f"{'/'.join(sorted(self.categories)) or 'GENERAL'} — {_clip(self.description, 200)}"
+            )
+        if self.summary:
+            omitted = f", {self.folded} older messages omitted" if self.folded else ""
+            lines.append(f"EARLIER (summarized{omitted}):")
+            lines.extend(f"- {line}" for line in self.summary)
+        if self.turns:
+            lines.append("RECENT MESSAGES:")
+            lines.extend(f"{t.role.capitalize()}: {_clip(t.text, TURN_CHARS)}" for t in self.turns)
+        if self.wo_id:
+            lines.append(
+                f"The message below is a follow-up on {self.wo_id}. Keep that work order id, change its "
+                "severity only if the new message warrants it, and reply to what the tenant is asking now."
+            )
+        elif lines:
+            lines.append("The message below is the tenant's newest message in this conversation.")
+        return "CONVERSATION SO FAR:\n" + "\n".join(lines) if lines else None
+
+    def words(self):
+        """Content words of the work order and the tenant's turns still held (replies are mostly boilerplate)."""
+        tenant = [line for line in self.summary if line.startswith("tenant: ")]
+        tenant += [t.text for t in self.turns if t.role == "tenant"]
+        return dedup.tokens(" ".join([self.description, *tenant]))
+
+    def info(self):
+        return {
+            "id": self.wo_id,
+            "turns": self.folded + len(self.summary) + len(self.turns),
+            "summarized": self.folded + len(self.summary),
+        }
+
+
+def follow_up(tenant_message, thread):
+    """
+    How strongly the message continues the thread: the number of content
+    words they share, or None if it doesn't continue it. Follow-up wording
+    ("still", "any update?") counts only for a pure check-in or together with
+    a shared word or the thread's category, so "smoke detector still beeping"
+    doesn't land on a plumbing order. Without such wording the message has to
+    share enough content words. A message the rules put in another category
+    never continues the thread.
+    """
+    category = triage.classify(tenant_message).category
+    if category and thread.categories and category not in thread.categories:
+        return None
+    words = dedup.tokens(tenant_message)
+    shared = len(words & thread.words())
+    if _FOLLOW_UP.search(tenant_message):
+        check_in = not (words - _CHECK_IN_WORDS)
+        if check_in or shared or category in thread.categories:
+            return shared
+        return None
+    if shared >= MIN_SHARED_WORDS and shared >= MIN_OVERLAP * len(words):
+        return shared
+    return None
+
+
+@dataclass
+class Prepared:
+    """A message ready to process: the text to send, its context, and the thread it continues (if any)."""
+    message: str
+    context: str = None
+    thread: Thread = None
+    earlier: list = field(default_factory=list)
+    scope: object = None
+
+
+class ThreadIndex:
+    """Open threads per tenant scope, newest first."""
+
+    def __init__(self, window=WINDOW, clock=time.time):
+        self.window = window
+        self.clock = clock
+        self._threads = OrderedDict()  # id(thread) -> Thread, least recently updated first
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = self.clock() - self.window
+        while self._threads:
+            key, thread = next(iter(self._threads.items()))
+            if thread.updated >= cutoff:
+                break
+            del self._threads[key]
+
+    def find(self, scope, tenant_message):
+        """
+        The thread in scope that this message follows up on, or None. With
+        several open, the one sharing the most words wins, then the most recent.
+        """
+        if scope is None:
+            return None
+        best, best_shared = None, -1
+        with self._lock:
+            self._expire()
+            for thread in reversed(self._threads.values()):
+                if thread.scope != scope:
+                    continue
+                shared = follow_up(tenant_message, thread)
+                if shared is not None and shared > best_shared:
+                    best, best_shared = thread, shared
+        return best
+
+    def prepare(self, tenant_message, scope=None):
+        """Split off any pasted history and find the thread the newest message continues."""
+        message, earlier = parse_transcript(tenant_message)
+        thread = self.find(scope, message)
+        if thread is not None:
+            with self._lock:
+                context = thread.context()
+        elif earlier:
+            draft = Thread(scope)
+            for turn in earlier:
+                draft.add(turn.role, turn.text)
+            context = draft.context()
+        else:
+            context = None
+        return Prepared(message, context, thread, earlier, scope)
+
+    def record(self, prepared, result):
+        """
+        Add the exchange to its thread, or open a thread for a new work order
+        in a scope. Errors and partial results are not recorded.
+        """
+        if "error" in result or result.get("_partial"):
+            return
+        work_order = result.get("work_order") or {}
+        now = self.clock()
+        with self._lock:
+            thread = prepared.thread
+            if thread is None:
+                if prepared.scope is None:
+                    return
+                thread = Thread(prepared.scope, wo_id=work_order.get("id"), opened=now,
+                                description=work_order.get("description") or "")
+                category = triage.classify(prepared.message).category
+                thread.categories.update(c for c in (category, work_order.get("category")) if c)
+                for turn in prepared.earlier:
+                    thread.add(turn.role, turn.text)
+            thread.severity = work_order.get("severity") or thread.severity
+            thread.add("tenant", prepared.message)
+            thread.add("manager", result.get("tenant_reply"))
+            thread.updated = now
+            self._threads.pop(id(thread), None)
+            self._threads[id(thread)] = thread
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._threads)
+
+
+def enabled():
+    return os.environ.get("MINIMASON_THREADS", "1").lower() not in ("0", "false", "no", "off")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide ThreadIndex, shared by every session, or None when threading is off."""
+    global _index
+    if not enabled():
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = ThreadIndex()
+        return _index
@@ -0,0 +1,230 @@
+"""
+MiniMason — Rule-Based Severity Pre-Classifier
+
+Encodes the hardcoded severity table from SYSTEM_PROMPT as compiled regex
+matchers, so a provisional severity and category are known in well under a
+millisecond — before the LLM call returns. EMERGENCY matches fire any
+registered alert hooks immediately, and the model's answer is later checked
+against the rules so disagreements are flagged for a human.
+"""
+
+import re
+import time
+from dataclasses import dataclass, field
+
+SEVERITY_RANK = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "EMERGENCY": 3}
+SEVERITIES = sorted(SEVERITY_RANK, key=SEVERITY_RANK.get)
+# Characters of a message the rules look at; tenant texts are far shorter, and the
+# cap keeps a pasted document from holding up the request thread
+MAX_CHARS = 4000
+
+def _near(a, b, words=6):
+    """Regex matching term group a within a few words of term group b, in either order."""
+    gap = rf"\W+(?:\w+\W+){{0,{words}}}?"
+    return rf"(?:\b(?:{a})\w*{gap}(?:{b})|\b(?:{b})\w*{gap}(?:{a}))"
+
+
+_WATER = r"water|flood|leak|wet|drip|pool|puddle|overflow"
+_ELECTRICAL = r"outlet|socket|electric|breaker|panel|wiring|wires|plug|switch"
+_HEAT_OUT = (
+    r"(?:no|without)\s+heat|heat(?:er|ing)?\s+(?:is\s+)?(?:not|isn'?t|stopped|won'?t|broke|out)"
+    r"|furnace\s+(?:is\s+)?(?:not|isn'?t|stopped|won'?t|broke|out)|heater\s+stopped"
+)
+_AC_OUT = r"\bac\b|a/c|air\s*condition"
+_APPLIANCE = r"dishwasher|disposal|washer|dryer|washing\s+machine|fridge|refrigerator|freezer|oven|stove|microwave"
+_FAULT = r"broke|not|isn'?t|won'?t|doesn'?t|stopped|jam|leak|humm|nois|dead|fail|stuck"
+# Bounded stand-in for ".*" between two terms of one rule: unbounded gaps backtrack
+# quadratically on long repetitive messages
+_GAP = r".{0,120}?"
+_DEGREES = re.compile(
+    r"(-?\d{1,3})\s*(?:°\s*(?P<unit>[cf])?|degrees?(?:\s+(?P<word>[cf]|celsius|fahrenheit))?|deg\b|f\b)",
+    re.IGNORECASE,
+)
+# The severity table's freezing rule is about the weather, not the thermostat
+_OUTDOORS = re.compile(
+    r"\b(?:outside|outdoors?|out\s+there|weather|forecast|tonight|overnight|wind\s*chill|snow\w*|icy)\b", re.IGNORECASE
+)
+_PIPES_FREEZING = re.compile(
+    r"\bpipes?\s+(?:\w+\s+){0,3}?(?:froze|frozen|freez)|\bbelow\s+(?:freezing|zero)\b|\bfreezing\s+(?:outside|out)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    severity: str
+    category: str
+    pattern: re.Pattern
+    safety: bool = False
+
+
+def _rule(name, severity, category, pattern, safety=False):
+    return Rule(name, severity, category, re.compile(pattern, re.IGNORECASE), safety)
+
+
+RULES = [
+    # EMERGENCY (respond < 1 hour)
+    _rule("gas_smell", "EMERGENCY", "SAFETY",
+          r"\bsmells?\s+(?:of|like)\s+gas\b|\bgas\s+(?:leak|smell|odou?r)|\brotten\s+eggs?\b|\bsmell\s+gas\b", True),
+    _rule("electrical_sparks", "EMERGENCY", "ELECTRICAL",
+          r"\bspark(?:s|ing|ed)?\b|\bscorch|\bblack\s+marks?\s+around\b|\bburning\s+(?:smell|plastic|odou?r)"
+          r"|\bsmells?\s+(?:like\s+)?burning|\bmelted\s+(?:outlet|plug|wire)", True),
+    _rule("water_near_electrical", "EMERGENCY", "ELECTRICAL", _near(_WATER, _ELECTRICAL), True),
+    _rule("structural_collapse", "EMERGENCY", "STRUCTURAL",
+          r"\bceiling\s+(?:is\s+)?(?:sagging|bowing|caving|collaps)|\bsagging\s+ceiling\b"
+          r"|\bwall\s+(?:is\s+)?crack|\bcollaps", True),
+    # HIGH (respond < 4 hours)
+    _rule("no_heat", "HIGH", "HVAC", _HEAT_OUT, True),
+    _rule("no_ac_hot", "HIGH", "HVAC", rf"(?:{_AC_OUT}){_GAP}\b(?:8[6-9]|9\d|1[0-2]\d)\s*(?:°|degrees?)"),
+    _rule("active_leak", "HIGH", "PLUMBING",
+          r"\boverflow|\bwater\s+(?:all\s+)?(?:over|on|onto|across)\s+(?:the\s+)?(?:\w+\s+)?(?:floor|hallway)"
+          r"|\bleak\w*\s+(?:on|onto)\s+(?:the\s+)?floor|\bflood(?:ed|ing)?\b"),
+    _rule("sewage_backup", "HIGH", "PLUMBING", r"\bsewage\b|\bsewer\s+back"),
+    _rule("water_heater", "HIGH", "PLUMBING",
+          r"\bno\s+hot\s+water\b|\bwater\s+heater\s+(?:is\s+)?(?:not|isn'?t|broke|out|stopped|leak)"),
+    _rule("security", "HIGH", "SAFETY",
+          r"\b(?:lock|latch|deadbolt)\w*\s+(?:\w+\s+){0,5}?(?:broken|won'?t|doesn'?t|isn'?t)"
+          rf"|\bbroken\s+(?:\w+\s+)?(?:lock|latch|deadbolt|window)|\bground\s+floor\b{_GAP}\b(?:lock|window)", True),
+    _rule("only_bathroom_toilet", "HIGH", "PLUMBING",
+          rf"\b(?:only|single|one)\s+bathroom\b{_GAP}\btoilet|\btoilet\b{_GAP}\b(?:only|single|one)\s+bathroom\b"),
+    _rule("mold_large", "HIGH", "GENERAL",
+          rf"\bmou?ld\b{_GAP}\b(?:[2-9]|\d{{2,}})\s*(?:feet|foot|ft|sq)|\bmou?ld\b{_GAP}\bspreading\b"),
+    # MEDIUM (respond 24-48 hours)
+    _rule("appliance", "MEDIUM", "APPLIANCE", _near(_APPLIANCE, _FAULT, words=3)),
+    _rule("minor_plumbing", "MEDIUM", "PLUMBING",
+          r"\bslow\s+drain|\brunning\s+toilet|\btoilet\s+(?:keeps\s+)?running|\bdripp?(?:ing|s)?\s+(?:\w+\s+)?faucet"
+          r"|\bfaucet\s+(?:still\s+)?drips?|\bclog"),
+    _rule("hvac_nonurgent", "MEDIUM", "HVAC",
+          rf"(?:{_AC_OUT}){_GAP}\b(?:not\s+cooling|isn'?t\s+cooling|warm\s+air|noise)|\b(?:heater|furnace|vent)\b{_GAP}\bnoise"),
+    _rule("pest", "MEDIUM", "PEST",
+          r"\b(?:mouse|mice|rats?|rodents?|roach(?:es)?|cockroach(?:es)?|bed\s*bugs?|ants|termites?|wasps?)\b"),
+    _rule("mold", "MEDIUM", "GENERAL", r"\bmou?ld\b"),
+    _rule("water_stain", "MEDIUM", "PLUMBING", r"\bwater\s+(?:stain|damage|spot)|\bstain\w*\s+on\s+(?:\w+\s+){0,3}?ceiling"),
+    # LOW (respond 3-7 days)
+    _rule("cosmetic", "LOW", "GENERAL", r"\bpaint|\bscuff|\bdrywall|\bnail\s+holes?"),
+    _rule("squeaky_or_loose", "LOW", "GENERAL",
+          r"\bsqueak|\bloose\s+(?:\w+\s+)?(?:handle|hinge|knob|hardware|rail)|\bdoor\w*\s+(?:\w+\s+){0,3}?(?:doesn'?t|won'?t)\s+close"),
+    _rule("weather_stripping", "LOW", "GENERAL", r"\bweather\s*strip"),
+]
+
+# "It's been like this for weeks" + safety issue = escalate severity
+_DELAYED = re.compile(
+    r"\b(?:for|past|few|couple\s+of|several)\s+(?:\w+\s+)?(?:weeks|months)\b|\bmonths\s+ago\b|\bsince\s+(?:we|i)\s+moved\s+in\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Triage:
+    """Provisional classification. severity/category are None when no rule matched."""
+    severity: str = None
+    category: str = None
+    rules: list = field(default_factory=list)
+    escalated: bool = False
+    elapsed_ms: float = 0.0
+
+    def to_dict(self):
+        return {
+            "severity": self.severity,
+            "category": self.category,
+            "rules": list(self.rules),
+            "escalated": self.escalated,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+        }
+
+
+def _fahrenheit(match):
+    value = int(match.group(1))
+    unit = (match.group("unit") or match.group("word") or "f").lower()
+    return value * 9 / 5 + 32 if unit.startswith("c") else value
+
+
+def _below_freezing(message):
+    """Freezing weather or pipes: an outdoor reading under 32°F (0°C), or saying so outright."""
+    if _PIPES_FREEZING.search(message):
+        return True
+    return bool(_OUTDOORS.search(message)) and any(_fahrenheit(m) < 32 for m in _DEGREES.finditer(message))
+
+
+def classify(tenant_message):
+    """Return the provisional Triage for a tenant message using the hardcoded severity rules."""
+    started = time.perf_counter()
+    message = (tenant_message or "")[:MAX_CHARS]
+    best = None
+    matched = []
+
+    for rule in RULES:
+        if not rule.pattern.search(message):
+            continue
+        severity = rule.severity
+        if rule.name == "no_heat" and _below_freezing(message):
+            severity = "EMERGENCY"
+        matched.append(rule.name)
+        if best is None or SEVERITY_RANK[severity] > SEVERITY_RANK[best[0]]:
+            best = (severity, rule)
+
+    triage = Triage(rules=matched)
+    if best is not None:
+        severity, rule = best
+        if rule.safety and severity != "EMERGENCY" and _DELAYED.search(message):
+            severity = SEVERITIES[SEVERITY_RANK[severity] + 1]
+            triage.escalated = True
+        triage.severity = severity
+        triage.category = rule.category
+
+    triage.elapsed_ms = (time.perf_counter() - started) * 1000
+    return triage
+
+
+# ---------------------------------------------------------------------------
+# FAST-PATH ALERTS
+# ---------------------------------------------------------------------------
+
+_emergency_hooks = []
+
+
+def on_emergency(hook):
+    """
+    Register hook(tenant_message, triage) to run as soon as a message is
+    provisionally classified EMERGENCY, before the LLM responds. Usable as a decorator.
+    """
+    _emergency_hooks.append(hook)
+    return hook
+
+
+def fire_alerts(tenant_message, triage):
+    """Run the emergency hooks for an EMERGENCY triage. Hook failures never block processing."""
+    if triage.severity != "EMERGENCY":
+        return
+    for hook in list(_emergency_hooks):
+        try:
+            hook(tenant_message, triage)
+        except Exception:
+            continue
+
+
+# ---------------------------------------------------------------------------
+# MODEL CROSS-CHECK
+# ---------------------------------------------------------------------------
+
+def cross_check(result, triage):
+    """
+    Attach the provisional triage to a model result as "_triage" and add a
+    warning when the model's severity disagrees with the rules.
+    """
+    if "error" in result:
+        return result
+
+    info = triage.to_dict()
+    model_severity = str(result.get("work_order", {}).get("severity", "")).upper()
+    info["agrees"] = triage.severity is None or model_severity == triage.severity
+    result["_triage"] = info
+
+    if not info["agrees"]:
+        direction = "below" if SEVERITY_RANK.get(model_severity, -1) < SEVERITY_RANK[triage.severity] else "above"
+        result.setdefault("_warnings", []).append(
+            f"⚠️ Severity check: model said {model_severity or 'nothing'}, {direction} the rules' "
+            f"{triage.severity} ({triage.category}). Please double-check."
+        )
+    return result
@@ -0,0 +1,178 @@
+"""
+MiniMason — Token Usage, Cost and Output Budget
+
+Every model call (full requests and field regenerations) is recorded with its
+model, prompt/cached/output token counts (output includes thinking tokens),
+latency and estimated cost. Calls go to the Prometheus counters and, when the
+work-order store is on, to its model_calls table, which
+store.WorkOrderStore.usage() rolls up per day and per model.
+
+The output budget replaces the fixed max_output_tokens ceiling with one sized
+from the responses actually seen: the 99th percentile of recent output
+lengths plus headroom, never below a floor or above the ceiling. A response
+cut off at the cap counts as needing the full ceiling, so truncations push the
+budget back up quickly. A tighter cap bounds worst-case generation time and
+cost when a model rambles.
+
+Environment:
+    MINIMASON_ADAPTIVE_BUDGET   set to 0 to always use the ceiling (default on)
+    MINIMASON_MAX_OUTPUT_TOKENS ceiling for max_output_tokens (default 2048)
+
+Usage:
+    python usage.py --days 7     # per-day, per-model totals from the store
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import metrics
+import store
+
+MAX_OUTPUT_TOKENS = int(os.environ.get("MINIMASON_MAX_OUTPUT_TOKENS", "2048"))
+MIN_OUTPUT_TOKENS = 512
+# Recent responses the budget is sized from, and how many it needs before it moves off the ceiling
+BUDGET_WINDOW = 500
+BUDGET_MIN_SAMPLES = 50
+BUDGET_PERCENTILE = 99
+BUDGET_HEADROOM = 1.25
+BUDGET_STEP = 128
+
+# List prices in USD per million tokens: (prompt, cached prompt, output)
+PRICES = {
+    "gemini-2.5-flash": (0.30, 0.075, 2.50),
+    "gemini-2.0-flash": (0.10, 0.025, 0.40),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+}
+
+COST = metrics.REGISTRY.counter(
+    "minimason_cost_usd_total", "Estimated model spend in USD, by model and call kind.", ["model", "kind"])
+
+
+def counts(usage_metadata):
+    """
+    Token counts from an SDK usage_metadata object (zeros for anything
+    missing). output_tokens includes thinking tokens: on thinking models they
+    are billed as output and count against max_output_tokens, but only the
+    total reports them.
+    """
+    prompt = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    candidates = getattr(usage_metadata, "candidates_token_count", 0) or 0
+    thoughts = getattr(usage_metadata, "thoughts_token_count", 0) or 0
+    total = getattr(usage_metadata, "total_token_count", 0) or 0
+    return {
+        "prompt_tokens": prompt,
+        "cached_tokens": getattr(usage_metadata, "cached_content_token_count", 0) or 0,
+        "output_tokens": max(candidates + thoughts, total - prompt),
+        "total_tokens": total,
+    }
+
+
+def cost(model_name, tokens):
+    """Estimated USD cost of one call; 0.0 for models without a price."""
+    prompt, cached, output = PRICES.get(model_name, (0.0, 0.0, 0.0))
+    fresh = max(0, tokens["prompt_tokens"] - tokens["cached_tokens"])
+    return (fresh * prompt + tokens["cached_tokens"] * cached + tokens["output_tokens"] * output) / 1e6
+
+
+def record(model_name, tokens, latency=None, kind="request", max_output_tokens=None):
+    """
+    Count one model call in the token and cost metrics and queue it for the
+    store. Returns the per-call usage dict (token counts, latency_ms, cost_usd).
+    """
+    call = dict(tokens, latency_ms=round((latency or 0.0) * 1000, 2), cost_usd=round(cost(model_name, tokens), 8))
+    for part in ("prompt", "cached", "output"):
+        metrics.TOKENS.inc(tokens[f"{part}_tokens"], model=model_name, kind=part)
+    COST.inc(call["cost_usd"], model=model_name, kind=kind)
+    work_orders = store.get_store()
+    if work_orders is not None:
+        work_orders.add_call(model_name, kind, call, max_output_tokens)
+    return call
+
+
+# ---------------------------------------------------------------------------
+# ADAPTIVE OUTPUT BUDGET
+# ---------------------------------------------------------------------------
+
+class OutputBudget:
+    """max_output_tokens sized from the distribution of recent response lengths."""
+
+    def __init__(self, ceiling=MAX_OUTPUT_TOKENS, floor=MIN_OUTPUT_TOKENS, window=BUDGET_WINDOW,
+                 min_samples=BUDGET_MIN_SAMPLES, percentile=BUDGET_PERCENTILE, headroom=BUDGET_HEADROOM):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.headroom = headroom
+        self._samples = deque(maxlen=window)
+        self._cap = ceiling
+        self._lock = threading.Lock()
+
+    def observe(self, output_tokens, truncated=False):
+        """Record a full response's output length; a truncated one counts as needing the ceiling."""
+        with self._lock:
+            self._samples.append(self.ceiling if truncated else output_tokens)
+            if len(self._samples) < self.min_samples:
+                return
+            ordered = sorted(self._samples)
+            needed = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * self.percentile / 100) - 1)]
+            cap = math.ceil(needed * self.headroom / BUDGET_STEP) * BUDGET_STEP
+            self._cap = max(self.floor, min(self.ceiling, cap))
+
+    def cap(self):
+        with self._lock:
+            return self._cap
+
+    def stats(self):
+        with self._lock:
+            return {"cap": self._cap, "ceiling": self.ceiling, "samples": len(self._samples)}
+
+
+def adaptive():
+    return os.environ.get("MINIMASON_ADAPTIVE_BUDGET", "1").lower() not in ("0", "false", "no", "off")
+
+
+_budget = OutputBudget()
+
+
+def get_budget():
+    """Process-wide OutputBudget shared by every session and call path."""
+    return _budget
+
+
+def output_cap():
+    """max_output_tokens for the next full request."""
+    return _budget.cap() if adaptive() else MAX_OUTPUT_TOKENS
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show MiniMason token usage and cost per day and model.")
+    parser.add_argument("--days", type=int, default=7, help="How many days back to report (default 7).")
+    args = parser.parse_args(argv)
+
+    work_orders = store.get_store()
+    if work_orders is None:
+        print("The store is off (MINIMASON_DB_PATH is empty); no usage is recorded.", file=sys.stderr)
+        return 1
+    rows = work_orders.usage(since=time.time() - args.days * 86400)
+    if not rows:
+        print("No model calls recorded.")
+        return 0
+    print(f"{'day':<11} {'model':<18} {'calls':>6} {'prompt':>10} {'cached':>9} {'output':>9} {'avg ms':>8} {'cost $':>9}")
+    for row in rows:
+        print(f"{row['day']:<11} {row['model']:<18} {row['calls']:>6} {row['prompt_tokens']:>10,} "
+              f"{row['cached_tokens']:>9,} {row['output_tokens']:>9,} {row['avg_latency_ms']:>8,.0f} "
+              f"{row['cost_usd']:>9.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""
+MiniMason — Output Validator
+
+Checks a model result against the contract in SYSTEM_PROMPT: required fields
+and their types, the category and severity enums, the WO-XXXX id format, the
+red-flag types, the 5-item cap on suggested_actions, banned phrases in
+tenant_reply and bundled issues in the description.
+
+Every phrase rule (banned and bundle) is one compiled alternation, so each
+field is scanned once no matter how many phrases there are, and sentence
+boundaries come from a small segmenter that knows about abbreviations, times
+and decimals instead of splitting on every period. Nothing here touches the
+network or allocates much, so whole histories can be re-checked in bulk:
+
+    python validator.py results.jsonl          # batch.py output or bare results
+    python validator.py --db minimason.db      # the work-order store
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter, namedtuple
+
+import triage
+
+CATEGORIES = ("PLUMBING", "ELECTRICAL", "APPLIANCE", "HVAC", "PEST", "STRUCTURAL", "SAFETY", "GENERAL")
+SEVERITIES = tuple(triage.SEVERITIES)
+RED_FLAG_TYPES = (
+    "FRUSTRATION_ESCALATION", "SCOPE_CREEP", "VENDOR_UPSELL",
+    "SELF_DIAGNOSIS", "RENT_WITHHOLDING", "DELAYED_REPORTING",
+)
+MAX_REPLY_WORDS = 120
+MAX_REPLY_SENTENCES = 4
+MAX_ACTIONS = 5
+
+# Field name -> expected type; work_order sub-keys are all strings
+FIELD_TYPES = {
+    "work_order": dict,
+    "tenant_reply": str,
+    "suggested_actions": list,
+    "log_entry": str,
+    "red_flags": list,
+}
+WORK_ORDER_FIELDS = ("id", "category", "severity", "description", "severity_reasoning", "tenant_details")
+
+_WO_ID = re.compile(r"WO-\d{4}")
+
+# ---------------------------------------------------------------------------
+# PHRASE RULES — one combined pattern, one scan per field
+# ---------------------------------------------------------------------------
+
+# label -> pattern; labels are what warnings quote back
+BANNED_PHRASES = {
+    "Your comfort and safety are our priority":
+        r"your\s+(?:comfort|safety)(?:\s+and\s+(?:comfort|safety))?\s+(?:is|are)\s+our\s+(?:top\s+|#1\s+)?priority",
+    "We understand your frustration": r"we\s+understand\s+your\s+frustration",
+    "I understand your concern": r"i\s+(?:completely\s+|totally\s+)?understand\s+your\s+concerns?",
+    "Per our records": r"per\s+our\s+records",
+    "As per policy": r"as\s+per\s+(?:our\s+)?polic(?:y|ies)",
+    "We sincerely apologize for the inconvenience":
+        r"we\s+(?:sincerely\s+)?apologi[sz]e\s+for\s+(?:the|any)\s+inconvenience",
+    "Rest assured": r"rest\s+assured",
+}
+BUNDLE_PHRASES = {
+    "also fix": r"also\s+fix",
+    "in addition": r"in\s+addition",
+    "secondary issue": r"secondary\s+issues?",
+    "additionally": r"additionally",
+}
+
+_GROUPS = {}
+_alternatives = []
+for _kind, _phrases in (("banned", BANNED_PHRASES), ("bundle", BUNDLE_PHRASES)):
+    for _i, (_label, _pattern) in enumerate(_phrases.items()):
+        _name = f"{_kind}{_i}"
+        _GROUPS[_name] = (_kind, _label)
+        _alternatives.append(rf"(?P<{_name}>\b{_pattern}\b)")
+_PHRASES = re.compile("|".join(_alternatives), re.IGNORECASE)
+
+
+def scan(text):
+    """Every phrase-rule hit in text as (kind, label, start, end), in order, from a single pass."""
+    return [(*_GROUPS[m.lastgroup], m.start(), m.end()) for m in _PHRASES.finditer(text or "")]
+
+
+# ---------------------------------------------------------------------------
+# SENTENCES
+# ---------------------------------------------------------------------------
+
+# Candidate boundary: terminal punctuation, optional closing quotes/brackets, whitespace
+_BOUNDARY = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+# Words whose trailing period never ends a sentence ("Dr. Patel", "St. James", "Apt. 4B")
+_NON_TERMINAL = frozenset("mr mrs ms dr st mt ave blvd rd apt bldg dept sq ft approx vs e.g i.e".split())
+
+
+def split_sentences(text):
+    """
+    Split text into sentences, keeping their own punctuation. A period after a
+    title, an initial, or before a lowercase word does not end a sentence, and
+    decimals ("2.5 hours") never do since a boundary needs trailing whitespace.
+    """
+    text = (text or "").strip()
+    sentences, start = [], 0
+    for m in _BOUNDARY.finditer(text):
+        following = text[m.end():m.end() + 1]
+        if following.islower():
+            continue
+        if text[m.start()] == ".":
+            head = text[start:m.start()].split()
+            word = head[-1].lstrip("(\"'“‘").lower() if head else ""
+            if word in _NON_TERMINAL or (len(word) == 1 and word.isalpha()):
+                continue
+        sentences.append(text[start:m.end()].strip())
+        start = m.end()
+    if start < len(text):
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def first_sentence(text):
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    sentence = sentences[0]
+    return sentence if sentence[-1] in ".!?…\"'”’)]" else sentence + "."
+
+
+# ---------------------------------------------------------------------------
+# CHECKS
+# ---------------------------------------------------------------------------
+
+# kind: missing | type | enum | format | red_flag | too_many | banned_phrase | bundle | reply_length
+Finding = namedtuple("Finding", "kind field message")
+
+
+def _text(value):
+    return value if isinstance(value, str) else ""
+
+
+def check(result):
+    """
+    Every contract violation in a result, as Findings. Read-only, so it is safe
+    to run over cached or stored results; enforce() is the mutating variant.
+    """
+    findings = []
+    if not isinstance(result, dict) or "error" in result:
+        return findings
+
+    for field, expected in FIELD_TYPES.items():
+        if field not in result:
+            findings.append(Finding("missing", field, f"Missing {field}."))
+        elif not isinstance(result[field], expected):
+            findings.append(Finding("type", field, f"{field} should be a {expected.__name__}, "
+                                                   f"got {type(result[field]).__name__}."))
+
+    work_order = result.get("work_order")
+    if isinstance(work_order, dict):
+        for key in WORK_ORDER_FIELDS:
+            field = f"work_order.{key}"
+            if key not in work_order:
+                findings.append(Finding("missing", field, f"Missing {field}."))
+            elif not isinstance(work_order[key], str):
+                findings.append(Finding("type", field, f"{field} should be a string."))
+        category = _text(work_order.get("category")).strip().upper()
+        if "category" in work_order and category not in CATEGORIES:
+            findings.append(Finding("enum", "work_order.category",
+                                    f"Unknown category {work_order['category']!r}; expected one of {', '.join(CATEGORIES)}."))
+        severity = _text(work_order.get("severity")).strip().upper()
+        if "severity" in work_order and severity not in SEVERITIES:
+            findings.append(Finding("enum", "work_order.severity",
+                                    f"Unknown severity {work_order['severity']!r}; expected one of {', '.join(SEVERITIES)}."))
+        if "id" in work_order and not _WO_ID.fullmatch(_text(work_order["id"]).strip()):
+            findings.append(Finding("format", "work_order.id", f"Work order id {work_order['id']!r} is not WO-XXXX."))
+        if any(kind == "bundle" for kind, *_ in scan(_text(work_order.get("description")))):
+            findings.append(Finding("bundle", "work_order.description",
+                                    "⚠️ Unit of Work violation detected — description may bundle multiple issues."))
+
+    actions = result.get("suggested_actions")
+    if isinstance(actions, list) and len(actions) > MAX_ACTIONS:
+        findings.append(Finding("too_many", "suggested_actions",
+                                f"{len(actions)} suggested actions; the limit is {MAX_ACTIONS}."))
+
+    flags = result.get("red_flags")
+    if isinstance(flags, list):
+        unknown = sorted({
+            str(flag).split(":", 1)[0].strip() for flag in flags
+            if str(flag).split(":", 1)[0].strip().upper() not in RED_FLAG_TYPES
+        })
+        if unknown:
+            findings.append(Finding("red_flag", "red_flags", f"Unknown red flag type(s): {', '.join(unknown)}."))
+
+    reply = _text(result.get("tenant_reply"))
+    banned = sorted({label for kind, label, *_ in scan(reply) if kind == "banned"})
+    if banned:
+        findings.append(Finding("banned_phrase", "tenant_reply",
+                                f"Reply uses banned phrase(s): {', '.join(banned)}."))
+    if len(reply.split()) > MAX_REPLY_WORDS:
+        findings.append(Finding("reply_length", "tenant_reply",
+                                f"Reply is {len(reply.split())} words; the limit is about {MAX_REPLY_WORDS}."))
+    return findings
+
+
+def _strip_banned(reply):
+    """
+    Remove banned phrases from a reply. A leading "Rest assured, ..." loses just
+    the phrase; any other sentence containing one is dropped, unless that would
+    leave nothing. Returns (reply, labels removed).
+    """
+    kept, removed = [], []
+    for sentence in split_sentences(reply):
+        hits = [(label, start, end) for kind, label, start, end in scan(sentence) if kind == "banned"]
+        if not hits:
+            kept.append(sentence)
+            continue
+        removed.extend(label for label, _, _ in hits)
+        label, start, end = hits[0]
+        rest = sentence[end:].lstrip()
+        if len(hits) == 1 and start == 0 and rest.startswith(","):
+            rest = rest[1:].lstrip()
+            if rest:
+                kept.append(rest[0].upper() + rest[1:])
+    if not kept:
+        return reply, []
+    return " ".join(kept), sorted(set(removed))
+
+
+def enforce(result):
+    """
+    Bring a result in line with the contract where that can be done locally:
+    normalize enum case, strip banned phrases, trim an overlong reply to 4
+    sentences and keep the first sentence of severity_reasoning. Returns
+    (result, findings) with whatever could not be fixed plus notes on what was.
+    """
+    if not isinstance(result, dict) or "error" in result:
+        return result, []
+
+    work_order = result.get("work_order")
+    if isinstance(work_order, dict):
+        for key, allowed in (("category", CATEGORIES), ("severity", SEVERITIES)):
+            value = work_order.get(key)
+            if isinstance(value, str) and value.strip().upper() in allowed:
+                work_order[key] = value.strip().upper()
+        reasoning = work_order.get("severity_reasoning")
+        if isinstance(reasoning, str) and reasoning:
+            work_order["severity_reasoning"] = first_sentence(reasoning)
+
+    notes = []
+    reply = result.get("tenant_reply")
+    if isinstance(reply, str) and reply:
+        reply, removed = _strip_banned(reply)
+        if removed:
+            notes.append(Finding("banned_phrase", "tenant_reply",
+                                 f"Removed banned phrase(s) from the reply: {', '.join(removed)}."))
+        if len(reply.split()) > MAX_REPLY_WORDS:
+            reply = " ".join(split_sentences(reply)[:MAX_REPLY_SENTENCES])
+            notes.append(Finding("reply_length", "tenant_reply",
+                                 "Reply was trimmed to 4 sentences (was too long for SMS)."))
+        result["tenant_reply"] = reply
+
+    fixed = {(note.kind, note.field) for note in notes}
+    findings = [f for f in check(result) if (f.kind, f.field) not in fixed]
+    return result, notes + findings
+
+
+# ---------------------------------------------------------------------------
+# BULK RE-VALIDATION
+# ---------------------------------------------------------------------------
+
+def _results_from_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["result"] if isinstance(record.get("result"), dict) else record
+
+
+def _results_from_db(path):
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for (raw,) in connection.execute("SELECT result FROM work_orders ORDER BY id"):
+            yield json.loads(raw)
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-check stored MiniMason results against the output contract.")
+    parser.add_argument("input", nargs="?", help="JSONL of results (batch.py output or one result per line)")
+    parser.add_argument("--db", help="Read results from a work-order store instead")
+    args = parser.parse_args(argv)
+    if not args.input and not args.db:
+        parser.error("give a JSONL file or --db")
+
+    results = _results_from_db(args.db) if args.db else _results_from_jsonl(args.input)
+    counts, flagged, total = Counter(), 0, 0
+    started = time.perf_counter()
+    for result in results:
+        total += 1
+        findings = check(result)
+        if findings:
+            flagged += 1
+        counts.update(f"{f.kind}:{f.field}" for f in findings)
+    elapsed = time.perf_counter() - started
+
+    print(f"{total} results, {flagged} with findings ({elapsed * 1000:.0f} ms)")
+    for key, count in counts.most_common():
+        print(f"  {count:>6}  {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())